@@ -1,17 +1,125 @@
 import os
+import math
+import queue
+import itertools
 import threading
 import time
 import tkinter as tk
 import subprocess
+from collections import deque
 from tkinter import filedialog, messagebox, ttk, simpledialog, scrolledtext
 from PIL import Image, ImageTk
 Image.MAX_IMAGE_PIXELS = None
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
-from tqdm import tqdm
+try:
+    from tkinterdnd2 import TkinterDnD, DND_FILES
+except ImportError:  # drag and drop is optional
+    TkinterDnD = None
 
+import encoder
 from encoder import encode_folder_to_png
 from decoder import decode_png_to_folder, get_decode_info
+from cancellation import CancelToken, OperationCancelled, check_cancelled
+from pngio import PNGReader, UnsupportedPNG
+
+current_preview = None
+
+# Worker threads never touch Tk: they post events here and the UI thread
+# drains them once per frame, keeping only the latest progress per job
+ui_events = queue.Queue()
+UI_FRAME_MS = 33
+LOG_MAX_LINES = 200
+PREVIEW_SIZE = 650
+
+# Jobs run on a fixed pool; job_limit of them at a time (adjustable in the window)
+MAX_JOB_WORKERS = max(4, os.cpu_count() or 1)
+job_limit = min(2, MAX_JOB_WORKERS)
+job_pool = ThreadPoolExecutor(MAX_JOB_WORKERS, thread_name_prefix='job')
+jobs = {}
+pending_jobs = deque()
+running_jobs = []
+
+
+def ui_call(fn):
+    """Run fn on the UI thread at the next frame."""
+    ui_events.put(('call', fn))
+
+
+def ui_log(msg):
+    ui_events.put(('log', msg))
+
+
+def ui_progress(job, percent, text, highlight=None):
+    ui_events.put(('progress', (job, percent, text, highlight)))
+
+
+def drain_ui_events():
+    """
+    Apply queued worker events: progress coalesced to the latest per job, log
+    lines in one insert. Calls are run with after_idle, so a modal dialog
+    they open doesn't hold up later frames.
+    """
+    progress = {}
+    lines = []
+
+    def flush():
+        for args in progress.values():
+            show_progress(*args)
+        progress.clear()
+        if lines:
+            # Newest first, like the rest of the log
+            log_text.insert('1.0', ''.join(line + '\n' for line in reversed(lines[-LOG_MAX_LINES:])))
+            lines.clear()
+            if int(log_text.index('end-1c').split('.')[0]) > LOG_MAX_LINES:
+                log_text.delete(f'{LOG_MAX_LINES + 1}.0', 'end')
+
+    try:
+        while True:
+            try:
+                kind, value = ui_events.get_nowait()
+            except queue.Empty:
+                break
+            if kind == 'progress':
+                progress[value[0]] = value
+            elif kind == 'log':
+                lines.append(value)
+            else:
+                root.after_idle(value)
+        flush()
+    finally:
+        root.after(UI_FRAME_MS, drain_ui_events)
+
+
+def build_preview(img_path, max_side=PREVIEW_SIZE, cancel_token=None):
+    """
+    Small RGBA preview of img_path, built off the UI thread. Images written by
+    the encoder are streamed and sampled every step-th row and column, so the
+    full-size image is never held; other PNGs fall back to PIL's reduce().
+    Returns (preview, full_width, full_height).
+    """
+    try:
+        reader = PNGReader(img_path)
+        width, height = reader.width, reader.height
+        step = max(1, math.ceil(max(width, height) / max_side))
+        stride = reader.stride
+        channels = [bytearray() for _ in range(4)]
+        y = 0
+        for block in reader.iter_bytes():
+            check_cancelled(cancel_token)
+            rows = len(block) // stride
+            for r in range(-y % step, rows, step):
+                for c in range(4):
+                    channels[c] += block[r * stride + c:(r + 1) * stride:step * 4]
+            y += rows
+        size = (math.ceil(width / step), math.ceil(height / step))
+        return Image.merge('RGBA', [Image.frombytes('L', size, bytes(ch)) for ch in channels]), width, height
+    except UnsupportedPNG:
+        pass
+    with Image.open(img_path) as img:
+        width, height = img.size
+        step = max(1, math.ceil(max(width, height) / max_side))
+        return img.convert('RGBA').reduce(step), width, height
 
 
 def check_and_run_autorun_gui(output_folder):
@@ -70,18 +178,19 @@ def check_and_run_autorun_gui(output_folder):
                             else:
                                 bash_cmd = f'chmod +x "{script_path}" && "{script_path}"'
                             os.system(f'xterm -e sh -c "cd \"{output_folder}\" && {bash_cmd}"')
-                        log_text.insert('1.0', "Terminal window opened with the script.\n")
+                        ui_log("Terminal window opened with the script.")
                     except Exception as e:
-                        log_text.insert('1.0', f"Failed to open terminal: {e}\n")
+                        ui_log(f"Failed to open terminal: {e}")
 
                 threading.Thread(target=run_script_thread, daemon=True).start()
             else:
                 log_text.insert('1.0', "Script execution skipped.\n")
         except Exception as e:
-            root.after(0, lambda e=e: messagebox.showerror("Error", f"Error handling autorun script: {e}"))
+            messagebox.showerror("Error", f"Error handling autorun script: {e}")
 
 WINDOW_TITLE = "File Compressor"
-WINDOW_SIZE = "500x650"
+WINDOW_HEIGHT = 820
+WINDOW_SIZE = f"500x{WINDOW_HEIGHT}"
 COMPRESS_WINDOW_SIZE = "450x500"
 EXTRACT_WINDOW_SIZE = "400x250"
 
@@ -105,20 +214,54 @@ COMPRESSION_METHODS = [
     ("ZLIB (Fast compression)", "zlib"),
     ("ZIP-LZMA (Compatible)", "zip_lzma"),
     ("ZIP-BZIP2 (Compatible)", "zip_bz2"),
+    ("AUTO (Pick for this folder)", "auto"),
 ]
 
 
-def encode_action():
-    """
-    Handle the compression action: select folder, choose settings,
-    and initiate encoding in background thread.
-    """
-    root.after(0, lambda: log_text.delete('1.0', tk.END))  # Clear log
+class Job:
+    """One encode or decode in the job list; run(job) does the work on a pool thread."""
 
-    folder_path = filedialog.askdirectory(title="Select folder to compress")
-    if not folder_path:
-        return
+    _numbers = itertools.count(1)
+
+    def __init__(self, kind, source, target, run):
+        self.number = next(Job._numbers)
+        self.id = f'job{self.number}'
+        self.kind = kind
+        self.source = source
+        self.target = target
+        self.run = run
+        self.token = CancelToken()
+        self.status = 'Queued'
+        self.percent = 0.0
+        self.text = ''
+
+    @property
+    def name(self):
+        return os.path.basename(os.path.normpath(self.source))
 
+    def log(self, msg):
+        ui_log(f"#{self.number} {msg}")
+
+
+def unique_target(output_dir, source, suffix):
+    """output_dir/<source name><suffix>, numbered if another job already writes there."""
+    stem = os.path.basename(os.path.normpath(source))
+    if not suffix:
+        stem = os.path.splitext(stem)[0]
+    taken = {job.target for job in jobs.values()}
+    target = os.path.join(output_dir, stem + suffix)
+    n = 1
+    while target in taken:
+        n += 1
+        target = os.path.join(output_dir, f'{stem}_{n}{suffix}')
+    return target
+
+
+def ask_compression_settings(on_proceed):
+    """
+    Show the compression settings dialog. on_proceed(compression_method,
+    enable_max_limit, password) is called when Compress is clicked.
+    """
     compress_window = tk.Toplevel(root)
     compress_window.title("Compression Settings")
     compress_window.geometry(COMPRESS_WINDOW_SIZE)
@@ -152,67 +295,14 @@ def encode_action():
     password_entry.pack(pady=5)
 
     def proceed_compression():
-        """Validate inputs and start compression process."""
+        """Collect the settings and hand them on."""
         compression_method = compression_var.get()
+        enable_max_limit = enable_limit_var.get()
         password = password_var.get().strip()
         if not password:
             password = None
-
-        output_name = os.path.basename(folder_path) + ".png"
-        output_path = filedialog.asksaveasfilename(
-            defaultextension=".png",
-            filetypes=[("PNG Images", "*.png")],
-            initialfile=output_name
-        )
-
-        if not output_path:
-            compress_window.destroy()
-            return
-
         compress_window.destroy()
-
-        def encode_worker():
-            start_time = time.time()
-            pbar = tqdm(total=100, unit='%', desc="Compressing")
-            try:
-                def progress_cb(percent, message='Encoding'):
-                    elapsed = time.time() - start_time
-                    eta = (elapsed / (percent / 100)) - elapsed if percent > 0 else 0
-                    eta_str = f"ETA: {int(eta)}s" if eta > 0 else ""
-                    root.after(0, lambda: progress_bar.config(value=percent))
-                    root.after(0, lambda: progress_label.config(
-                        text=f"{message}: {percent:.1f}% {eta_str}"))
-                    pbar.n = percent
-                    pbar.desc = message
-                    pbar.refresh()
-
-                def log_cb(msg):
-                    root.after(0, lambda: log_text.insert('1.0', msg + '\n'))
-
-                encode_folder_to_png(
-                    folder_path,
-                    output_path,
-                    compression_method,
-                    progress_cb,
-                    enable_max_limit=enable_limit_var.get(),
-                    password=password,
-                    log_callback=log_cb
-                )
-                pbar.close()
-                root.after(0, lambda: messagebox.showinfo(
-                    "Success",
-                    f"Folder compressed to '{output_path}' "
-                    f"using {compression_method.upper()}!"
-                ))
-            except Exception as e:
-                pbar.close()
-                root.after(0, lambda e=e: messagebox.showerror(
-                    "Error", f"Compression failed: {str(e)}"))
-            finally:
-                root.after(0, lambda: progress_bar.config(value=0))
-                root.after(0, lambda: progress_label.config(text="Idle"))
-
-        threading.Thread(target=encode_worker, daemon=True).start()
+        on_proceed(compression_method, enable_max_limit, password)
 
     tk.Button(
         compress_window,
@@ -234,24 +324,100 @@ def encode_action():
     ).pack(pady=5)
 
 
+def encode_action():
+    """
+    Handle the compression action: select folder, choose settings and the
+    output file, and queue the encode.
+    """
+    folder_path = filedialog.askdirectory(title="Select folder to compress")
+    if not folder_path:
+        return
+
+    def proceed(compression_method, enable_max_limit, password):
+        output_path = filedialog.asksaveasfilename(
+            defaultextension=".png",
+            filetypes=[("PNG Images", "*.png")],
+            initialfile=os.path.basename(folder_path) + ".png"
+        )
+        if output_path:
+            add_job(encode_job(folder_path, output_path, compression_method, enable_max_limit, password))
+
+    ask_compression_settings(proceed)
+
+
+def queue_compressions(folders):
+    """Ask for settings and an output folder once, then queue one encode per folder."""
+    def proceed(compression_method, enable_max_limit, password):
+        output_dir = filedialog.askdirectory(title="Select output folder for the PNGs")
+        if not output_dir:
+            return
+        for folder_path in folders:
+            output_path = unique_target(output_dir, folder_path, '.png')
+            add_job(encode_job(folder_path, output_path, compression_method, enable_max_limit, password))
+
+    ask_compression_settings(proceed)
+
+
+def encode_job(folder_path, output_path, compression_method, enable_max_limit, password):
+    def run(job):
+        start_time = time.time()
+
+        def progress_cb(percent, message='Encoding'):
+            elapsed = time.time() - start_time
+            eta = (elapsed / (percent / 100)) - elapsed if percent > 0 else 0
+            eta_str = f"ETA: {int(eta)}s" if eta > 0 else ""
+            ui_progress(job, percent, f"{message}: {percent:.1f}% {eta_str}")
+
+        encode_folder_to_png(
+            folder_path,
+            output_path,
+            compression_method,
+            progress_cb,
+            enable_max_limit=enable_max_limit,
+            password=password,
+            log_callback=job.log,
+            cancel_token=job.token
+        )
+        job.log(f"Folder compressed to '{output_path}' using {compression_method.upper()}!")
+
+    return Job('Compress', folder_path, output_path, run)
+
+
 def decode_action():
     """
-    Handle the extraction action: select PNG and output folder,
-    then initiate decoding in background thread.
+    Handle the extraction action: select PNGs and an output folder. A single
+    image is confirmed from its header and extracted into the folder; several
+    are queued into a subfolder each.
     """
-    global main_frame
-    img_path = filedialog.askopenfilename(
-        title="Select compressed PNG file",
+    img_paths = filedialog.askopenfilenames(
+        title="Select compressed PNG files",
         filetypes=[("PNG Images", "*.png")]
     )
-    if not img_path:
+    if not img_paths:
         return
 
     output_folder = filedialog.askdirectory(title="Select output folder")
     if not output_folder:
         return
 
-    folder_name, file_count, total_size, compression_method, password_info, metadata_channels_found = get_decode_info(img_path)
+    if len(img_paths) > 1:
+        queue_extractions(img_paths, output_folder)
+        return
+
+    img_path = img_paths[0]
+    progress_label.config(text="Reading image info...")
+
+    def info_worker():
+        info = get_decode_info(img_path)
+        ui_call(lambda: confirm_decode(img_path, output_folder, info))
+
+    threading.Thread(target=info_worker, daemon=True).start()
+
+
+def confirm_decode(img_path, output_folder, info):
+    """Show what the image holds, ask for a password if needed, and queue the decode."""
+    refresh_progress()
+    folder_name, file_count, total_size, compression_method, password_info, metadata_channels_found = info
 
     size_mb = total_size / (1024 * 1024)
     protection = "Password protected" if password_info == "encrypted" else "No password protection"
@@ -266,79 +432,286 @@ def decode_action():
             messagebox.showerror("Error", "Password is required for extraction.")
             return
 
-    root.after(0, lambda: log_text.delete('1.0', tk.END))  # Clear log
+    add_job(decode_job(img_path, output_folder, password, info))
+
+
+def queue_extractions(img_paths, output_dir):
+    """Queue one decode per image into output_dir/<image name>. Passwords are asked for when a job starts."""
+    for img_path in img_paths:
+        add_job(decode_job(img_path, unique_target(output_dir, img_path, '')))
+
+
+def decode_job(img_path, output_folder, password=None, info=None):
+    def run(job):
+        nonlocal password
+        header = info
+        if header is None:
+            ui_progress(job, 0, "Reading image info...")
+            header = get_decode_info(img_path)
+        password_info, metadata_channels_found = header[4], header[5]
+        if password_info == "encrypted" and not password:
+            password = ask_password(job)
+        start_preview(job, img_path, metadata_channels_found * 4)
+
+        def progress_cb(percent, message='', file='', start_offset=0, end_offset=0):
+            ui_progress(job, percent, message, (file, start_offset, end_offset))
+
+        decode_png_to_folder(img_path, output_folder, progress_cb, password, log_callback=job.log, cancel_token=job.token)
+        job.log(f"Files extracted to '{output_folder}'!")
+        ui_call(lambda: check_and_run_autorun_gui(output_folder))
+
+    return Job('Extract', img_path, output_folder, run)
+
+
+def ask_password(job):
+    """Ask for a job's password on the UI thread and wait for the answer."""
+    answered = threading.Event()
+    answer = []
+
+    def prompt():
+        answer.append(simpledialog.askstring("Password Required", f"Enter password for {job.name}:", show='*'))
+        answered.set()
+
+    ui_call(prompt)
+    while not answered.wait(0.1):
+        check_cancelled(job.token)
+    if not answer[0]:
+        raise ValueError("Password is required for extraction.")
+    return answer[0]
+
+
+def add_paths(paths):
+    """Queue dropped folders for compression and PNGs for extraction."""
+    folders = [p for p in paths if os.path.isdir(p)]
+    images = [p for p in paths if os.path.isfile(p) and p.lower().endswith('.png')]
+    for p in paths:
+        if p not in folders and p not in images:
+            ui_log(f"Skipped {p}: not a folder or PNG")
+    if images:
+        output_dir = filedialog.askdirectory(title="Select output folder for the dropped PNGs")
+        if output_dir:
+            queue_extractions(images, output_dir)
+    if folders:
+        queue_compressions(folders)
 
-    img = Image.open(img_path)
-    width, height = img.size
-    scale_factor = 650 / max(width, height)
-    new_width = int(width * scale_factor)
-    new_height = int(height * scale_factor)
-    scaled_img = img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+
+def on_drop(event):
+    add_paths(root.tk.splitlist(event.data))
+
+
+def start_preview(job, img_path, data_start_idx):
+    """Build the preview for a decode job in the background and show it when ready."""
+    def preview_worker():
+        try:
+            preview = build_preview(img_path, cancel_token=job.token)
+        except OperationCancelled:
+            return
+        except Exception as e:
+            job.log(f"Preview unavailable: {e}")
+            return
+        ui_call(lambda: show_preview(job, data_start_idx, *preview))
+
+    threading.Thread(target=preview_worker, daemon=True).start()
+
+
+def show_preview(job, data_start_idx, image, width, height):
+    """Put a preview built by build_preview next to the controls, replacing any other, if its job is still running."""
+    global current_preview
+    if job not in running_jobs:
+        return
+    hide_preview()
+    new_width, new_height = image.size
     canvas = tk.Canvas(main_frame, width=new_width, height=new_height, bg=FRAME_BG)
-    canvas.photo = ImageTk.PhotoImage(scaled_img)
+    canvas.photo = ImageTk.PhotoImage(image)
     canvas.create_image(0, 0, anchor='nw', image=canvas.photo)
     canvas.grid(row=0, column=1, sticky='nwes')
     main_frame.grid_columnconfigure(1, minsize=new_width, weight=0)
-    root.geometry(f"{520 + new_width}x650")  # 500 left + 20 padding + image
-    overlays = []
-    data_start_idx = metadata_channels_found * 4
+    root.geometry(f"{520 + new_width}x{WINDOW_HEIGHT}")  # 500 left + 20 padding + image
+    current_preview = {'job': job, 'canvas': canvas, 'overlays': [], 'width': width, 'height': height,
+                       'data_start_idx': data_start_idx}
 
-    def update_highlight(percent, message='', file='', start_offset=0, end_offset=0):
-        progress_bar.config(value=percent)
-        progress_label.config(text=message)
-        for ov in overlays:
-            canvas.delete(ov)
-        overlays.clear()
-        if file and start_offset < end_offset:
-            byte_start = data_start_idx + start_offset
-            pixel_start = byte_start // 4
-            x1 = pixel_start % width
-            y1 = pixel_start // width
-            byte_end = data_start_idx + end_offset - 1
-            pixel_end = byte_end // 4
-            x2 = pixel_end % width
-            y2 = pixel_end // width
-            sx1 = int(x1 * new_width / width)
-            sy1 = int(y1 * new_height / height)
-            sx2 = int((x2 + 1) * new_width / width)
-            sy2 = int((y2 + 1) * new_height / height)
-            overlays.append(canvas.create_rectangle(sx1, sy1, sx2, sy2, outline='red', width=3))
-            if sx2 - sx1 > 100 and sy2 - sy1 > 50:
-                overlays.append(canvas.create_text((sx1 + sx2)//2, (sy1 + sy2)//2, text=f"Processing: {os.path.basename(file)}", fill='red', font=('Helvetica', 14, 'bold')))
-        root.update_idletasks()
-
-    def decode_worker():
-        try:
-            def log_cb(msg):
-                root.after(0, lambda: log_text.insert('1.0', msg + '\n'))
-                def trim_log():
-                    line_count = int(log_text.index('end-1c').split('.')[0])
-                    if line_count > 30:
-                        log_text.delete('31.0', 'end')
-                root.after(50, trim_log)
-
-            decode_png_to_folder(img_path, output_folder, update_highlight, password, log_callback=log_cb)
-            root.after(0, lambda output_folder=output_folder: check_and_run_autorun_gui(output_folder))
-            root.after(0, lambda: messagebox.showinfo(
-                "Success", f"Files extracted to '{output_folder}'!"))
-        except Exception as e:
-            root.after(0, lambda e=e: messagebox.showerror(
-                "Error", f"Extraction failed: {str(e)}"))
-        finally:
-            root.after(0, lambda: progress_bar.config(value=0))
-            root.after(0, lambda: progress_label.config(text="Idle"))
-            canvas.grid_remove()
-            root.geometry(WINDOW_SIZE)
-            main_frame.grid_columnconfigure(1, minsize=0)
 
-    threading.Thread(target=decode_worker, daemon=True).start()
+def hide_preview(job=None):
+    """Remove the preview (only if it belongs to job, when given)."""
+    global current_preview
+    if current_preview is not None and job in (None, current_preview['job']):
+        current_preview['canvas'].destroy()
+        current_preview = None
+        root.geometry(WINDOW_SIZE)
+        main_frame.grid_columnconfigure(1, minsize=0)
+
+
+def show_progress(job, percent, text, highlight=None):
+    """
+    Record a job's progress in the list, mirror it on the progress bar if the
+    bar follows that job, and box the member being extracted on its preview.
+    """
+    job.percent = percent
+    job.text = text
+    update_job_row(job)
+    if job is focused_job():
+        progress_bar.config(value=percent)
+        progress_label.config(text=text)
+    if current_preview is None or current_preview['job'] is not job or highlight is None:
+        return
+    canvas = current_preview['canvas']
+    overlays = current_preview['overlays']
+    width, height = current_preview['width'], current_preview['height']
+    new_width, new_height = int(canvas['width']), int(canvas['height'])
+    for ov in overlays:
+        canvas.delete(ov)
+    overlays.clear()
+    file, start_offset, end_offset = highlight
+    if file and start_offset < end_offset:
+        byte_start = current_preview['data_start_idx'] + start_offset
+        pixel_start = byte_start // 4
+        x1 = pixel_start % width
+        y1 = pixel_start // width
+        byte_end = current_preview['data_start_idx'] + end_offset - 1
+        pixel_end = byte_end // 4
+        x2 = pixel_end % width
+        y2 = pixel_end // width
+        sx1 = int(x1 * new_width / width)
+        sy1 = int(y1 * new_height / height)
+        sx2 = int((x2 + 1) * new_width / width)
+        sy2 = int((y2 + 1) * new_height / height)
+        overlays.append(canvas.create_rectangle(sx1, sy1, sx2, sy2, outline='red', width=3))
+        if sx2 - sx1 > 100 and sy2 - sy1 > 50:
+            overlays.append(canvas.create_text((sx1 + sx2)//2, (sy1 + sy2)//2, text=f"Processing: {os.path.basename(file)}", fill='red', font=('Helvetica', 14, 'bold')))
+
+
+def focused_job():
+    """The job the progress bar follows: the selected one, else the latest started."""
+    for item in job_list.selection():
+        return jobs.get(item)
+    return running_jobs[-1] if running_jobs else None
+
+
+def refresh_progress():
+    job = focused_job()
+    if job is None:
+        progress_bar.config(value=0)
+        progress_label.config(text="Idle")
+    else:
+        progress_bar.config(value=job.percent)
+        running = job in running_jobs and job.status == 'Running'
+        progress_label.config(text=job.text if running and job.text else f"{job.name}: {job.status}")
+
+
+def update_job_row(job):
+    if job_list.exists(job.id):
+        job_list.item(job.id, values=(job.kind, job.name, job.status, f"{job.percent:.0f}%"))
+
+
+def add_job(job):
+    jobs[job.id] = job
+    job_list.insert('', 'end', iid=job.id)
+    update_job_row(job)
+    pending_jobs.append(job)
+    schedule_jobs()
+
+
+def schedule_jobs():
+    """Start queued jobs, oldest first, while fewer than job_limit are running. Paused queued jobs wait."""
+    for job in list(pending_jobs):
+        if len(running_jobs) >= job_limit:
+            break
+        if job.token.paused:
+            continue
+        pending_jobs.remove(job)
+        running_jobs.append(job)
+        job.status = 'Running'
+        update_job_row(job)
+        # Like compress-batch, concurrent encodes share the cores
+        encoder.encode_workers = max(1, (os.cpu_count() or 1) // job_limit)
+        job_pool.submit(run_job, job)
+    refresh_progress()
+
+
+def run_job(job):
+    try:
+        job.run(job)
+        outcome = 'Done'
+    except OperationCancelled:
+        outcome = 'Cancelled'
+    except Exception as e:
+        job.log(f"Failed: {e}")
+        outcome = 'Failed'
+    ui_call(lambda: finish_job(job, outcome))
+
+
+def finish_job(job, outcome):
+    running_jobs.remove(job)
+    # Stops a preview that is still being built
+    job.token.cancel('job finished')
+    job.status = outcome
+    if outcome == 'Done':
+        job.percent = 100
+    update_job_row(job)
+    hide_preview(job)
+    schedule_jobs()
+
+
+def selected_jobs():
+    """Jobs selected in the list, or every unfinished job if none are."""
+    selected = [jobs[item] for item in job_list.selection() if item in jobs]
+    return selected or running_jobs + list(pending_jobs)
+
+
+def pause_action():
+    for job in selected_jobs():
+        if (job in running_jobs or job in pending_jobs) and not job.token.cancelled:
+            job.token.pause()
+            job.status = 'Paused'
+            update_job_row(job)
+    refresh_progress()
+
+
+def resume_action():
+    for job in selected_jobs():
+        if job.token.paused and not job.token.cancelled:
+            job.token.resume()
+            job.status = 'Running' if job in running_jobs else 'Queued'
+            update_job_row(job)
+    schedule_jobs()
+
+
+def cancel_action():
+    """Drop queued jobs; running ones stop at their next checkpoint."""
+    for job in selected_jobs():
+        if job in pending_jobs:
+            pending_jobs.remove(job)
+            job.token.cancel('cancelled by user')
+            job.status = 'Cancelled'
+        elif job in running_jobs:
+            job.token.cancel('cancelled by user')
+            job.status = 'Cancelling...'
+        update_job_row(job)
+    refresh_progress()
+
+
+def clear_finished_action():
+    for job in list(jobs.values()):
+        if job not in running_jobs and job not in pending_jobs:
+            del jobs[job.id]
+            job_list.delete(job.id)
+    refresh_progress()
+
+
+def set_job_limit(*_):
+    global job_limit
+    try:
+        job_limit = max(1, min(MAX_JOB_WORKERS, int(limit_var.get())))
+    except (tk.TclError, ValueError):
+        return
+    schedule_jobs()
 
 
 def create_main_window():
     """Create and configure the main application window."""
-    global root, progress_bar, progress_label, log_text, main_frame
+    global root, progress_bar, progress_label, log_text, main_frame, job_list, limit_var
 
-    root = tk.Tk()
+    root = TkinterDnD.Tk() if TkinterDnD else tk.Tk()
     root.title(WINDOW_TITLE)
     root.geometry(WINDOW_SIZE)
     root.resizable(False, False)
@@ -381,7 +754,7 @@ def create_main_window():
 
     extract_btn = tk.Button(
         buttons_frame,
-        text="Extract PNG to Folder",
+        text="Extract PNGs to Folder",
         command=decode_action,
         font=BUTTON_FONT,
         bg=BUTTON_BG,
@@ -412,6 +785,52 @@ def create_main_window():
     )
     progress_label.pack(pady=10)
 
+    jobs_frame = tk.Frame(left_frame, bg=FRAME_BG)
+    jobs_frame.pack(fill="x", padx=10)
+
+    job_list = ttk.Treeview(
+        jobs_frame,
+        columns=('kind', 'name', 'status', 'progress'),
+        show='headings',
+        height=6,
+        selectmode='extended'
+    )
+    for column, heading, width in (('kind', "Job", 70), ('name', "Name", 200), ('status', "Status", 100), ('progress', "Progress", 70)):
+        job_list.heading(column, text=heading)
+        job_list.column(column, width=width, stretch=column == 'name')
+    job_list.pack(fill="x")
+    job_list.bind('<<TreeviewSelect>>', lambda event: refresh_progress())
+    if TkinterDnD:
+        job_list.drop_target_register(DND_FILES)
+        job_list.dnd_bind('<<Drop>>', on_drop)
+
+    controls_frame = tk.Frame(jobs_frame, bg=FRAME_BG)
+    controls_frame.pack(fill="x", pady=5)
+    for text, command in (("Pause", pause_action), ("Resume", resume_action),
+                          ("Cancel", cancel_action), ("Clear finished", clear_finished_action)):
+        tk.Button(
+            controls_frame,
+            text=text,
+            command=command,
+            font=FOOTER_FONT,
+            bg=BUTTON_BG,
+            fg=BUTTON_FG
+        ).pack(side=tk.LEFT, padx=(0, 5))
+    limit_var = tk.IntVar(value=job_limit)
+    tk.Spinbox(
+        controls_frame,
+        from_=1,
+        to=MAX_JOB_WORKERS,
+        textvariable=limit_var,
+        width=3
+    ).pack(side=tk.RIGHT)
+    limit_var.trace_add('write', set_job_limit)
+    tk.Label(controls_frame, text="Parallel jobs:", font=FOOTER_FONT, fg="#FFFFFF", bg=FRAME_BG).pack(side=tk.RIGHT, padx=5)
+
+    hint = ("Drop folders or PNGs on the list to queue them" if TkinterDnD
+            else "Install tkinterdnd2 to drop folders or PNGs on the list")
+    tk.Label(jobs_frame, text=hint, font=SMALL_FONT, fg=FOOTER_COLOR, bg=FRAME_BG).pack(anchor="w")
+
     log_label = tk.Label(
         left_frame,
         text="Log:",
@@ -424,7 +843,7 @@ def create_main_window():
     log_frame = tk.Frame(left_frame, bg=FRAME_BG)
     log_frame.pack(fill="both", expand=True, padx=10, pady=(0,10))
 
-    log_text = tk.Text(log_frame, bg="#000000", fg="#FFFFFF", font=("Helvetica", 10), height=15, wrap=tk.WORD)
+    log_text = tk.Text(log_frame, bg="#000000", fg="#FFFFFF", font=("Helvetica", 10), height=8, wrap=tk.WORD)
     log_text.pack(fill="both", expand=True)
 
     footer_label = tk.Label(
@@ -436,6 +855,7 @@ def create_main_window():
     )
     footer_label.pack(side="bottom", pady=20)
 
+    root.after(UI_FRAME_MS, drain_ui_events)
     root.mainloop()
 
 
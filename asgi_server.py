@@ -0,0 +1,1017 @@
+import os
+import io
+import re
+import sys
+import json
+import time
+import hmac
+import shutil
+import signal
+import asyncio
+import zipfile
+import tempfile
+import mimetypes
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.http import parse_options_header
+from werkzeug.utils import secure_filename
+from limits import parse_many
+from limits.storage import MemoryStorage
+from limits.strategies import FixedWindowRateLimiter
+from cancellation import CancelToken, OperationCancelled
+from autoselect import parse_target
+from uploads import UploadError
+import server
+from server import (logger, API_KEY, RATE_LIMIT, REQUEST_TIMEOUT, BATCH_MAX_ITEMS, PORT, ALLOWED_METHODS,
+                    AUTO_TARGET, MEMORY_LIMIT, ARCHIVE_LAYOUT, MAX_PIXELS, TEMP_ROOT, worker_pool, upload_store, http_requests,
+                    http_latency, http_bytes_in, http_bytes_out, http_in_flight)
+
+# The asyncio variant of server.py: the same endpoints, auth, rate limits, metrics and
+# settings, served by one event loop. Request and response bodies stream through the
+# loop, so a slow client holds a socket and a coroutine, not a thread. Encoding and
+# decoding run on server.worker_pool, blocking file I/O on io_pool.
+# Run with `python asgi_server.py`, or any ASGI server: `uvicorn asgi_server:app`.
+
+IO_WORKERS = int(os.environ.get('IO_WORKERS') or 16)
+MAX_CONTENT_LENGTH = server.app.config.get('MAX_CONTENT_LENGTH')
+# Upload bytes gathered before one write to disk, and bytes per response body message
+spool_size = 1024 * 1024
+send_size = 256 * 1024
+# Form fields, JSON bodies and part headers are held in memory, so they are capped
+max_field_size = 1024 * 1024
+max_header_size = 16 * 1024
+
+io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix='io')
+# Same fixed-window limits as Flask-Limiter, per client address and endpoint
+rate_limiter = FixedWindowRateLimiter(MemoryStorage())
+rate_limits = parse_many(RATE_LIMIT)
+
+
+class HTTPError(Exception):
+    """Ends the request with a JSON error response."""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class ClientDisconnected(Exception):
+    """The client went away while its request body was being read."""
+
+
+class Response:
+    """
+    What a handler returns. The body is bytes, the file at path, or an async
+    iterator of chunks; all are sent in send_size pieces as the client
+    takes them.
+    """
+
+    def __init__(self, body=b'', status=200, mimetype='application/json', headers=None, path=None, chunks=None):
+        self.body = body
+        self.status = status
+        self.mimetype = mimetype
+        self.headers = dict(headers or {})
+        self.path = path
+        self.chunks = chunks
+
+
+def json_response(data, status=200, headers=None):
+    return Response(json.dumps(data).encode(), status, 'application/json', headers)
+
+
+def file_response(path, mimetype, download_name):
+    return Response(status=200, mimetype=mimetype, path=path,
+                    headers={'Content-Disposition': f'attachment; filename="{download_name}"'})
+
+
+class UploadedFile:
+    """A file part of a multipart body, already spooled to path."""
+
+    __slots__ = ('filename', 'path')
+
+    def __init__(self, filename, path):
+        self.filename = filename
+        self.path = path
+
+    def save(self, dst):
+        os.replace(self.path, dst)
+
+
+class Form:
+    """Fields {name: [str]} and files {name: [UploadedFile]} of a request body, in arrival order."""
+
+    def __init__(self):
+        self.fields = {}
+        self.files = {}
+
+    def get(self, name, default=None):
+        values = self.fields.get(name)
+        return values[0] if values else default
+
+
+class MultipartParser:
+    """
+    Incremental multipart/form-data parser. feed() takes body pieces as they
+    arrive and returns events: ('part', name, filename), ('data', bytes) and
+    ('end',). Only a tail that could be the start of a boundary is kept
+    between pieces, so memory stays flat whatever the part sizes.
+    """
+
+    def __init__(self, boundary):
+        self._delimiter = b'\r\n--' + boundary
+        # The first boundary has no CRLF before it
+        self._buffer = bytearray(b'\r\n')
+        self._state = 'preamble'
+
+    @property
+    def done(self):
+        return self._state == 'done'
+
+    def feed(self, data):
+        buffer = self._buffer
+        buffer += data
+        events = []
+        while True:
+            if self._state in ('preamble', 'body'):
+                index = buffer.find(self._delimiter)
+                if index < 0:
+                    keep = len(self._delimiter) - 1
+                    if len(buffer) > keep:
+                        if self._state == 'body':
+                            events.append(('data', bytes(buffer[:-keep])))
+                        del buffer[:-keep]
+                    break
+                if self._state == 'body':
+                    if index:
+                        events.append(('data', bytes(buffer[:index])))
+                    events.append(('end',))
+                del buffer[:index + len(self._delimiter)]
+                self._state = 'delimiter'
+            elif self._state == 'delimiter':
+                if len(buffer) < 2:
+                    break
+                if buffer[:2] == b'--':
+                    self._state = 'done'
+                    buffer.clear()
+                    break
+                index = buffer.find(b'\r\n')
+                if index < 0:
+                    break
+                del buffer[:index + 2]
+                self._state = 'headers'
+            elif self._state == 'headers':
+                index = buffer.find(b'\r\n\r\n')
+                if index < 0:
+                    if len(buffer) > max_header_size:
+                        raise HTTPError(400, 'Multipart part headers too large')
+                    break
+                disposition = ''
+                for line in bytes(buffer[:index]).decode('utf-8', 'replace').split('\r\n'):
+                    key, _, value = line.partition(':')
+                    if key.strip().lower() == 'content-disposition':
+                        disposition = value.strip()
+                del buffer[:index + 4]
+                _, options = parse_options_header(disposition)
+                events.append(('part', options.get('name', ''), options.get('filename')))
+                self._state = 'body'
+            else:
+                buffer.clear()
+                break
+        return events
+
+
+class Request:
+    """One HTTP request: scope details plus the body as it arrives."""
+
+    def __init__(self, scope, receive):
+        self._receive = receive
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = {k: v[0] for k, v in parse_qs(scope.get('query_string', b'').decode('latin-1')).items()}
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope['headers']}
+        self.remote_addr = (scope.get('client') or ('unknown',))[0]
+        length = self.headers.get('content-length', '')
+        self.content_length = int(length) if length.isdigit() else None
+        self.token = None
+        self.disconnected = False
+        self.temp_dirs = []
+        self._body_done = False
+        self._watcher = None
+
+    def mkdtemp(self, prefix):
+        """Temp dir removed once the response has been sent."""
+        temp_dir = tempfile.mkdtemp(prefix=prefix, dir=TEMP_ROOT)
+        self.temp_dirs.append(temp_dir)
+        return temp_dir
+
+    async def chunks(self):
+        """Body pieces as they arrive; HTTPError 413 past MAX_CONTENT_LENGTH."""
+        if MAX_CONTENT_LENGTH and (self.content_length or 0) > MAX_CONTENT_LENGTH:
+            raise HTTPError(413, f'Request body exceeds {MAX_CONTENT_LENGTH} bytes')
+        received = 0
+        while not self._body_done:
+            message = await self._receive()
+            if message['type'] == 'http.disconnect':
+                self._body_done = self.disconnected = True
+                raise ClientDisconnected()
+            self._body_done = not message.get('more_body', False)
+            data = message.get('body', b'')
+            received += len(data)
+            if MAX_CONTENT_LENGTH and received > MAX_CONTENT_LENGTH:
+                raise HTTPError(413, f'Request body exceeds {MAX_CONTENT_LENGTH} bytes')
+            if data:
+                yield data
+
+    async def body(self, limit=max_field_size):
+        data = bytearray()
+        async for chunk in self.chunks():
+            data += chunk
+            if len(data) > limit:
+                raise HTTPError(413, f'Request body exceeds {limit} bytes')
+        return bytes(data)
+
+    async def json(self):
+        """Parsed JSON body, or None if it isn't JSON (like Flask's get_json(silent=True))."""
+        if parse_options_header(self.headers.get('content-type', ''))[0] != 'application/json':
+            return None
+        try:
+            return json.loads(await self.body())
+        except ValueError:
+            return None
+
+    async def form(self, directory=None):
+        """
+        The form of a multipart or urlencoded body. File parts are written to
+        directory (a new temp dir if None) while they arrive; os.replace()
+        moves them into place afterwards.
+        """
+        mimetype, options = parse_options_header(self.headers.get('content-type', ''))
+        form = Form()
+        if mimetype == 'application/x-www-form-urlencoded':
+            form.fields = parse_qs((await self.body()).decode('utf-8', 'replace'), keep_blank_values=True)
+        elif mimetype == 'multipart/form-data' and options.get('boundary'):
+            await self._read_multipart(form, options['boundary'].encode('latin-1'), directory)
+        else:
+            # Nothing to parse, but the body still has to be read before the disconnect watch starts
+            async for _ in self.chunks():
+                pass
+        return form
+
+    async def _read_multipart(self, form, boundary, directory):
+        parser = MultipartParser(boundary)
+        field = target = None
+        pending = bytearray()
+        field_bytes = 0
+        try:
+            async for data in self.chunks():
+                for event in parser.feed(data):
+                    if event[0] == 'part':
+                        _, name, filename = event
+                        if filename is None:
+                            field, target = name, bytearray()
+                        else:
+                            if directory is None:
+                                directory = self.mkdtemp('form_')
+                            path = os.path.join(directory, f'part_{sum(map(len, form.files.values()))}')
+                            field, target = name, await run_io(open, path, 'wb')
+                            form.files.setdefault(name, []).append(UploadedFile(filename, path))
+                    elif event[0] == 'data':
+                        if isinstance(target, bytearray):
+                            field_bytes += len(event[1])
+                            if field_bytes > max_field_size:
+                                raise HTTPError(413, f'Form fields exceed {max_field_size} bytes')
+                            target += event[1]
+                        else:
+                            pending += event[1]
+                            if len(pending) >= spool_size:
+                                await run_io(target.write, pending)
+                                pending = bytearray()
+                    elif isinstance(target, bytearray):
+                        form.fields.setdefault(field, []).append(target.decode('utf-8', 'replace'))
+                        target = None
+                    else:
+                        await run_io(target.write, pending)
+                        pending = bytearray()
+                        await run_io(target.close)
+                        target = None
+        finally:
+            if target is not None and not isinstance(target, bytearray):
+                target.close()
+        if not parser.done:
+            raise HTTPError(400, 'Malformed multipart body')
+
+    def cancel_token(self):
+        """
+        Cancel token for this request's job. Fires when the client hangs up or
+        REQUEST_TIMEOUT passes. Only valid once the body has been read, since
+        the disconnect watch takes over receive().
+        """
+        if self.token is None:
+            self.token = CancelToken(REQUEST_TIMEOUT or None)
+            self.watch_disconnect()
+        return self.token
+
+    def watch_disconnect(self):
+        """Start noticing when the client hangs up (sets disconnected, fires the cancel token)."""
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def _watch(self):
+        # Whatever is left of an unread body is drained here too
+        while (await self._receive())['type'] != 'http.disconnect':
+            pass
+        self.disconnected = True
+        if self.token is not None:
+            self.token.cancel('client disconnected')
+
+    def close(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+
+
+async def run_job(fn, *args, **kwargs):
+    """Run blocking CPU work on server.worker_pool while the loop keeps serving."""
+    return await asyncio.wrap_future(worker_pool.submit(fn, *args, **kwargs))
+
+
+async def run_io(fn, *args):
+    """Run blocking file I/O on io_pool."""
+    return await asyncio.get_running_loop().run_in_executor(io_pool, fn, *args)
+
+
+class Route:
+    __slots__ = ('rule', 'pattern', 'methods', 'handler', 'limited', 'auth', 'expose_errors')
+
+    def __init__(self, rule, methods, handler, limited, auth, expose_errors):
+        self.rule = rule
+        self.pattern = re.compile('^' + re.sub(r'<(\w+)>', r'(?P<\1>[^/]+)', rule) + '$')
+        self.methods = set(methods) | ({'HEAD'} if 'GET' in methods else set())
+        self.handler = handler
+        self.limited = limited
+        self.auth = auth
+        self.expose_errors = expose_errors
+
+
+routes = []
+
+
+def route(rule, methods=('GET',), limited=False, auth=True, expose_errors=True):
+    """
+    Register a handler for rule (Flask-style, e.g. /api/uploads/<upload_id>).
+    limited applies RATE_LIMIT, auth requires the API key when one is set,
+    and expose_errors puts unexpected exception messages in 500 responses.
+    """
+    def register(handler):
+        routes.append(Route(rule, methods, handler, limited, auth, expose_errors))
+        return handler
+    return register
+
+
+def error(status, message):
+    return json_response({'error': message}, status)
+
+
+def read_auto_target(form):
+    """auto_target form field (or the AUTO_TARGET default); HTTPError 400 if malformed."""
+    target = form.get('auto_target') or AUTO_TARGET
+    try:
+        parse_target(target)
+    except ValueError as e:
+        raise HTTPError(400, str(e))
+    return target
+
+
+def upload_error_response(e):
+    body = {'error': str(e)}
+    headers = {}
+    if e.offset is not None:
+        body['offset'] = e.offset
+        headers['Upload-Offset'] = str(e.offset)
+    return json_response(body, e.status, headers)
+
+
+def cancelled_response(request, e):
+    reason = request.token.reason if request.token else None
+    logger.warning(f"[{request.remote_addr}] Request cancelled: {reason}")
+    if reason == 'deadline exceeded':
+        return error(504, 'Request timed out')
+    return error(499, str(e))
+
+
+def extract_to_zip(input_png, output_dir, zip_path, password, token, tag='Decoder'):
+    """Decode input_png into output_dir and zip the result, as /api/extract returns it."""
+    server.run_decode(input_png, output_dir, password, token, tag=tag)
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as zipf:
+        server.zip_folder(zipf, output_dir, token)
+
+
+@route('/metrics', auth=False)
+async def metrics_endpoint(request):
+    return Response(server.metrics.render().encode(), mimetype=server.METRICS_CONTENT_TYPE)
+
+
+@route('/health', auth=False)
+async def health_check(request):
+    logger.info("Health check requested")
+    return json_response({'status': 'ok', 'message': 'File Compressor API is running'})
+
+
+@route('/', auth=False)
+async def index(request):
+    return Response(server.index().encode(), mimetype='text/html; charset=utf-8')
+
+
+@route('/api/methods', limited=True, auth=False)
+async def get_compression_methods(request):
+    return json_response({'methods': server.COMPRESSION_METHODS})
+
+
+@route('/api/compress', ('POST',), limited=True, expose_errors=False)
+async def compress_folder(request):
+    start_time = time.time()
+    temp_dir = request.mkdtemp('compress_')
+    logger.info(f"[{request.remote_addr}] Starting compression request. Temp dir: {temp_dir}")
+    form = await request.form(temp_dir)
+    if 'files' not in form.files:
+        logger.error("No files provided in request")
+        return error(400, 'No files provided')
+    files = form.files['files']
+    compression_method = form.get('compression_method', 'zlib')
+    if compression_method not in ALLOWED_METHODS:
+        return error(400, 'invalid compression method')
+    auto_target = read_auto_target(form)
+    enable_limit = form.get('enable_limit', 'true').lower() == 'true'
+    password = form.get('password') or None
+    logger.info(f"Processing {len(files)} files. Method: {compression_method}, Password: {'Yes' if password else 'No'}")
+
+    input_dir = os.path.join(temp_dir, 'input')
+    server.save_uploads(files, input_dir)
+    output_filename = f'compressed_{int(time.time())}.png'
+    output_path = os.path.join(temp_dir, output_filename)
+    await run_job(server.run_encode, input_dir, output_path, compression_method, enable_limit, password,
+                  request.cancel_token(), auto_target=auto_target)
+    logger.info(f"Request completed in {time.time() - start_time:.2f}s")
+    return file_response(output_path, 'image/png', output_filename)
+
+
+@route('/api/extract', ('POST',), limited=True)
+async def extract_png(request):
+    start_time = time.time()
+    temp_dir = request.mkdtemp('extract_')
+    logger.info(f"[{request.remote_addr}] Starting extraction request. Temp dir: {temp_dir}")
+    form = await request.form(temp_dir)
+    if 'file' not in form.files:
+        logger.error("No file provided")
+        return error(400, 'No file provided')
+    password = form.get('password') or None
+    input_png = os.path.join(temp_dir, 'input.png')
+    form.files['file'][0].save(input_png)
+    logger.info(f"Saved input PNG. Size: {os.path.getsize(input_png)} bytes")
+
+    zip_filename = f'extracted_{int(time.time())}.zip'
+    zip_path = os.path.join(temp_dir, zip_filename)
+    await run_job(extract_to_zip, input_png, os.path.join(temp_dir, 'output'), zip_path, password,
+                  request.cancel_token())
+    logger.info(f"Request completed in {time.time() - start_time:.2f}s")
+    return file_response(zip_path, 'application/zip', zip_filename)
+
+
+async def saved_png(request, prefix):
+    """(temp_png, form) for endpoints that take one PNG in the 'file' field."""
+    temp_dir = request.mkdtemp(prefix)
+    logger.info(f"[{request.remote_addr}] {prefix.rstrip('_').title()} request. Temp dir: {temp_dir}")
+    form = await request.form(temp_dir)
+    if 'file' not in form.files:
+        raise HTTPError(400, 'No file provided')
+    temp_png = os.path.join(temp_dir, 'temp.png')
+    form.files['file'][0].save(temp_png)
+    return temp_png, form
+
+
+@route('/api/info', ('POST',), limited=True)
+async def get_info(request):
+    temp_png, _ = await saved_png(request, 'info_')
+    return json_response(await run_job(server.png_info, temp_png))
+
+
+@route('/api/estimate', ('POST',), limited=True)
+async def estimate_compression(request):
+    temp_dir = request.mkdtemp('estimate_')
+    logger.info(f"[{request.remote_addr}] Estimate request. Temp dir: {temp_dir}")
+    form = await request.form(temp_dir)
+    if 'files' not in form.files:
+        return error(400, 'No files provided')
+    compression_method = form.get('compression_method', 'zlib')
+    if compression_method not in ALLOWED_METHODS:
+        return error(400, 'invalid compression method')
+    auto_target = read_auto_target(form)
+    enable_limit = form.get('enable_limit', 'true').lower() == 'true'
+    password = form.get('password') or None
+
+    input_dir = os.path.join(temp_dir, 'input')
+    server.save_uploads(form.files['files'], input_dir)
+    from estimate import estimate_encode
+    est = await run_job(estimate_encode, input_dir, compression_method, password, enable_max_limit=enable_limit,
+                        auto_target=auto_target, layout=ARCHIVE_LAYOUT)
+    logger.info(f"Estimate: {est['payload_size']} bytes, {est['image_width']}x{est['image_height']}, "
+                f"{est['encode_seconds']:.1f}s, computed in {est['estimate_seconds']:.2f}s")
+    return json_response(est)
+
+
+@route('/api/list', ('POST',), limited=True)
+async def list_png(request):
+    temp_png, form = await saved_png(request, 'list_')
+    from decoder import list_members
+    listing = await run_job(list_members, temp_png, form.get('password') or None, max_pixels=MAX_PIXELS,
+                            memory_limit=MEMORY_LIMIT)
+    return json_response(listing)
+
+
+@route('/api/member', ('POST',), limited=True)
+async def get_member(request):
+    temp_png, form = await saved_png(request, 'member_')
+    name = request.args.get('name') or form.get('name')
+    if not name:
+        return error(400, 'Member name required')
+    logger.info(f"[{request.remote_addr}] Member request for '{name}'")
+
+    from decoder import open_archive
+    zipf, _, _ = await run_job(open_archive, temp_png, form.get('password') or None, max_pixels=MAX_PIXELS,
+                               memory_limit=MEMORY_LIMIT)
+    try:
+        info = zipf.getinfo(name)
+    except KeyError:
+        zipf.close()
+        return error(404, f'No such member: {name}')
+    if info.is_dir():
+        zipf.close()
+        return error(400, f'Member is a directory: {name}')
+    try:
+        member = await run_job(zipf.open, info)
+    except BaseException:
+        zipf.close()
+        raise
+
+    async def chunks():
+        try:
+            while True:
+                chunk = await run_job(member.read, send_size)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            member.close()
+            zipf.close()
+
+    download_name = secure_filename(os.path.basename(name)) or 'member'
+    return Response(mimetype=mimetypes.guess_type(name)[0] or 'application/octet-stream', chunks=chunks(), headers={
+        'Content-Length': str(info.file_size),
+        'Content-Disposition': f'attachment; filename="{download_name}"',
+        'X-Member-CRC32': f'{info.CRC:08x}',
+    })
+
+
+def batch_info_item(name, png_path):
+    try:
+        return dict(server.png_info(png_path), name=name, status='ok')
+    except Exception as e:
+        logger.error(f"Batch info failed for {name}: {e}")
+        return {'name': name, 'status': 'error', 'error': str(e)}
+
+
+def check_batch_size(count):
+    if not count:
+        raise HTTPError(400, 'No files provided')
+    if count > BATCH_MAX_ITEMS:
+        raise HTTPError(400, f'Too many items (max {BATCH_MAX_ITEMS})')
+
+
+@route('/api/batch/info', ('POST',), limited=True)
+async def batch_info(request):
+    temp_dir = request.mkdtemp('batch_info_')
+    form = await request.form(temp_dir)
+    files = [f for f in form.files.get('files', []) if f.filename]
+    logger.info(f"[{request.remote_addr}] Batch info request for {len(files)} items. Temp dir: {temp_dir}")
+    check_batch_size(len(files))
+
+    futures = []
+    for i, (file, name) in enumerate(zip(files, server.unique_item_names(f.filename for f in files))):
+        png_path = os.path.join(temp_dir, f'{i}.png')
+        file.save(png_path)
+        futures.append(asyncio.wrap_future(worker_pool.submit(batch_info_item, name, png_path)))
+
+    async def chunks():
+        try:
+            for future in asyncio.as_completed(futures):
+                yield (json.dumps(await future) + '\n').encode()
+        finally:
+            # The client may hang up mid-stream; items that haven't started are dropped
+            for future in futures:
+                future.cancel()
+
+    return Response(mimetype='application/x-ndjson', chunks=chunks())
+
+
+async def gather_batch(futures, add_item):
+    """
+    Await batch items as they finish, calling add_item(label, result) on
+    io_pool for each success. Returns the per-item results; a cancelled
+    item cancels the rest and re-raises.
+    """
+    results = []
+    try:
+        for future in asyncio.as_completed(list(futures)):
+            try:
+                label, result = await future
+            except OperationCancelled:
+                raise
+            except Exception as e:
+                results.append(e)
+                continue
+            results.append(await run_io(add_item, label, result))
+    except OperationCancelled:
+        for future in futures:
+            future.cancel()
+        raise
+    return results
+
+
+def batch_zip_response(zip_path, results, download_name, start_time):
+    """Append results.json to a batch ZIP and send it"""
+    with zipfile.ZipFile(zip_path, 'a') as zipf:
+        zipf.writestr('results.json', json.dumps({'results': results}, indent=2))
+    ok = sum(1 for r in results if r['status'] == 'ok')
+    logger.info(f"Batch completed: {ok}/{len(results)} items ok in {time.time() - start_time:.2f}s")
+    return file_response(zip_path, 'application/zip', download_name)
+
+
+def _labelled(label, fn, *args, **kwargs):
+    try:
+        return label, fn(*args, **kwargs)
+    except OperationCancelled:
+        raise
+    except Exception as e:
+        e.label = label
+        raise
+
+
+@route('/api/batch/extract', ('POST',), limited=True)
+async def batch_extract(request):
+    start_time = time.time()
+    temp_dir = request.mkdtemp('batch_extract_')
+    form = await request.form(temp_dir)
+    files = [f for f in form.files.get('files', []) if f.filename]
+    logger.info(f"[{request.remote_addr}] Batch extract request for {len(files)} items. Temp dir: {temp_dir}")
+    check_batch_size(len(files))
+
+    shared_password = form.get('password') or None
+    zip_filename = f'batch_extracted_{int(time.time())}.zip'
+    zip_path = os.path.join(temp_dir, zip_filename)
+    token = request.cancel_token()
+
+    def extract_item(index, name, password):
+        item_start = time.time()
+        output_dir = os.path.join(temp_dir, f'{index}_out')
+        server.run_decode(os.path.join(temp_dir, f'{index}.png'), output_dir, password, token, tag=f'Decoder {name}')
+        return output_dir, time.time() - item_start
+
+    futures = []
+    names = server.unique_item_names(os.path.splitext(f.filename)[0] for f in files)
+    for i, (file, name) in enumerate(zip(files, names)):
+        file.save(os.path.join(temp_dir, f'{i}.png'))
+        password = form.get(f'password:{file.filename}') or shared_password
+        futures.append(asyncio.wrap_future(worker_pool.submit(_labelled, name, extract_item, i, name, password)))
+
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as zipf:
+        def add_item(name, result):
+            output_dir, seconds = result
+            server.zip_folder(zipf, output_dir, token, prefix=name)
+            shutil.rmtree(output_dir, ignore_errors=True)
+            return {'name': name, 'status': 'ok', 'seconds': round(seconds, 3)}
+
+        results = await gather_batch(futures, add_item)
+    for i, result in enumerate(results):
+        if isinstance(result, Exception):
+            logger.error(f"Batch extract failed for {result.label}: {result}")
+            results[i] = {'name': result.label, 'status': 'error', 'error': str(result)}
+    return await run_io(batch_zip_response, zip_path, results, zip_filename, start_time)
+
+
+@route('/api/batch/compress', ('POST',), limited=True, expose_errors=False)
+async def batch_compress(request):
+    start_time = time.time()
+    temp_dir = request.mkdtemp('batch_compress_')
+    form = await request.form(temp_dir)
+    field_names = [name for name, files in form.files.items() if any(f.filename for f in files)]
+    logger.info(f"[{request.remote_addr}] Batch compress request for {len(field_names)} items. Temp dir: {temp_dir}")
+    check_batch_size(len(field_names))
+
+    compression_method = form.get('compression_method', 'zlib')
+    if compression_method not in ALLOWED_METHODS:
+        return error(400, 'invalid compression method')
+    auto_target = read_auto_target(form)
+    enable_limit = form.get('enable_limit', 'true').lower() == 'true'
+    password = form.get('password') or None
+    zip_filename = f'batch_compressed_{int(time.time())}.zip'
+    zip_path = os.path.join(temp_dir, zip_filename)
+    token = request.cancel_token()
+
+    def compress_item(input_dir, output_path, name):
+        item_start = time.time()
+        server.run_encode(input_dir, output_path, compression_method, enable_limit, password, token,
+                          tag=f'Encoder {name}', auto_target=auto_target)
+        return output_path, time.time() - item_start
+
+    futures = []
+    for i, (field, name) in enumerate(zip(field_names, server.unique_item_names(field_names))):
+        input_dir = os.path.join(temp_dir, str(i), name)
+        server.save_uploads(form.files[field], input_dir)
+        output_path = os.path.join(temp_dir, f'{i}.png')
+        futures.append(asyncio.wrap_future(worker_pool.submit(_labelled, name, compress_item, input_dir, output_path, name)))
+
+    # PNGs are already compressed, store them as-is
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as zipf:
+        def add_item(name, result):
+            output_path, seconds = result
+            zipf.write(output_path, f'{name}.png')
+            size = os.path.getsize(output_path)
+            os.remove(output_path)
+            return {'name': name, 'status': 'ok', 'seconds': round(seconds, 3), 'size': size}
+
+        results = await gather_batch(futures, add_item)
+    for i, result in enumerate(results):
+        if isinstance(result, Exception):
+            logger.error(f"Batch compress failed for {result.label}: {result}")
+            results[i] = {'name': result.label, 'status': 'error', 'error': 'compression failed'}
+    return await run_io(batch_zip_response, zip_path, results, zip_filename, start_time)
+
+
+@route('/api/uploads', ('POST',), limited=True)
+async def create_upload(request):
+    params = await request.json()
+    if params is None:
+        params = await request.form()
+    kind = params.get('kind', 'extract')
+    if kind not in ('compress', 'extract'):
+        return error(400, 'kind must be compress or extract')
+    size = params.get('size')
+    try:
+        size = int(size) if size not in (None, '') else None
+    except ValueError:
+        return error(400, 'invalid size')
+    upload = await run_io(upload_store.create, kind, params.get('filename', ''), size, request.remote_addr)
+    logger.info(f"[{request.remote_addr}] Created {kind} upload {upload.id} (size: {size})")
+    return json_response(upload.status(), 201, {'Location': f'/api/uploads/{upload.id}', 'Upload-Offset': '0'})
+
+
+@route('/api/uploads/<upload_id>', ('PUT', 'PATCH'))
+async def put_upload_chunk(request, upload_id):
+    """
+    Append the body at the committed offset. It is written in spool_size
+    pieces as it arrives, each committed, so a dropped connection resumes
+    from the last piece.
+    """
+    offset = request.headers.get('upload-offset', request.args.get('offset'))
+    try:
+        offset = int(offset)
+    except (TypeError, ValueError):
+        return error(400, 'Upload-Offset header or offset parameter required')
+    upload = upload_store.get(upload_id)
+    if offset != upload.offset:
+        raise UploadError(f"Offset mismatch: expected {upload.offset}", 409, upload.offset)
+
+    pending = bytearray()
+    try:
+        async for data in request.chunks():
+            pending += data
+            if len(pending) >= spool_size:
+                upload = await run_io(upload_store.write_chunk, upload_id, offset, io.BytesIO(pending))
+                offset, pending = upload.offset, bytearray()
+    except ClientDisconnected:
+        # Keep what arrived, so the client resumes from there
+        if pending:
+            await run_io(upload_store.write_chunk, upload_id, offset, io.BytesIO(pending))
+        raise
+    upload = await run_io(upload_store.write_chunk, upload_id, offset, io.BytesIO(pending))
+    logger.debug(f"Upload {upload_id}: committed {upload.offset} bytes")
+    return json_response(upload.status(), 200, {'Upload-Offset': str(upload.offset)})
+
+
+@route('/api/uploads/<upload_id>', ('GET',))
+async def get_upload_status(request, upload_id):
+    upload = upload_store.get(upload_id)
+    return json_response(upload.status(), 200, {'Upload-Offset': str(upload.offset)})
+
+
+@route('/api/uploads/<upload_id>', ('DELETE',))
+async def delete_upload(request, upload_id):
+    await run_io(upload_store.discard, upload_id)
+    return json_response({'status': 'deleted'})
+
+
+def finalize_job(upload, temp_dir, form, compression_method, auto_target, password, token):
+    """Run a finalized upload's compress or extract job; returns (output_path, mimetype, output_filename)."""
+    if upload.kind == 'compress':
+        input_dir = os.path.join(temp_dir, 'input')
+        server.unpack_upload(upload.path, upload.filename, input_dir, form.get('unpack', 'true').lower() == 'true')
+        enable_limit = form.get('enable_limit', 'true').lower() == 'true'
+        output_filename = f'compressed_{int(time.time())}.png'
+        output_path = os.path.join(temp_dir, output_filename)
+        server.run_encode(input_dir, output_path, compression_method, enable_limit, password, token, auto_target=auto_target)
+        return output_path, 'image/png', output_filename
+    input_png = os.path.join(temp_dir, 'input.png')
+    os.replace(upload.path, input_png)
+    output_filename = f'extracted_{int(time.time())}.zip'
+    output_path = os.path.join(temp_dir, output_filename)
+    extract_to_zip(input_png, os.path.join(temp_dir, 'output'), output_path, password, token)
+    return output_path, 'application/zip', output_filename
+
+
+@route('/api/uploads/<upload_id>/finalize', ('POST',), limited=True)
+async def finalize_upload(request, upload_id):
+    start_time = time.time()
+    form = await request.form()
+    upload = upload_store.get(upload_id)
+    if not upload.complete:
+        return json_response({'error': f'Upload incomplete: {upload.offset}/{upload.size} bytes', 'offset': upload.offset}, 409)
+    expected_sha256 = form.get('sha256')
+    if expected_sha256 and not hmac.compare_digest(expected_sha256.lower(), upload.sha256):
+        return json_response({'error': 'sha256 mismatch', 'sha256': upload.sha256}, 422)
+    compression_method = form.get('compression_method', 'zlib')
+    if upload.kind == 'compress' and compression_method not in ALLOWED_METHODS:
+        return error(400, 'invalid compression method')
+    auto_target = read_auto_target(form)
+
+    # Refused while a chunk is still being written, or if data arrived since the checks above
+    upload = upload_store.pop(upload_id, upload.offset)
+    temp_dir = request.mkdtemp(f'{upload.kind}_')
+    logger.info(f"[{request.remote_addr}] Finalizing {upload.kind} upload {upload.id} ({upload.offset} bytes). Temp dir: {temp_dir}")
+    try:
+        output_path, mimetype, output_filename = await run_job(
+            finalize_job, upload, temp_dir, form, compression_method, auto_target, form.get('password') or None,
+            request.cancel_token())
+    except (OperationCancelled, HTTPError, UploadError):
+        raise
+    except Exception as e:
+        logger.error(f"Error finalizing upload {upload.id}: {e}", exc_info=True)
+        return error(500, 'Internal Server Error' if upload.kind == 'compress' else str(e))
+    finally:
+        upload_store.release(upload)
+    logger.info(f"Upload {upload.id} job completed in {time.time() - start_time:.2f}s")
+    return file_response(output_path, mimetype, output_filename)
+
+
+def match(request):
+    """(route, path params) for the request, or (None, None). A path match with the wrong method returns the first route for that path."""
+    first = None
+    for candidate in routes:
+        found = candidate.pattern.match(request.path)
+        if found:
+            if request.method in candidate.methods or request.method == 'OPTIONS':
+                return candidate, found.groupdict()
+            first = first or (candidate, found.groupdict())
+    return first or (None, None)
+
+
+def allowed_methods(path):
+    return sorted({m for r in routes if r.pattern.match(path) for m in r.methods} | {'OPTIONS'})
+
+
+async def handle(request, matched, params):
+    if matched is None:
+        return error(404, 'Not found')
+    if request.method == 'OPTIONS':
+        # CORS preflight, as flask-cors answers it
+        return Response(mimetype='text/plain', headers={
+            'Allow': ', '.join(allowed_methods(request.path)),
+            'Access-Control-Allow-Methods': ', '.join(allowed_methods(request.path)),
+            'Access-Control-Allow-Headers': request.headers.get('access-control-request-headers', '*'),
+        })
+    if request.method not in matched.methods:
+        return Response(json.dumps({'error': 'Method not allowed'}).encode(), 405,
+                        headers={'Allow': ', '.join(allowed_methods(request.path))})
+    if matched.limited:
+        for limit in rate_limits:
+            if not rate_limiter.hit(limit, matched.rule, request.remote_addr):
+                return error(429, f'Rate limit exceeded: {limit}')
+    if matched.auth and API_KEY:
+        provided_key = request.headers.get('x-api-key')
+        if not provided_key:
+            logger.warning(f"Unauthorized access attempt from {request.remote_addr}")
+            return error(401, 'API key required. Provide X-API-Key header.')
+        if not hmac.compare_digest(provided_key, API_KEY):
+            logger.warning(f"Invalid API key from {request.remote_addr}")
+            return error(401, 'Invalid API key')
+    try:
+        return await matched.handler(request, **params)
+    except HTTPError as e:
+        return json_response({'error': str(e)}, e.status, e.headers)
+    except UploadError as e:
+        return upload_error_response(e)
+    except ClientDisconnected:
+        logger.warning(f"[{request.remote_addr}] Client disconnected during upload")
+        return error(499, 'client disconnected')
+    except OperationCancelled as e:
+        return cancelled_response(request, e)
+    except Exception as e:
+        logger.error(f"Error in {matched.rule}: {e}", exc_info=True)
+        return error(500, str(e) if matched.expose_errors else 'Internal Server Error')
+
+
+async def send_response(send, request, response, endpoint):
+    headers = dict(response.headers)
+    headers['Content-Type'] = response.mimetype
+    if 'origin' in request.headers:
+        headers['Access-Control-Allow-Origin'] = '*'
+    if response.path is not None:
+        headers['Content-Length'] = str(os.path.getsize(response.path))
+    elif response.chunks is None:
+        headers['Content-Length'] = str(len(response.body))
+    await send({'type': 'http.response.start', 'status': response.status,
+                'headers': [(k.lower().encode('latin-1'), str(v).encode('latin-1')) for k, v in headers.items()]})
+
+    async def body():
+        if request.method == 'HEAD':
+            return
+        if response.path is not None:
+            f = await run_io(open, response.path, 'rb')
+            try:
+                while True:
+                    chunk = await run_io(f.read, send_size)
+                    if not chunk:
+                        return
+                    yield chunk
+            finally:
+                f.close()
+        elif response.chunks is not None:
+            async for chunk in response.chunks:
+                yield chunk
+        elif response.body:
+            yield response.body
+
+    chunks = body()
+    request.watch_disconnect()
+    try:
+        async for chunk in chunks:
+            # send() waits while the socket's buffer is full, so a slow reader only holds this coroutine
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            http_bytes_out.inc(len(chunk), endpoint=endpoint)
+            if request.disconnected:
+                break
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        await chunks.aclose()
+        if response.chunks is not None:
+            await response.chunks.aclose()
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            server.preload_codecs()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """The ASGI application."""
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    started = time.perf_counter()
+    request = Request(scope, receive)
+    matched, params = match(request)
+    endpoint = matched.rule if matched else 'unmatched'
+    http_in_flight.inc()
+    http_bytes_in.inc(request.content_length or 0, endpoint=endpoint)
+    try:
+        response = await handle(request, matched, params)
+        http_latency.observe(time.perf_counter() - started, endpoint=endpoint)
+        http_requests.inc(endpoint=endpoint, method=request.method, status=response.status)
+        await send_response(send, request, response, endpoint)
+    finally:
+        request.close()
+        http_in_flight.dec()
+        for temp_dir in request.temp_dirs:
+            io_pool.submit(shutil.rmtree, temp_dir, True)
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("The async server runs on uvicorn: pip install uvicorn")
+    print(f"Starting File Compressor API (asyncio) on http://0.0.0.0:{PORT}")
+    if API_KEY:
+        print("✓ API authentication enabled")
+    else:
+        print("⚠ WARNING: No API_KEY environment variable set - server is UNPROTECTED!")
+        print("  Set API_KEY environment variable to enable authentication")
+    # uvicorn re-raises SIGTERM after its shutdown; exit normally so atexit removes TEMP_ROOT
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    uvicorn.run(app, host='0.0.0.0', port=PORT, log_level='warning', backlog=4096)
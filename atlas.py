@@ -0,0 +1,322 @@
+import io
+import os
+import json
+import struct
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from cancellation import check_cancelled
+from autoselect import METHOD_CODECS, ZIP_TYPES
+from readahead import scan_tree
+from pipeline import SpillBuffer, PixelSource
+from pngio import write_png
+from decoder import open_payload, _member_path
+
+# Header compression method of atlas images (the decoder refuses to unzip these)
+ATLAS_METHOD = 'atlas'
+ATLAS_MAGIC = b'imgfile-atlas\x00'
+INDEX_LENGTH = struct.Struct('>I')
+INDEX_VERSION = 1
+# Index rows are lists in this order, to keep the index small for many entries
+INDEX_FIELDS = ['name', 'offset', 'size', 'folder_name', 'compression_method', 'password_info', 'file_count']
+
+# Entries archived at once by pack_atlas's threads
+pack_batch_size = 256
+
+
+class _Concat:
+    """read() over a bytes prefix followed by a SpillBuffer."""
+
+    def __init__(self, head, rest):
+        self._head = memoryview(head)
+        self._rest = rest
+
+    def read(self, n):
+        out = bytearray(self._head[:n])
+        self._head = self._head[len(out):]
+        if len(out) < n:
+            out += self._rest.read(n - len(out))
+        return out
+
+
+def _archive(source, compression_type, compresslevel):
+    """ZIP bytes for one entry: a folder, a single file, or (member name, bytes) pairs. Returns (zip, file count)."""
+    buffer = io.BytesIO()
+    count = 0
+    with zipfile.ZipFile(buffer, 'w', compression_type, compresslevel=compresslevel) as zipf:
+        if isinstance(source, (str, os.PathLike)):
+            path = os.fspath(source)
+            if os.path.isdir(path):
+                for file_path, arcname, _ in scan_tree(path):
+                    zipf.write(file_path, arcname)
+                    count += 1
+            else:
+                zipf.write(path, os.path.basename(path))
+                count = 1
+        else:
+            for name, data in (source.items() if hasattr(source, 'items') else source):
+                zipf.writestr(name, data)
+                count += 1
+    return buffer.getvalue(), count
+
+
+def _folder_name(name, source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.basename(os.path.normpath(os.fspath(source)))
+    return name
+
+
+def _default_name(output_png):
+    path = getattr(output_png, 'name', output_png)
+    if isinstance(path, (str, os.PathLike)):
+        return os.path.splitext(os.path.basename(os.fspath(path)))[0]
+    return 'atlas'
+
+
+def _write_atlas(output_png, name, entries, blobs, enable_max_limit=True, workers=None):
+    """Write the index plus the blob area (a SpillBuffer) as an atlas image."""
+    import encoder
+    index = json.dumps({'version': INDEX_VERSION, 'fields': INDEX_FIELDS,
+                        'entries': [[entry[field] for field in INDEX_FIELDS] for entry in entries]},
+                       separators=(',', ':')).encode()
+    head = ATLAS_MAGIC + INDEX_LENGTH.pack(len(index)) + index
+    data_length = len(head) + blobs.size
+    metadata = f"{name}\x00{data_length}\x00{ATLAS_METHOD}\x00none\x00".encode()
+    width, height = encoder.image_dimensions(metadata, data_length)
+    if enable_max_limit:
+        if data_length > encoder.max_data_size:
+            raise ValueError(f"Atlas data ({data_length} bytes) exceeds the maximum of {encoder.max_data_size} bytes; "
+                             f"split the entries over several atlases")
+        if max(width, height) > encoder.max_size:
+            raise ValueError(f"Atlas image would be too large ({width}x{height} pixels)")
+    pixels = PixelSource(metadata, _Concat(head, blobs), width * height * 4)
+    write_png(output_png, width, height, pixels, workers=workers or encoder.encode_workers)
+
+
+def pack_atlas(entries, output_png, compression_method='zlib', password=None, compression_level=None,
+               enable_max_limit=True, name=None, cancel_token=None, progress_callback=None, memory_limit=None):
+    """
+    Encode many small archives into one atlas image. entries is an iterable
+    of (name, source) where source is a folder, a file, or a mapping or
+    iterable of (member name, bytes). Each entry becomes the same payload a
+    single encode would produce (a ZIP, or salt + Fernet token when
+    password is given), so AtlasReader can hand any one of them back
+    without touching the others. Entries are zipped on encoder.encode_workers
+    threads and the key is derived once per atlas. Returns the index.
+    """
+    import encoder
+    if compression_method not in METHOD_CODECS:
+        raise ValueError(f"Unsupported compression method for an atlas: {compression_method}")
+    compression_type = ZIP_TYPES[METHOD_CODECS[compression_method]]
+    compresslevel = 1 if compression_level is None else compression_level
+    fernet = salt = None
+    if password:
+        from cryptography.fernet import Fernet
+        from pipeline import derive_key
+        salt = os.urandom(16)
+        fernet = Fernet(derive_key(password, salt))
+    password_info = 'encrypted' if password else 'none'
+
+    def build(item):
+        entry_name, source = item
+        data, count = _archive(source, compression_type, compresslevel)
+        if fernet:
+            data = salt + fernet.encrypt(data)
+        return entry_name, _folder_name(entry_name, source), data, count
+
+    total = len(entries) if hasattr(entries, '__len__') else None
+    index = []
+    seen = set()
+    blobs = SpillBuffer(memory_limit)
+    try:
+        with ThreadPoolExecutor(encoder.encode_workers, thread_name_prefix='atlas') as pool:
+            batch = []
+            items = iter(entries)
+            while True:
+                batch.clear()
+                for item in items:
+                    if item[0] in seen:
+                        raise ValueError(f"Duplicate atlas entry name: {item[0]}")
+                    seen.add(item[0])
+                    batch.append(item)
+                    if len(batch) >= pack_batch_size:
+                        break
+                if not batch:
+                    break
+                check_cancelled(cancel_token)
+                for entry_name, folder_name, data, count in pool.map(build, batch):
+                    index.append({'name': entry_name, 'offset': blobs.size, 'size': len(data), 'folder_name': folder_name,
+                                  'compression_method': compression_method, 'password_info': password_info,
+                                  'file_count': count})
+                    blobs.append(data)
+                if progress_callback and total:
+                    progress_callback(len(index) / total * 100, f'Packed {len(index)}/{total} entries')
+        check_cancelled(cancel_token)
+        _write_atlas(output_png, name or _default_name(output_png), index, blobs, enable_max_limit)
+    finally:
+        blobs.close()
+    return index
+
+
+class AtlasReader:
+    """
+    Random access to the entries of an atlas image (or path to one). Only the
+    rows holding the index are decoded on open; reading an entry decodes the
+    image only as far as that entry, and read_many() visits entries in
+    image order so any number of them cost one pass.
+    """
+
+    def __init__(self, img_path, cancel_token=None, memory_limit=None):
+        header, _, self._payload = open_payload(img_path, cancel_token=cancel_token, memory_limit=memory_limit)
+        try:
+            if header['compression_method'] != ATLAS_METHOD:
+                raise ValueError("Not an atlas image")
+            if self._payload.read(len(ATLAS_MAGIC)) != ATLAS_MAGIC:
+                raise ValueError("Atlas index is missing or damaged")
+            length, = INDEX_LENGTH.unpack(self._payload.read(INDEX_LENGTH.size))
+            index = json.loads(self._payload.read(length))
+            if index.get('version') != INDEX_VERSION:
+                raise ValueError(f"Unsupported atlas version: {index.get('version')}")
+        except BaseException:
+            self._payload.close()
+            raise
+        self.name = header['folder_name']
+        self._base = len(ATLAS_MAGIC) + INDEX_LENGTH.size + length
+        fields = index['fields']
+        self.entries = {}
+        for row in index['entries']:
+            entry = dict(zip(fields, row))
+            self.entries[entry['name']] = entry
+        self._fernets = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._payload.close()
+
+    def names(self):
+        return list(self.entries)
+
+    def _entry(self, name):
+        try:
+            return self.entries[name]
+        except KeyError:
+            raise KeyError(f"No atlas entry named {name!r}") from None
+
+    def read(self, name):
+        """The raw payload of one entry (ZIP bytes, or salt + token when encrypted)."""
+        entry = self._entry(name)
+        self._payload.seek(self._base + entry['offset'])
+        data = self._payload.read(entry['size'])
+        if len(data) != entry['size']:
+            raise ValueError(f"Atlas entry {name!r} is truncated")
+        return data
+
+    def read_many(self, names=None):
+        """Yield (name, raw payload) for names (default: all) in image order."""
+        entries = sorted((self._entry(name) for name in (self.entries if names is None else names)),
+                         key=lambda entry: entry['offset'])
+        for entry in entries:
+            yield entry['name'], self.read(entry['name'])
+
+    def _decrypt(self, data, password):
+        if not password:
+            raise ValueError("Password required for encrypted archive")
+        from cryptography.fernet import Fernet
+        from pipeline import derive_key
+        # Entries packed together share a salt, so the key is derived once
+        key = (password, bytes(data[:16]))
+        if key not in self._fernets:
+            self._fernets[key] = Fernet(derive_key(password, key[1]))
+        return self._fernets[key].decrypt(bytes(data[16:]))
+
+    def archive(self, name, password=None):
+        """The ZIP bytes of one entry, decrypted if needed."""
+        data = self.read(name)
+        if self._entry(name)['password_info'] == 'encrypted':
+            data = self._decrypt(data, password)
+        return data
+
+    def open(self, name, password=None):
+        """A ZipFile over one entry."""
+        return zipfile.ZipFile(io.BytesIO(self.archive(name, password)), 'r')
+
+    def extract(self, name, output_folder, password=None):
+        """Extract one entry into output_folder. Returns the member names."""
+        with self.open(name, password) as zipf:
+            zipf.extractall(output_folder)
+            return zipf.namelist()
+
+    def extract_all(self, output_dir, names=None, password=None, cancel_token=None):
+        """Extract entries (default: all) in one pass, each into output_dir/<entry name>. Yields each name when done."""
+        for name, data in self.read_many(names):
+            check_cancelled(cancel_token)
+            if self.entries[name]['password_info'] == 'encrypted':
+                data = self._decrypt(data, password)
+            with zipfile.ZipFile(io.BytesIO(data), 'r') as zipf:
+                zipf.extractall(_member_path(output_dir, name))
+            yield name
+
+
+def compact_atlas(sources, output_png, remove=(), name=None, enable_max_limit=True, cancel_token=None, memory_limit=None):
+    """
+    Merge atlases and plain encoded images into one atlas, copying every
+    entry's bytes as they are: nothing is recompressed or decrypted, so no
+    password is needed. A plain image becomes one entry named after its
+    file. Entries from later sources replace same-named ones from earlier
+    sources, and names in remove are dropped. output_png may be one of the
+    sources; it is replaced only once the new atlas is complete. Returns the index.
+    """
+    from watch import replace_output
+    remove = set(remove)
+    # Find which source each surviving entry comes from before copying anything
+    winners = {}
+    for position, source in enumerate(sources):
+        check_cancelled(cancel_token)
+        header, _, payload = open_payload(source, cancel_token=cancel_token, memory_limit=memory_limit)
+        payload.close()
+        if header['compression_method'] == ATLAS_METHOD:
+            with AtlasReader(source, cancel_token, memory_limit) as reader:
+                for entry in reader.entries.values():
+                    winners[entry['name']] = (position, entry)
+        else:
+            entry_name = _default_name(source)
+            winners[entry_name] = (position, {
+                'name': entry_name, 'offset': None, 'size': header['data_size'],
+                'folder_name': header['folder_name'], 'compression_method': header['compression_method'],
+                'password_info': header['password_info'], 'file_count': None})
+    for entry_name in remove:
+        winners.pop(entry_name, None)
+
+    index = []
+    blobs = SpillBuffer(memory_limit)
+    try:
+        for position, source in enumerate(sources):
+            wanted = [entry for (where, entry) in winners.values() if where == position]
+            if not wanted:
+                continue
+            check_cancelled(cancel_token)
+            if wanted[0]['offset'] is None:
+                # A plain image's whole payload is the entry
+                _, _, payload = open_payload(source, cancel_token=cancel_token, memory_limit=memory_limit)
+                index.append(dict(wanted[0], offset=blobs.size))
+                with payload:
+                    while True:
+                        block = payload.read(1024 * 1024)
+                        if not block:
+                            break
+                        blobs.append(block)
+                continue
+            with AtlasReader(source, cancel_token, memory_limit) as reader:
+                for entry_name, data in reader.read_many([entry['name'] for entry in wanted]):
+                    index.append(dict(reader.entries[entry_name], offset=blobs.size))
+                    blobs.append(data)
+        check_cancelled(cancel_token)
+        name = name or _default_name(output_png)
+        replace_output(output_png, lambda path: _write_atlas(path, name, index, blobs, enable_max_limit))
+    finally:
+        blobs.close()
+    return index
@@ -0,0 +1,201 @@
+import io
+import time
+import bisect
+import random
+import zipfile
+from cancellation import check_cancelled
+from readahead import scan_tree
+
+# (method, compresslevel) pairs tried by the 'auto' method. zipfile ignores the
+# level for LZMA, so it is tried once.
+CANDIDATES = [('zlib', 1), ('zlib', 6), ('zlib', 9), ('bz2', 1), ('bz2', 9), ('lzma', None)]
+ZIP_TYPES = {'zlib': zipfile.ZIP_DEFLATED, 'bz2': zipfile.ZIP_BZIP2, 'lzma': zipfile.ZIP_LZMA}
+# Codec behind each user-facing method name (the zip_* names are aliases)
+METHOD_CODECS = {'lzma': 'lzma', 'zip_lzma': 'lzma', 'bz2': 'bz2', 'zip_bz2': 'bz2', 'zlib': 'zlib'}
+DEFAULT_TARGET = 'fastest:10%'
+
+# The sample is sample_fraction of the folder, clamped to [sample_floor, sample_budget]
+sample_fraction = 0.05
+sample_floor = 512 * 1024
+sample_budget = 4 * 1024 * 1024
+sample_chunk = 64 * 1024
+# Rough fixed cost of adding one member (stat, open, headers)
+per_file_seconds = 0.0001
+# Local header + central directory entry + data descriptor, excluding the name
+member_overhead = 30 + 46 + 16
+
+
+def parse_target(text):
+    """
+    'fastest:10%'  -> fastest candidate whose size is within 10% of the smallest
+    'smallest:30s' -> smallest candidate expected to finish within 30 seconds
+    Returns (goal, limit).
+    """
+    goal, _, limit = (text or DEFAULT_TARGET).strip().lower().partition(':')
+    try:
+        if goal == 'fastest' and limit.endswith('%'):
+            return goal, float(limit[:-1]) / 100
+        if goal == 'smallest' and limit.endswith('s'):
+            return goal, float(limit[:-1])
+    except ValueError:
+        pass
+    raise ValueError(f"Invalid auto target '{text}'. Use 'fastest:<N>%' or 'smallest:<N>s'")
+
+
+def label(method, level):
+    return method if level is None else f'{method}-{level}'
+
+
+def scan_folder(folder_path):
+    """(path, arcname, size) for every file, in the order the encoder adds them."""
+    return [(path, arcname, st.st_size) for path, arcname, st in scan_tree(folder_path)]
+
+
+def read_sample(files, budget=None, chunk=None):
+    """
+    Sample of the folder's bytes, picked by evenly spaced byte positions so
+    each file's chance of being picked is proportional to its size. A pick
+    reads the whole file if it is at most one chunk, else one chunk around the
+    position. Positions are visited in shuffled order until the budget is
+    read. Returns (pieces, sampled_bytes, total_bytes); when sampled_bytes ==
+    total_bytes the pieces are the whole folder.
+    """
+    chunk = chunk or sample_chunk
+    total = sum(size for _, _, size in files)
+    budget = budget or int(min(sample_budget, max(sample_floor, total * sample_fraction)))
+    if total <= budget:
+        pieces = []
+        for path, arcname, _ in files:
+            with open(path, 'rb') as f:
+                pieces.append((arcname, f.read()))
+        return pieces, total, total
+
+    starts = []
+    offset = 0
+    for _, _, size in files:
+        starts.append(offset)
+        offset += size
+    # With many small files, use more positions so the budget still fills
+    count = max(1, min(4096, budget // max(1024, min(chunk, total // len(files)))))
+    order = list(range(count))
+    random.Random(count).shuffle(order)
+    pieces = []
+    seen = set()
+    sampled = 0
+    for j in order:
+        if sampled >= budget:
+            break
+        position = int((j + 0.5) * total / count)
+        index = bisect.bisect_right(starts, position) - 1
+        path, arcname, size = files[index]
+        start = max(0, min(position - starts[index], size - chunk))
+        if (index, start) in seen:
+            continue
+        seen.add((index, start))
+        with open(path, 'rb') as f:
+            f.seek(start)
+            data = f.read(chunk)
+        pieces.append((f'{arcname}@{start}', data))
+        sampled += len(data)
+    return pieces, sampled, total
+
+
+def sample_ratio(sizes, sampled, total):
+    """
+    Compressed/raw ratio for the folder from per-piece (raw, compressed) sizes.
+    A full census is exact; otherwise pieces were picked with probability
+    proportional to size, so the plain mean of their ratios is unbiased.
+    """
+    if not sampled:
+        return 1.0
+    if sampled >= total:
+        return sum(c for _, c in sizes) / sampled
+    ratios = [c / r for r, c in sizes if r]
+    return sum(ratios) / len(ratios)
+
+
+def zip_overhead(files):
+    """ZIP bytes spent on headers for these files (names stored twice) plus the end record."""
+    names = sum(len(arcname.encode()) for _, arcname, _ in files)
+    return len(files) * member_overhead + 2 * names + 22
+
+
+def zip_sample(pieces, method, level):
+    """
+    Zip the sample exactly as the encoder would. Returns (zip bytes,
+    [(raw, compressed) per piece], seconds).
+    """
+    buffer = io.BytesIO()
+    start = time.perf_counter()
+    with zipfile.ZipFile(buffer, 'w', ZIP_TYPES[method], compresslevel=level) as zipf:
+        for name, data in pieces:
+            zipf.writestr(name, data)
+    elapsed = time.perf_counter() - start
+    sizes = [(info.file_size, info.compress_size) for info in zipf.infolist()]
+    return buffer.getvalue(), sizes, elapsed
+
+
+def compress_sample(pieces, method, level):
+    """Returns ([(raw, compressed) per piece], seconds) for the sample."""
+    _, sizes, elapsed = zip_sample(pieces, method, level)
+    return sizes, elapsed
+
+
+def parallel_seconds(seconds, files, workers):
+    """
+    Wall time of seconds of compression spread over workers threads, one
+    member per thread: the largest member can't be split, so it bounds the
+    speedup.
+    """
+    total = sum(size for _, _, size in files)
+    if workers <= 1 or not total:
+        return seconds
+    largest = max(size for _, _, size in files)
+    return seconds * max(1 / workers, largest / total)
+
+
+def estimate_candidates(folder_path, candidates=None, files=None, cancel_token=None, workers=1):
+    """
+    Compress a sample with each candidate and extrapolate to the whole folder.
+    Returns one dict per candidate: method, level, label, size (estimated ZIP
+    bytes), seconds (estimated compression time on workers threads) and ratio.
+    """
+    files = scan_folder(folder_path) if files is None else files
+    pieces, sampled, total = read_sample(files)
+    overhead = zip_overhead(files)
+    estimates = []
+    for method, level in candidates or CANDIDATES:
+        check_cancelled(cancel_token)
+        sizes, seconds = compress_sample(pieces, method, level)
+        ratio = sample_ratio(sizes, sampled, total)
+        scale = total / sampled if sampled else 0
+        estimates.append({
+            'method': method,
+            'level': level,
+            'label': label(method, level),
+            'size': int(ratio * total) + overhead,
+            'seconds': parallel_seconds(seconds * scale, files, workers) + len(files) * per_file_seconds,
+            'ratio': ratio,
+        })
+    return estimates
+
+
+def pick(estimates, target=None):
+    """Apply a target (see parse_target) to candidate estimates."""
+    goal, limit = parse_target(target)
+    if goal == 'fastest':
+        best_size = min(e['size'] for e in estimates)
+        eligible = [e for e in estimates if e['size'] <= best_size * (1 + limit)]
+        return min(eligible, key=lambda e: e['seconds'])
+    eligible = [e for e in estimates if e['seconds'] <= limit]
+    if not eligible:
+        # Nothing fits the time budget, so the fastest option is the closest
+        return min(estimates, key=lambda e: e['seconds'])
+    return min(eligible, key=lambda e: e['size'])
+
+
+def choose_method(folder_path, target=None, candidates=None, cancel_token=None, files=None, workers=1):
+    """Returns (chosen estimate, all estimates) for the folder under target."""
+    parse_target(target)  # fail fast before sampling
+    estimates = estimate_candidates(folder_path, candidates, files, cancel_token, workers)
+    return pick(estimates, target), estimates
@@ -0,0 +1,198 @@
+"""
+Encode/decode benchmark over deterministic synthetic corpora.
+
+Every operation runs in a fresh process so its peak RSS is its own.
+
+    python benchmarks/bench.py                          # full matrix, writes benchmarks/results/latest.json
+    python benchmarks/bench.py --scale 0.1 --method zlib
+    python benchmarks/bench.py --compare baseline.json  # exit 1 on regressions
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+import multiprocessing
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HERE)
+sys.path.insert(0, REPO)
+
+from colorama import Fore, Style, init
+from corpora import GENERATORS, ensure_corpus, corpus_size
+
+METHODS = ['lzma', 'bz2', 'zlib', 'zip_lzma', 'zip_bz2']
+OPERATIONS = ['encode', 'info', 'decode']
+PASSWORD = 'benchmark-password'
+
+
+def _run_operation(op, corpus_path, png_path, output_dir, method, password):
+    """Runs in a child process: time one operation and sample its memory."""
+    from profiling import current_rss, peak_rss
+    from encoder import encode_folder_to_png
+    from decoder import decode_png_to_folder, get_decode_info
+
+    quiet = lambda *args: None
+    start_rss = current_rss()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        if op == 'encode':
+            encode_folder_to_png(corpus_path, png_path, method, enable_max_limit=False, password=password, log_callback=quiet)
+        elif op == 'info':
+            get_decode_info(png_path)
+        else:
+            decode_png_to_folder(png_path, output_dir, password=password, log_callback=quiet)
+        elapsed = time.perf_counter() - start
+    return {'wall_seconds': elapsed, 'start_rss': start_rss, 'peak_rss': peak_rss()}
+
+
+def run_isolated(ctx, *args):
+    with ctx.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(_run_operation, args)
+
+
+def case_key(case):
+    return '/'.join([case['corpus'], case['method'], 'password' if case['password'] else 'plain', case['operation']])
+
+
+def run_matrix(args):
+    ctx = multiprocessing.get_context('spawn')
+    corpus_dir = os.path.abspath(args.corpus_dir)
+    os.makedirs(corpus_dir, exist_ok=True)
+    work = tempfile.mkdtemp(prefix='imgfile_bench_')
+    cases = []
+    try:
+        for corpus in args.corpus:
+            print(Fore.CYAN + f"Preparing corpus {corpus} (scale {args.scale})" + Style.RESET_ALL)
+            path = ensure_corpus(corpus, corpus_dir, args.scale)
+            raw_bytes = corpus_size(path)
+            for method in args.method:
+                for password in ([None, PASSWORD] if args.password == 'both' else [PASSWORD] if args.password == 'yes' else [None]):
+                    png_path = os.path.join(work, f'{corpus}_{method}.png')
+                    for op in args.operation:
+                        runs = []
+                        for _ in range(args.repeat):
+                            output_dir = os.path.join(work, 'out')
+                            if op != 'encode' and not os.path.exists(png_path):
+                                # info/decode need an image even when encode isn't being measured
+                                run_isolated(ctx, 'encode', path, png_path, None, method, password)
+                            runs.append(run_isolated(ctx, op, path, png_path, output_dir, method, password))
+                            shutil.rmtree(output_dir, ignore_errors=True)
+                        png_bytes = os.path.getsize(png_path)
+                        input_bytes = png_bytes if op == 'info' else raw_bytes
+                        wall = min(r['wall_seconds'] for r in runs)
+                        case = {
+                            'corpus': corpus,
+                            'method': method,
+                            'password': password is not None,
+                            'operation': op,
+                            'input_bytes': input_bytes,
+                            'png_bytes': png_bytes,
+                            'ratio': png_bytes / raw_bytes if raw_bytes else None,
+                            'wall_seconds': wall,
+                            'mb_per_s': input_bytes / (1024 * 1024) / wall if wall else None,
+                            'peak_rss': max(r['peak_rss'] or 0 for r in runs) or None,
+                            'start_rss': min(r['start_rss'] or 0 for r in runs) or None,
+                            'runs': [r['wall_seconds'] for r in runs],
+                        }
+                        cases.append(case)
+                        print(format_case(case))
+                    if os.path.exists(png_path):
+                        os.remove(png_path)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    return cases
+
+
+def format_case(case):
+    rate = f"{case['mb_per_s']:8.2f} MB/s" if case['mb_per_s'] else '       - MB/s'
+    rss = f"{case['peak_rss'] / (1024 * 1024):7.1f} MB" if case['peak_rss'] else '      - MB'
+    return f"{case_key(case):<44}{case['wall_seconds']:9.3f} s {rate} peak {rss}"
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO, capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results, baseline, threshold, rss_threshold, min_delta):
+    """Return human-readable regressions of results against baseline."""
+    if baseline.get('scale') != results['scale']:
+        print(Fore.YELLOW + f"Warning: baseline was run at scale {baseline.get('scale')}, this run at {results['scale']}" + Style.RESET_ALL)
+    old_cases = {case_key(c): c for c in baseline.get('cases', [])}
+    regressions = []
+    for case in results['cases']:
+        key = case_key(case)
+        old = old_cases.get(key)
+        if not old:
+            continue
+        slower = case['wall_seconds'] / old['wall_seconds'] - 1 if old['wall_seconds'] else 0
+        if slower > threshold and case['wall_seconds'] - old['wall_seconds'] > min_delta:
+            regressions.append(f"{key}: {old['wall_seconds']:.3f}s -> {case['wall_seconds']:.3f}s ({slower:+.1%})")
+        if old.get('peak_rss') and case.get('peak_rss'):
+            grew = case['peak_rss'] / old['peak_rss'] - 1
+            if grew > rss_threshold:
+                regressions.append(f"{key}: peak RSS {old['peak_rss'] / 2**20:.1f} MB -> {case['peak_rss'] / 2**20:.1f} MB ({grew:+.1%})")
+        if old.get('png_bytes') and case['png_bytes'] > old['png_bytes'] * (1 + threshold):
+            regressions.append(f"{key}: output {old['png_bytes']} -> {case['png_bytes']} bytes")
+    missing = sorted(set(old_cases) - {case_key(c) for c in results['cases']})
+    return regressions, missing
+
+
+def main():
+    init()
+    parser = argparse.ArgumentParser(description="Benchmark encode/decode throughput and peak memory")
+    parser.add_argument('--corpus', nargs='+', default=list(GENERATORS), choices=list(GENERATORS), help='Corpora to run')
+    parser.add_argument('--method', nargs='+', default=METHODS, choices=METHODS, help='Compression methods to run')
+    parser.add_argument('--operation', nargs='+', default=OPERATIONS, choices=OPERATIONS, help='Operations to time')
+    parser.add_argument('--password', default='both', choices=['both', 'yes', 'no'], help='Run with a password, without, or both')
+    parser.add_argument('--scale', type=float, default=1.0, help='Corpus size multiplier (1.0 is roughly 4-25 MB per corpus)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per case; the fastest is reported')
+    parser.add_argument('--corpus-dir', default=os.path.join(HERE, '.corpora'), help='Where generated corpora are cached')
+    parser.add_argument('--output', default=os.path.join(HERE, 'results', 'latest.json'), help='JSON results file')
+    parser.add_argument('--compare', metavar='BASELINE', help='Compare against a previous results file and exit 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Allowed slowdown / output growth before flagging (fraction)')
+    parser.add_argument('--rss-threshold', type=float, default=0.20, help='Allowed peak RSS growth before flagging (fraction)')
+    parser.add_argument('--min-delta', type=float, default=0.05, help='Ignore slowdowns smaller than this many seconds')
+    args = parser.parse_args()
+
+    started = time.time()
+    cases = run_matrix(args)
+    results = {
+        'created': started,
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'scale': args.scale,
+        'repeat': args.repeat,
+        'cases': cases,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(Fore.GREEN + f"Results written to {args.output}" + Style.RESET_ALL)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions, missing = compare(results, baseline, args.threshold, args.rss_threshold, args.min_delta)
+        if missing:
+            print(Fore.YELLOW + f"{len(missing)} baseline cases were not run" + Style.RESET_ALL)
+        if regressions:
+            print(Fore.RED + f"{len(regressions)} regression(s) against {args.compare}:" + Style.RESET_ALL)
+            for line in regressions:
+                print(Fore.RED + "  " + line + Style.RESET_ALL)
+            sys.exit(1)
+        print(Fore.GREEN + f"No regressions against {args.compare}" + Style.RESET_ALL)
+
+
+if __name__ == '__main__':
+    main()
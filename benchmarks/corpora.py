@@ -0,0 +1,117 @@
+import os
+import gzip
+import json
+import random
+import shutil
+import struct
+
+# Bump when the generators change so cached corpora are rebuilt
+CORPUS_VERSION = 1
+SEED = 1107
+
+WORDS = (
+    "the of and to in is for on that with as by at from this be are or an it "
+    "file folder image pixel archive compress extract password method header "
+    "data size byte stream chunk offset member index server client request "
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod"
+).split()
+
+
+def random_text(rng, size):
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+        if rng.random() < 0.08:
+            words.append('\n')
+    return ' '.join(words)[:size].encode()
+
+
+def _structured(rng, size):
+    """Record-like binary data: compressible, but not text."""
+    out = bytearray()
+    i = 0
+    while len(out) < size:
+        out += struct.pack('<IIdH', i, rng.randrange(1 << 16), i * 0.5, rng.randrange(64))
+        i += 1
+    return bytes(out[:size])
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def small_text(root, rng, scale):
+    """Many small text files spread over a few directories."""
+    for i in range(max(1, int(2000 * scale))):
+        _write(os.path.join(root, f'dir{i % 20:02d}', f'note{i:05d}.txt'), random_text(rng, rng.randint(200, 4000)))
+
+
+def large_binary(root, rng, scale):
+    """A few large binaries, half random and half structured records."""
+    size = max(64 * 1024, int(8 * 1024 * 1024 * scale))
+    for i in range(3):
+        half = size // 2
+        _write(os.path.join(root, f'blob{i}.bin'), rng.randbytes(half) + _structured(rng, size - half))
+
+
+def compressed_media(root, rng, scale):
+    """Already-compressed files (fake media and real gzip) that no codec can shrink."""
+    headers = {'.jpg': b'\xff\xd8\xff\xe0\x00\x10JFIF\x00', '.mp4': b'\x00\x00\x00\x18ftypmp42', '.png': b'\x89PNG\r\n\x1a\n'}
+    count = max(1, int(20 * scale))
+    for i in range(count):
+        ext = list(headers)[i % len(headers)]
+        _write(os.path.join(root, 'media', f'clip{i:03d}{ext}'), headers[ext] + rng.randbytes(512 * 1024))
+    for i in range(max(1, count // 4)):
+        _write(os.path.join(root, 'logs', f'log{i:03d}.gz'), gzip.compress(random_text(rng, 1024 * 1024), mtime=0))
+
+
+def mixed(root, rng, scale):
+    """A nested project-like tree combining all of the above."""
+    small_text(os.path.join(root, 'docs'), rng, scale / 4)
+    large_binary(os.path.join(root, 'build'), rng, scale / 4)
+    compressed_media(os.path.join(root, 'assets'), rng, scale / 4)
+    for i in range(max(1, int(200 * scale))):
+        depth = os.path.join(*[f'pkg{(i >> s) % 4}' for s in range(0, 8, 2)])
+        _write(os.path.join(root, 'src', depth, f'module{i:04d}.md'), random_text(rng, rng.randint(500, 8000)))
+    _write(os.path.join(root, 'empty.txt'), b'')
+
+
+GENERATORS = {
+    'small_text': small_text,
+    'large_binary': large_binary,
+    'compressed_media': compressed_media,
+    'mixed': mixed,
+}
+
+
+def corpus_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def ensure_corpus(name, base_dir, scale=1.0):
+    """
+    Return the path of corpus name under base_dir, generating it first if it
+    is missing or was built with another scale or generator version. The same
+    name and scale always produce byte-identical files.
+    """
+    path = os.path.join(base_dir, name)
+    stamp_path = os.path.join(base_dir, name + '.json')
+    stamp = {'version': CORPUS_VERSION, 'scale': scale}
+    if os.path.isdir(path) and os.path.exists(stamp_path):
+        with open(stamp_path) as f:
+            if json.load(f) == stamp:
+                return path
+    shutil.rmtree(path, ignore_errors=True)
+    GENERATORS[name](path, random.Random(f'{SEED}:{name}'), scale)
+    with open(stamp_path, 'w') as f:
+        json.dump(stamp, f)
+    return path
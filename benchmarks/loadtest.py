@@ -0,0 +1,368 @@
+"""
+Load generator for the HTTP API. Drives /api/compress, /api/extract and
+/api/info with a weighted mix of requests and payloads from N concurrent
+clients, then reports throughput, latency percentiles, error and 429 rates,
+and the server's RSS over time. Runs fully offline against a local server.
+
+    python benchmarks/loadtest.py --start-server --server-env RATE_LIMIT="1000 per second" -c 8 -d 30
+    python benchmarks/loadtest.py --url http://127.0.0.1:4362 --server-pid 1234 --api-key KEY
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import contextlib
+import http.client
+from urllib.parse import urlsplit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HERE)
+sys.path.insert(0, REPO)
+
+from colorama import Fore, Style, init
+from corpora import random_text
+
+ENDPOINTS = {'compress': '/api/compress', 'extract': '/api/extract', 'info': '/api/info'}
+# name -> (file count, bytes per file)
+PAYLOADS = {'small': (10, 4 * 1024), 'medium': (5, 256 * 1024), 'large': (2, 4 * 1024 * 1024)}
+
+
+def parse_weights(text, choices):
+    """'compress=1,info=3' -> {'compress': 1.0, 'info': 3.0}"""
+    weights = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in choices:
+            raise argparse.ArgumentTypeError(f"unknown '{name}', expected one of {', '.join(choices)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(p / 100 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def process_rss(pid):
+    try:
+        with open(f'/proc/{pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return None
+
+
+def multipart(fields, files):
+    """Encode form fields and (field, filename, bytes) files as multipart/form-data."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, filename, data in files:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode())
+        parts.append(data)
+        parts.append(b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Payloads:
+    """Deterministic request bodies, plus PNGs encoded locally for extract/info."""
+
+    def __init__(self, names, work_dir, method, password):
+        from encoder import encode_folder_to_png
+
+        self.files = {}
+        self.pngs = {}
+        rng = random.Random(1107)
+        for name in names:
+            count, size = PAYLOADS[name]
+            files = []
+            for i in range(count):
+                # Half text, half random bytes so every codec has something to do
+                data = random_text(rng, size // 2) + rng.randbytes(size - size // 2)
+                files.append(('files', f'{name}_{i}.bin', data))
+            self.files[name] = files
+
+            folder = os.path.join(work_dir, name)
+            os.makedirs(folder)
+            for _, filename, data in files:
+                with open(os.path.join(folder, filename), 'wb') as f:
+                    f.write(data)
+            png_path = os.path.join(work_dir, name + '.png')
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                encode_folder_to_png(folder, png_path, method, password=password, log_callback=lambda *a: None)
+            with open(png_path, 'rb') as f:
+                self.pngs[name] = f.read()
+
+    def body(self, op, name, method, password):
+        fields = {}
+        if password:
+            fields['password'] = password
+        if op == 'compress':
+            fields['compression_method'] = method
+            return multipart(fields, self.files[name])
+        return multipart(fields, [('file', f'{name}.png', self.pngs[name])])
+
+
+class LoadTest:
+    def __init__(self, args, payloads):
+        self.args = args
+        self.payloads = payloads
+        url = urlsplit(args.url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.results = []
+        self.rss_samples = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._issued = 0
+
+    def _next_ticket(self):
+        with self._lock:
+            if self.args.requests and self._issued >= self.args.requests:
+                return False
+            self._issued += 1
+            return True
+
+    def request(self, op, payload, api_key):
+        body, content_type = self.payloads.body(op, payload, self.args.method, self.args.password)
+        headers = {'Content-Type': content_type, 'Content-Length': str(len(body))}
+        if api_key:
+            headers['X-API-Key'] = api_key
+        start = time.perf_counter()
+        status, received, error = None, 0, None
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.args.timeout)
+        try:
+            conn.request('POST', ENDPOINTS[op], body=body, headers=headers)
+            response = conn.getresponse()
+            while True:
+                chunk = response.read(64 * 1024)
+                if not chunk:
+                    break
+                received += len(chunk)
+            status = response.status
+        except (OSError, http.client.HTTPException) as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            conn.close()
+        return {
+            'op': op,
+            'payload': payload,
+            'status': status,
+            'error': error,
+            'start': start,
+            'latency': time.perf_counter() - start,
+            'sent': len(body),
+            'received': received,
+        }
+
+    def worker(self, index, deadline):
+        rng = random.Random(self.args.seed + index)
+        ops, op_weights = zip(*self.args.mix.items())
+        payloads, payload_weights = zip(*self.args.payloads.items())
+        keys = self.args.api_key or [None]
+        while not self._stop.is_set() and time.perf_counter() < deadline and self._next_ticket():
+            op = rng.choices(ops, op_weights)[0]
+            payload = rng.choices(payloads, payload_weights)[0]
+            result = self.request(op, payload, keys[(index + len(self.results)) % len(keys)])
+            with self._lock:
+                self.results.append(result)
+
+    def sample_rss(self, pid, origin):
+        while not self._stop.is_set():
+            rss = process_rss(pid)
+            if rss is not None:
+                self.rss_samples.append((time.perf_counter() - origin, rss))
+            self._stop.wait(self.args.sample_interval)
+
+    def run(self, server_pid=None):
+        self.started = time.perf_counter()
+        deadline = self.started + (self.args.duration if self.args.duration else float('inf'))
+        sampler = None
+        if server_pid:
+            sampler = threading.Thread(target=self.sample_rss, args=(server_pid, self.started), daemon=True)
+            sampler.start()
+        workers = [threading.Thread(target=self.worker, args=(i, deadline), daemon=True) for i in range(self.args.concurrency)]
+        for t in workers:
+            t.start()
+        try:
+            for t in workers:
+                while t.is_alive():
+                    t.join(0.5)
+        except KeyboardInterrupt:
+            print(Fore.YELLOW + "\nStopping, waiting for in-flight requests..." + Style.RESET_ALL)
+            self._stop.set()
+            for t in workers:
+                t.join()
+        self.elapsed = time.perf_counter() - self.started
+        self._stop.set()
+        if sampler:
+            sampler.join()
+
+
+def summarize(results, elapsed):
+    latencies = sorted(r['latency'] for r in results)
+    count = len(results)
+    throttled = sum(1 for r in results if r['status'] == 429)
+    errors = sum(1 for r in results if r['error'] or (r['status'] >= 400 and r['status'] != 429))
+    statuses = {}
+    for r in results:
+        key = str(r['status']) if r['status'] is not None else 'error'
+        statuses[key] = statuses.get(key, 0) + 1
+    return {
+        'requests': count,
+        'requests_per_s': count / elapsed if elapsed else None,
+        'mb_sent_per_s': sum(r['sent'] for r in results) / (1024 * 1024) / elapsed if elapsed else None,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'max': latencies[-1] if latencies else None,
+        'error_rate': errors / count if count else 0,
+        'throttled_rate': throttled / count if count else 0,
+        'statuses': statuses,
+    }
+
+
+def report(test):
+    rows = {'all': summarize(test.results, test.elapsed)}
+    for op in ENDPOINTS:
+        subset = [r for r in test.results if r['op'] == op]
+        if subset:
+            rows[op] = summarize(subset, test.elapsed)
+
+    ms = lambda v: f"{v * 1000:.0f}" if v is not None else '-'
+    print(f"\n{'endpoint':<10}{'requests':>9}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>9}{'429s':>8}")
+    for name, row in rows.items():
+        print(f"{name:<10}{row['requests']:>9}{row['requests_per_s']:>8.2f}{ms(row['p50']):>9}{ms(row['p95']):>9}"
+              f"{ms(row['p99']):>9}{row['error_rate']:>9.1%}{row['throttled_rate']:>8.1%}")
+    print(f"Status codes: {rows['all']['statuses']}")
+    failures = [r['error'] for r in test.results if r['error']]
+    if failures:
+        print(Fore.RED + f"{len(failures)} connection errors, e.g. {failures[0]}" + Style.RESET_ALL)
+    if test.rss_samples:
+        values = [rss for _, rss in test.rss_samples]
+        print(f"Server RSS: start {values[0] / 2**20:.1f} MB, peak {max(values) / 2**20:.1f} MB, end {values[-1] / 2**20:.1f} MB")
+
+    # Completed requests per second of the run, to spot stalls and warm-up
+    timeline = {}
+    for r in test.results:
+        second = int(r['start'] + r['latency'] - test.started)
+        timeline[second] = timeline.get(second, 0) + 1
+    return {
+        'summary': rows,
+        'completed_per_second': [timeline.get(s, 0) for s in range(int(test.elapsed) + 1)],
+        'server_rss': [{'t': round(t, 3), 'rss': rss} for t, rss in test.rss_samples],
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, work_dir):
+    """Launch server.py on a free local port with the given env overrides."""
+    port = free_port()
+    env = dict(os.environ, PORT=str(port))
+    for item in args.server_env:
+        key, _, value = item.partition('=')
+        env[key] = value
+    log_path = args.server_log or os.path.join(work_dir, 'server.out')
+    log = open(log_path, 'w')
+    # cwd is the work dir so server.log stays out of the repo
+    proc = subprocess.Popen([sys.executable, os.path.join(REPO, 'server.py')], cwd=work_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    args.url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with code {proc.returncode}, see {log_path}")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/health')
+            if conn.getresponse().status == 200:
+                return proc, log
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"Server did not become healthy within 30s, see {log_path}")
+
+
+def main():
+    init()
+    parser = argparse.ArgumentParser(description="Load-test the File Compressor API")
+    parser.add_argument('--url', default='http://127.0.0.1:4362', help='Base URL of a running server')
+    parser.add_argument('--start-server', action='store_true', help='Launch server.py locally on a free port for the run')
+    parser.add_argument('--server-env', action='append', default=[], metavar='KEY=VALUE', help='Env override for --start-server (repeatable)')
+    parser.add_argument('--server-log', help='Where --start-server writes server output')
+    parser.add_argument('--server-pid', type=int, help='PID of an already running server, to sample its RSS')
+    parser.add_argument('-c', '--concurrency', type=int, default=4, help='Concurrent clients')
+    parser.add_argument('-d', '--duration', type=float, default=30, help='Seconds to run (0 for no limit)')
+    parser.add_argument('-n', '--requests', type=int, help='Stop after this many requests')
+    parser.add_argument('--mix', default='compress=1,extract=1,info=2', type=lambda v: parse_weights(v, ENDPOINTS), help='Endpoint weights')
+    parser.add_argument('--payloads', default='small=6,medium=3,large=1', type=lambda v: parse_weights(v, PAYLOADS), help='Payload size weights')
+    parser.add_argument('--method', default='zlib', help='compression_method sent to /api/compress and used for extract/info images')
+    parser.add_argument('--password', help='Password for compress requests and the extract/info images')
+    parser.add_argument('--api-key', action='append', help='X-API-Key to send; repeat to rotate several keys across clients')
+    parser.add_argument('--timeout', type=float, default=120, help='Per-request timeout in seconds')
+    parser.add_argument('--sample-interval', type=float, default=0.5, help='Seconds between server RSS samples')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the request mix')
+    parser.add_argument('--output', help='Write config, summary and timelines as JSON')
+    parser.add_argument('--max-error-rate', type=float, help='Exit 1 if the error rate (excluding 429) is above this fraction')
+    parser.add_argument('--max-p95', type=float, help='Exit 1 if overall p95 latency is above this many seconds')
+    args = parser.parse_args()
+    if not args.duration and not args.requests:
+        parser.error("--duration 0 needs --requests")
+
+    work_dir = tempfile.mkdtemp(prefix='imgfile_load_')
+    server = log = None
+    try:
+        print(Fore.CYAN + "Preparing payloads..." + Style.RESET_ALL)
+        payloads = Payloads(args.payloads, work_dir, args.method, args.password)
+        server_pid = args.server_pid
+        if args.start_server:
+            server, log = start_server(args, work_dir)
+            server_pid = server.pid
+        print(Fore.CYAN + f"Running {args.concurrency} clients against {args.url}" + Style.RESET_ALL)
+        test = LoadTest(args, payloads)
+        test.run(server_pid)
+        data = report(test)
+    finally:
+        if server:
+            server.terminate()
+            server.wait(10)
+            log.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.output:
+        config = {k: v for k, v in vars(args).items() if k not in ('api_key', 'password')}
+        with open(args.output, 'w') as f:
+            json.dump(dict(data, config=config, elapsed=test.elapsed), f, indent=2)
+        print(Fore.GREEN + f"Results written to {args.output}" + Style.RESET_ALL)
+
+    overall = data['summary']['all']
+    failed = []
+    if args.max_error_rate is not None and overall['error_rate'] > args.max_error_rate:
+        failed.append(f"error rate {overall['error_rate']:.1%} > {args.max_error_rate:.1%}")
+    if args.max_p95 is not None and overall['p95'] is not None and overall['p95'] > args.max_p95:
+        failed.append(f"p95 {overall['p95']:.3f}s > {args.max_p95:.3f}s")
+    if failed:
+        print(Fore.RED + "Failed: " + "; ".join(failed) + Style.RESET_ALL)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
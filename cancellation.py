@@ -0,0 +1,58 @@
+import threading
+import time
+
+
+class OperationCancelled(Exception):
+    """Raised by encoder/decoder when their CancelToken has fired."""
+
+
+class CancelToken:
+    """
+    Cooperative cancellation flag shared between a caller and a running
+    encode/decode. The worker calls check() between files, chunks and rows;
+    the caller calls cancel() (or lets the optional timeout run out).
+    pause() makes check() block until resume() or cancel().
+    """
+
+    def __init__(self, timeout=None):
+        self._event = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+        self.reason = None
+        self.deadline = time.monotonic() + timeout if timeout else None
+
+    def cancel(self, reason='cancelled'):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self):
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel('deadline exceeded')
+        return self._event.is_set()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def wait(self, timeout=None):
+        return self._event.wait(timeout)
+
+    def check(self):
+        while self.paused and not self.cancelled:
+            self._running.wait(0.1)
+        if self.cancelled:
+            raise OperationCancelled(f"Operation cancelled: {self.reason}")
+
+
+def check_cancelled(token):
+    """No-op when no token was supplied, so callers don't need to branch."""
+    if token is not None:
+        token.check()
@@ -1,13 +1,76 @@
 import os
 import sys
+import time
+import signal
 import argparse
-import subprocess
-from tqdm import tqdm
+from contextlib import contextmanager, nullcontext, redirect_stdout, redirect_stderr
 from colorama import Fore, Back, Style, init
-from encoder import encode_folder_to_png
-from decoder import decode_png_to_folder, get_decode_info
+from cancellation import CancelToken, OperationCancelled
+
+# Codec, crypto and progress-bar modules are imported by the commands that use
+# them, so --help, info and argument errors start without loading them
+
+METHODS = ['lzma', 'bz2', 'zlib', 'zip_lzma', 'zip_bz2', 'auto']
+
+@contextmanager
+def cancel_on_interrupt(timeout=None):
+    """First Ctrl+C cancels the running job cleanly, a second one force-quits."""
+    token = CancelToken(timeout)
+
+    def handler(signum, frame):
+        if token.cancelled:
+            raise KeyboardInterrupt
+        print(Fore.YELLOW + "\nCancelling... (press Ctrl+C again to force quit)" + Style.RESET_ALL)
+        token.cancel('interrupted by user')
+
+    previous = signal.signal(signal.SIGINT, handler)
+    try:
+        yield token
+    finally:
+        signal.signal(signal.SIGINT, previous)
+
+def memory_limit(args):
+    """--memory-limit in bytes, or None."""
+    return int(args.memory_limit * 1024 * 1024) if getattr(args, 'memory_limit', None) else None
+
+def hot_files(args):
+    """--hot patterns, True for --hot alone (the encoder's defaults), or None."""
+    if getattr(args, 'hot', None) is None:
+        return None
+    return args.hot or True
+
+@contextmanager
+def profiled(args):
+    """
+    Trace the wrapped job when --profile or --profile-out is given. Prints the
+    phase breakdown and writes a Chrome trace (.json) or cProfile stats (.prof).
+    """
+    from profiling import Tracer
+    if not (args.profile or args.profile_out):
+        yield None
+        return
+    tracer = Tracer(trace_memory=args.profile)
+    profiler = None
+    if args.profile_out and args.profile_out.endswith('.prof'):
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        yield tracer
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile_out)
+        elif args.profile_out:
+            tracer.write(args.profile_out)
+        if tracer.spans:
+            print(Fore.CYAN + "\nProfile:" + Style.RESET_ALL)
+            print(tracer.report())
+        if args.profile_out:
+            print(f"Profile written to {args.profile_out}")
 
 def check_and_run_autorun(output_folder, auto_confirm=False):
+    import subprocess
     script_paths = []
     script_py = os.path.join(output_folder, 'autorun.py')
     if os.path.exists(script_py):
@@ -64,23 +127,133 @@ def main():
     subparsers = parser.add_subparsers(dest='command')
 
     compress_parser = subparsers.add_parser('compress', help='Compress folder to PNG')
-    compress_parser.add_argument('folder', help='Folder to compress')
-    compress_parser.add_argument('output', help='Output PNG file')
-    compress_parser.add_argument('--method', default='lzma', choices=['lzma', 'bz2', 'zlib', 'zip_lzma', 'zip_bz2'], help='Compression method')
+    compress_parser.add_argument('folder', help="Folder to compress, or '-' to read a tar stream from stdin")
+    compress_parser.add_argument('output', nargs='?', help="Output PNG file, or '-' for stdout (the default when reading stdin)")
+    compress_parser.add_argument('--name', default='archive', help='Folder name stored in the header when reading a tar stream')
+    compress_parser.add_argument('--method', default='lzma', choices=METHODS, help="Compression method ('auto' samples the folder and picks one)")
+    compress_parser.add_argument('--auto-target', help="Goal for --method auto: 'fastest:10%%' (default) or 'smallest:30s'")
     compress_parser.add_argument('--limit', default=True, type=bool, help='Enable max file limit')
     compress_parser.add_argument('--password', help='Password for encryption')
+    compress_parser.add_argument('--geometry', choices=['compact', 'square'], help="Image layout: 'compact' (default) uses 4096-pixel rows and only the rows needed, 'square' the original square image")
+    compress_parser.add_argument('--layout', choices=['stream', 'indexed'], help="Archive layout: 'stream' (default) stores files in folder order with the file list at the end, 'indexed' groups them by directory and type and puts a copy of the file list at the top, so listing and reading early files only decode the top rows")
+    compress_parser.add_argument('--hot', nargs='*', metavar='PATTERN', help='Store small files matching these glob patterns first (manifests and configs when no pattern is given)')
+    compress_parser.add_argument('--memory-limit', type=float, metavar='MB', help='Buffer at most this many MB in memory; larger buffers go to temp files')
+    compress_parser.add_argument('--timeout', type=float, help='Cancel if not finished within this many seconds')
+    compress_parser.add_argument('--profile', action='store_true', help='Print a per-phase time/throughput/memory breakdown')
+    compress_parser.add_argument('--profile-out', help='Write a Chrome trace (.json) or cProfile stats (.prof) to this path')
 
     extract_parser = subparsers.add_parser('extract', help='Extract PNG to folder')
-    extract_parser.add_argument('png', help='PNG file to extract')
-    extract_parser.add_argument('output_folder', help='Output folder')
+    extract_parser.add_argument('png', help="PNG file to extract, or '-' to read it from stdin")
+    extract_parser.add_argument('output_folder', nargs='?', help='Output folder')
+    extract_parser.add_argument('--sync', action='store_true', help='Only write members whose size or CRC32 differs from the file already on disk')
+    extract_parser.add_argument('--delete', action='store_true', help='With --sync, also delete files in the output folder that are not in the archive')
+    extract_parser.add_argument('--to-tar', metavar='PATH', help="Write the contents as a tar stream to PATH ('-' for stdout) instead of a folder")
     extract_parser.add_argument('--password', help='Password for decryption')
+    extract_parser.add_argument('--memory-limit', type=float, metavar='MB', help='Buffer at most this many MB in memory; larger buffers go to temp files')
+    extract_parser.add_argument('--timeout', type=float, help='Cancel if not finished within this many seconds')
+    extract_parser.add_argument('--profile', action='store_true', help='Print a per-phase time/throughput/memory breakdown')
+    extract_parser.add_argument('--profile-out', help='Write a Chrome trace (.json) or cProfile stats (.prof) to this path')
+
+    estimate_parser = subparsers.add_parser('estimate', help='Predict PNG size, dimensions and encode time without compressing')
+    estimate_parser.add_argument('folder', help='Folder to estimate')
+    estimate_parser.add_argument('--method', default='lzma', choices=METHODS, help='Compression method')
+    estimate_parser.add_argument('--auto-target', help="Goal for --method auto: 'fastest:10%%' (default) or 'smallest:30s'")
+    estimate_parser.add_argument('--limit', default=True, type=bool, help='Check against the max file limit')
+    estimate_parser.add_argument('--password', help='Estimate with encryption (the value itself is not used)')
+    estimate_parser.add_argument('--geometry', choices=['compact', 'square'], help='Image layout to estimate for')
+    estimate_parser.add_argument('--layout', choices=['stream', 'indexed'], help='Archive layout to estimate for')
+    estimate_parser.add_argument('--json', action='store_true', help='Print the estimate as JSON')
+
+    info_parser = subparsers.add_parser('info', help='Show the header of a PNG archive without extracting it')
+    info_parser.add_argument('png', help='PNG file to inspect')
+    info_parser.add_argument('--members', action='store_true', help='Also list the files inside (reads the payload)')
+    info_parser.add_argument('--password', help='Password for listing the files of an encrypted archive')
+    info_parser.add_argument('--json', action='store_true', help='Print the info as JSON')
+
+    atlas_parser = subparsers.add_parser('atlas', help='Pack many small archives into one PNG, read entries back, compact')
+    atlas_commands = atlas_parser.add_subparsers(dest='atlas_command', required=True)
+    atlas_pack = atlas_commands.add_parser('pack', help='Encode folders or files as entries of a new atlas')
+    atlas_pack.add_argument('output', help='Atlas PNG to write')
+    atlas_pack.add_argument('inputs', nargs='+', help='Folders or files; each becomes one entry named after it')
+    atlas_pack.add_argument('--method', default='zlib', choices=[m for m in METHODS if m != 'auto'], help='Compression method')
+    atlas_pack.add_argument('--password', help='Encrypt every entry with this password')
+    atlas_pack.add_argument('--limit', default=True, type=bool, help='Enable max file limit')
+    atlas_pack.add_argument('--memory-limit', type=float, metavar='MB', help='Buffer at most this many MB in memory; larger buffers go to temp files')
+    atlas_list = atlas_commands.add_parser('list', help='List the entries of an atlas')
+    atlas_list.add_argument('atlas', help='Atlas PNG')
+    atlas_list.add_argument('--json', action='store_true', help='Print the index as JSON')
+    atlas_extract = atlas_commands.add_parser('extract', help='Extract entries, each into its own subfolder')
+    atlas_extract.add_argument('atlas', help='Atlas PNG')
+    atlas_extract.add_argument('output_dir', help='Folder to extract into')
+    atlas_extract.add_argument('names', nargs='*', help='Entries to extract (default: all)')
+    atlas_extract.add_argument('--password', help='Password for encrypted entries')
+    atlas_compact = atlas_commands.add_parser('compact', help='Merge atlases and PNGs into one atlas, dropping replaced or removed entries')
+    atlas_compact.add_argument('output', help='Atlas PNG to write (may be one of the sources)')
+    atlas_compact.add_argument('sources', nargs='+', help='Atlases or PNGs; later ones replace same-named entries')
+    atlas_compact.add_argument('--remove', action='append', default=[], metavar='NAME', help='Drop this entry (repeatable)')
+    atlas_compact.add_argument('--limit', default=True, type=bool, help='Enable max file limit')
+    atlas_compact.add_argument('--memory-limit', type=float, metavar='MB', help='Buffer at most this many MB in memory; larger buffers go to temp files')
+
+    watch_parser = subparsers.add_parser('watch', help='Keep a PNG in sync with a folder, re-encoding what changed')
+    watch_parser.add_argument('folder', help='Folder to watch')
+    watch_parser.add_argument('output', help='PNG file to keep up to date (outside the folder)')
+    watch_parser.add_argument('--method', default='lzma', choices=[m for m in METHODS if m != 'auto'], help='Compression method')
+    watch_parser.add_argument('--limit', default=True, type=bool, help='Enable max file limit')
+    watch_parser.add_argument('--password', help='Password for encryption')
+    watch_parser.add_argument('--debounce', type=float, default=0.5, help='Seconds without changes before re-encoding (default: 0.5)')
+    watch_parser.add_argument('--poll', action='store_true', help='Poll for changes instead of using inotify')
+    watch_parser.add_argument('--interval', type=float, default=1.0, help='Seconds between scans when polling (default: 1)')
+
+    for kind, help_text in (('compress', 'Compress many folders to PNGs in parallel'), ('extract', 'Extract many PNGs in parallel')):
+        batch_parser = subparsers.add_parser(f'{kind}-batch', help=help_text)
+        batch_parser.add_argument('inputs', nargs='*', help=('Folders' if kind == 'compress' else 'PNG files') + ' or glob patterns')
+        batch_parser.add_argument('--manifest', help='File with one input per line, optionally followed by a tab and its output path')
+        batch_parser.add_argument('--output-dir', required=True, help='Where outputs go (unless the manifest names them)')
+        batch_parser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1, help='Worker processes (default: CPU count)')
+        if kind == 'compress':
+            batch_parser.add_argument('--method', default='lzma', choices=METHODS, help="Compression method ('auto' samples each folder and picks one)")
+            batch_parser.add_argument('--auto-target', help="Goal for --method auto: 'fastest:10%%' (default) or 'smallest:30s'")
+            batch_parser.add_argument('--limit', default=True, type=bool, help='Enable max file limit')
+        batch_parser.add_argument('--password', help='Password used for every item')
+        batch_parser.add_argument('--memory-limit', type=float, metavar='MB', help='Per-item memory budget; larger buffers go to temp files')
+        batch_parser.add_argument('--timeout', type=float, help='Cancel an item if it takes longer than this many seconds')
+        batch_parser.add_argument('--skip-existing', action='store_true', help='Skip items whose output already exists')
+        batch_parser.add_argument('--report', help='Write the per-item summary to this .json or .csv file')
 
     args = parser.parse_args()
+    if getattr(args, 'auto_target', None):
+        from autoselect import parse_target
+        try:
+            parse_target(args.auto_target)
+        except ValueError as e:
+            parser.error(str(e))
 
     if args.command == 'compress':
+        if args.output is None and args.folder != '-':
+            parser.error("the following arguments are required: output")
+        if args.folder == '-' and args.hot is not None:
+            parser.error("--hot needs a folder; a tar stream from stdin is stored in stream order")
+        if args.folder == '-' or args.output in (None, '-'):
+            sys.exit(compress_stream(args))
         compress_non_interactive(args)
     elif args.command == 'extract':
+        if args.to_tar:
+            sys.exit(extract_to_tar(args))
+        if args.output_folder is None or args.png == '-':
+            parser.error("extract needs an output folder and a PNG file, or --to-tar")
+        if args.delete and not args.sync:
+            parser.error("--delete only works with --sync")
         extract_non_interactive(args)
+    elif args.command == 'estimate':
+        sys.exit(estimate_non_interactive(args))
+    elif args.command == 'info':
+        sys.exit(info_non_interactive(args))
+    elif args.command == 'atlas':
+        sys.exit(atlas_non_interactive(args))
+    elif args.command == 'watch':
+        sys.exit(watch_non_interactive(args))
+    elif args.command in ('compress-batch', 'extract-batch'):
+        sys.exit(run_batch(args.command.split('-')[0], args))
     else:
         while True:
             print(Fore.CYAN + "\nFile Compressor CLI" + Style.RESET_ALL)
@@ -100,6 +273,8 @@ def main():
                 print(Fore.RED + "Invalid choice. Please try again." + Style.RESET_ALL)
 
 def compress_interactive():
+    from tqdm import tqdm
+    from encoder import encode_folder_to_png
     print(Fore.YELLOW + "\nCompress Folder to PNG" + Style.RESET_ALL)
     print(Fore.YELLOW + "======================" + Style.RESET_ALL)
     folder_path = input("Enter folder path to compress: ").strip()
@@ -115,11 +290,10 @@ def compress_interactive():
         output_png += '.png'
 
     print("\nCompression Methods:")
-    methods = ['lzma', 'bz2', 'zlib', 'zip_lzma', 'zip_bz2']
-    for i, m in enumerate(methods, 1):
+    for i, m in enumerate(METHODS, 1):
         print(f"{i}. {m.upper()}")
-    method_choice = input("Choose compression method (1-5, default 1): ").strip()
-    method = methods[int(method_choice) - 1] if method_choice.isdigit() and 1 <= int(method_choice) <= 5 else 'lzma'
+    method_choice = input(f"Choose compression method (1-{len(METHODS)}, default 1): ").strip()
+    method = METHODS[int(method_choice) - 1] if method_choice.isdigit() and 1 <= int(method_choice) <= len(METHODS) else 'lzma'
 
     enable_limit = input("Enable max file limit? (y/n, default y): ").strip().lower()
     enable_max_limit = enable_limit in ('y', 'yes', '') or enable_limit == ''
@@ -135,14 +309,20 @@ def compress_interactive():
         pbar.refresh()
 
     try:
-        encode_folder_to_png(folder_path, output_png, method, progress_callback=progress_cb, enable_max_limit=enable_max_limit, password=password)
+        with cancel_on_interrupt() as token:
+            encode_folder_to_png(folder_path, output_png, method, progress_callback=progress_cb, enable_max_limit=enable_max_limit, password=password, cancel_token=token)
         pbar.close()
         print(Fore.GREEN + "\nCompression completed successfully!" + Style.RESET_ALL)
+    except OperationCancelled as e:
+        pbar.close()
+        print(Fore.YELLOW + f"\nCompression cancelled: {e}" + Style.RESET_ALL)
     except Exception as e:
         pbar.close()
         print(Fore.RED + f"\nCompression failed: {e}" + Style.RESET_ALL)
 
 def compress_non_interactive(args):
+    from tqdm import tqdm
+    from encoder import encode_folder_to_png
     folder_path = args.folder
     output_png = args.output
     method = args.method
@@ -156,19 +336,207 @@ def compress_non_interactive(args):
         pbar.refresh()
 
     try:
-        encode_folder_to_png(folder_path, output_png, method, progress_callback=progress_cb, enable_max_limit=enable_max_limit, password=password)
+        with cancel_on_interrupt(args.timeout) as token, profiled(args) as tracer:
+            encode_folder_to_png(folder_path, output_png, method, progress_callback=progress_cb, enable_max_limit=enable_max_limit, password=password, cancel_token=token, tracer=tracer, auto_target=args.auto_target,
+                                 memory_limit=memory_limit(args), geometry=args.geometry, layout=args.layout, hot_files=hot_files(args))
         pbar.close()
         print(Fore.GREEN + "\nCompression completed successfully!" + Style.RESET_ALL)
+    except OperationCancelled as e:
+        pbar.close()
+        print(Fore.YELLOW + f"\nCompression cancelled: {e}" + Style.RESET_ALL)
     except Exception as e:
         pbar.close()
         print(Fore.RED + f"\nCompression failed: {e}" + Style.RESET_ALL)
 
+def info_non_interactive(args):
+    """Print an archive's header. Only the first rows are read unless --members is given."""
+    import json
+    from decoder import read_header, list_members
+    try:
+        info = read_header(args.png)
+        if args.members:
+            info['members'] = list_members(args.png, args.password)['members']
+    except Exception as e:
+        print(Fore.RED + f"Info failed: {e}" + Style.RESET_ALL, file=sys.stderr)
+        return 1
+    if args.json:
+        print(json.dumps(info, indent=2))
+        return 0
+
+    print(Fore.BLUE + f"Folder: {info['folder_name']}" + Style.RESET_ALL)
+    print(f"Payload: {info['data_size'] / (1024 * 1024):.2f} MB ({info['data_size']} bytes)")
+    print(f"Compression: {info['compression_method']}")
+    print(f"Encrypted: {'yes' if info['password_info'] == 'encrypted' else 'no'}")
+    print(f"Image: {info['width']}x{info['height']}")
+    for member in info.get('members', []):
+        print(f"{member['size']:>12}  {member['modified']}  {member['name']}")
+    return 0
+
+def atlas_non_interactive(args):
+    """atlas pack / list / extract / compact."""
+    import json
+    import atlas
+    try:
+        with cancel_on_interrupt() as token:
+            if args.atlas_command == 'pack':
+                entries = [(os.path.basename(os.path.normpath(path)), path) for path in args.inputs]
+                index = atlas.pack_atlas(entries, args.output, args.method, args.password, enable_max_limit=args.limit,
+                                         cancel_token=token, memory_limit=memory_limit(args))
+                print(Fore.GREEN + f"Packed {len(index)} entries into '{args.output}'" + Style.RESET_ALL)
+            elif args.atlas_command == 'list':
+                with atlas.AtlasReader(args.atlas, token) as reader:
+                    entries = list(reader.entries.values())
+                if args.json:
+                    print(json.dumps(entries, indent=2))
+                else:
+                    for entry in entries:
+                        lock = ' (encrypted)' if entry['password_info'] == 'encrypted' else ''
+                        print(f"{entry['size']:>10}  {entry['compression_method']:<8}  {entry['name']}{lock}")
+            elif args.atlas_command == 'extract':
+                with atlas.AtlasReader(args.atlas, token) as reader:
+                    for name in reader.extract_all(args.output_dir, args.names or None, args.password, token):
+                        print(Fore.GREEN + f"Extracted: {name}" + Style.RESET_ALL)
+            else:
+                index = atlas.compact_atlas(args.sources, args.output, args.remove, enable_max_limit=args.limit,
+                                            cancel_token=token, memory_limit=memory_limit(args))
+                print(Fore.GREEN + f"Wrote {len(index)} entries to '{args.output}'" + Style.RESET_ALL)
+    except OperationCancelled as e:
+        print(Fore.YELLOW + f"Atlas {args.atlas_command} cancelled: {e}" + Style.RESET_ALL)
+        return 130
+    except Exception as e:
+        print(Fore.RED + f"Atlas {args.atlas_command} failed: {e}" + Style.RESET_ALL)
+        return 1
+    return 0
+
+def watch_non_interactive(args):
+    """Re-encode the folder into the PNG whenever it changes, until Ctrl+C."""
+    from watch import watch_folder
+
+    def started(kind):
+        print(Fore.CYAN + f"Watching '{args.folder}' ({kind}), press Ctrl+C to stop..." + Style.RESET_ALL)
+
+    def updated(info):
+        print(Fore.GREEN + f"[{time.strftime('%H:%M:%S')}] Updated '{args.output}': {info['changed']} changed, "
+              f"{info['removed']} removed, {info['files']} files in {info['seconds']:.2f}s" + Style.RESET_ALL)
+
+    def failed(e):
+        print(Fore.RED + f"[{time.strftime('%H:%M:%S')}] Update failed, keeping the previous image: {e}" + Style.RESET_ALL)
+
+    try:
+        with cancel_on_interrupt() as token:
+            watch_folder(args.folder, args.output, args.method, args.password, args.limit, debounce=args.debounce,
+                         poll_interval=args.interval if args.poll else None, cancel_token=token,
+                         on_update=updated, on_error=failed, on_start=started)
+    except OperationCancelled:
+        print(Fore.YELLOW + "\nStopped watching." + Style.RESET_ALL)
+        return 0
+    except Exception as e:
+        print(Fore.RED + f"Watch failed: {e}" + Style.RESET_ALL)
+        return 1
+
+def _binary_output(path):
+    """Binary stream for an output path, '-' being stdout (refused when it is a terminal)."""
+    if path != '-':
+        return open(path, 'wb')
+    if sys.stdout.isatty():
+        raise ValueError("Refusing to write binary data to a terminal; redirect stdout or give a file name")
+    return nullcontext(sys.stdout.buffer)
+
+def compress_stream(args):
+    """
+    compress with '-': a tar stream from stdin and/or the PNG to stdout.
+    Messages go to stderr so stdout carries only the image.
+    """
+    from encoder import encode_folder_to_png, encode_tar_to_png
+    try:
+        with _binary_output(args.output or '-') as output, redirect_stdout(sys.stderr), \
+                cancel_on_interrupt(args.timeout) as token, profiled(args) as tracer:
+            options = dict(enable_max_limit=args.limit, password=args.password, cancel_token=token, tracer=tracer,
+                           memory_limit=memory_limit(args), geometry=args.geometry, layout=args.layout)
+            if args.folder == '-':
+                encode_tar_to_png(sys.stdin.buffer, output, args.name, args.method, **options)
+            else:
+                encode_folder_to_png(args.folder, output, args.method, auto_target=args.auto_target, hot_files=hot_files(args), **options)
+            output.flush()
+    except OperationCancelled as e:
+        print(Fore.YELLOW + f"Compression cancelled: {e}" + Style.RESET_ALL, file=sys.stderr)
+        return 130
+    except BrokenPipeError:
+        # The reader went away; stop Python complaining when it flushes stdout at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    except Exception as e:
+        print(Fore.RED + f"Compression failed: {e}" + Style.RESET_ALL, file=sys.stderr)
+        return 1
+    return 0
+
+def extract_to_tar(args):
+    """
+    extract --to-tar: stream the archive as tar to a file or stdout. An image
+    from stdin is spooled (to disk past --memory-limit), since the ZIP
+    directory sits at its end, except with the indexed layout, which keeps
+    a copy of the directory up front and streams as it arrives.
+    """
+    from decoder import decode_png_to_tar
+    from pipeline import StreamSpool
+    try:
+        source = StreamSpool(sys.stdin.buffer, memory_limit(args)) if args.png == '-' else args.png
+        with _binary_output(args.to_tar) as output, redirect_stdout(sys.stderr), \
+                cancel_on_interrupt(args.timeout) as token:
+            decode_png_to_tar(source, output, password=args.password, cancel_token=token, memory_limit=memory_limit(args))
+            output.flush()
+    except OperationCancelled as e:
+        print(Fore.YELLOW + f"Extraction cancelled: {e}" + Style.RESET_ALL, file=sys.stderr)
+        return 130
+    except BrokenPipeError:
+        # The reader went away; stop Python complaining when it flushes stdout at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    except Exception as e:
+        print(Fore.RED + f"Extraction failed: {e}" + Style.RESET_ALL, file=sys.stderr)
+        return 1
+    return 0
+
+def estimate_non_interactive(args):
+    import json
+    from estimate import estimate_encode
+    try:
+        est = estimate_encode(args.folder, args.method, args.password, enable_max_limit=args.limit, auto_target=args.auto_target,
+                              geometry=args.geometry, layout=args.layout)
+    except Exception as e:
+        print(Fore.RED + f"Estimate failed: {e}" + Style.RESET_ALL)
+        return 1
+    if args.json:
+        print(json.dumps(est, indent=2))
+        return 0 if est['within_limits'] != 'no' else 1
+
+    mb = lambda n: n / (1024 * 1024)
+    low, high = est['payload_size_range']
+    h_low, h_high = est['image_height_range']
+    t_low, t_high = est['encode_seconds_range']
+    print(Fore.BLUE + f"Folder: {est['folder_name']}" + Style.RESET_ALL)
+    print(f"Files: {est['file_count']}")
+    print(f"Total size: {mb(est['total_size']):.2f} MB")
+    print(f"Compression: {est['header_method']}" + (" (encrypted)" if est['password_protected'] else ""))
+    print(f"Payload: {mb(est['payload_size']):.2f} MB (range {mb(low):.2f}-{mb(high):.2f} MB)")
+    print(f"Image: {est['image_width']}x{est['image_height']} (height {h_low}-{h_high})")
+    print(f"Encode time: {est['encode_seconds']:.1f}s (range {t_low:.1f}-{t_high:.1f}s)")
+    print(f"Sampled {est['sampled_fraction']:.1%} of the data in {est['estimate_seconds']:.2f}s; ranges are ~{est['confidence']:.0%} intervals")
+    if est['within_limits'] == 'yes':
+        print(Fore.GREEN + "Within size limits" + Style.RESET_ALL)
+    for err in est['limit_errors']:
+        color = Fore.RED if est['within_limits'] == 'no' else Fore.YELLOW
+        print(color + err + Style.RESET_ALL)
+    return 0 if est['within_limits'] != 'no' else 1
+
 def extract_non_interactive(args):
+    from tqdm import tqdm
+    from decoder import decode_png_to_folder, get_decode_info
     img_path = args.png
     output_folder = args.output_folder
     password = args.password
 
-    folder_name, file_count, total_size, compression_method, password_info, _ = get_decode_info(img_path)
+    folder_name, file_count, total_size, compression_method, password_info, _ = get_decode_info(img_path, memory_limit(args))
 
     if password_info == "encrypted" and not password:
         print(Fore.RED + "Password is required for extraction." + Style.RESET_ALL)
@@ -189,15 +557,22 @@ def extract_non_interactive(args):
         pbar.refresh()
 
     try:
-        decode_png_to_folder(img_path, output_folder, progress_callback=progress_cb, password=password)
+        with cancel_on_interrupt(args.timeout) as token, profiled(args) as tracer:
+            decode_png_to_folder(img_path, output_folder, progress_callback=progress_cb, password=password, cancel_token=token, tracer=tracer,
+                                 sync=args.sync, delete_extra=args.delete, memory_limit=memory_limit(args))
         pbar.close()
         print(Fore.GREEN + "\nExtraction completed successfully!" + Style.RESET_ALL)
         check_and_run_autorun(output_folder, auto_confirm=True)
+    except OperationCancelled as e:
+        pbar.close()
+        print(Fore.YELLOW + f"\nExtraction cancelled: {e}" + Style.RESET_ALL)
     except Exception as e:
         pbar.close()
         print(Fore.RED + f"\nExtraction failed: {e}" + Style.RESET_ALL)
 
 def extract_interactive():
+    from tqdm import tqdm
+    from decoder import decode_png_to_folder, get_decode_info
     print(Fore.MAGENTA + "\nExtract PNG to Folder" + Style.RESET_ALL)
     print(Fore.MAGENTA + "=====================" + Style.RESET_ALL)
     img_path = input("Enter PNG file path to extract: ").strip()
@@ -232,13 +607,243 @@ def extract_interactive():
         pbar.refresh()
 
     try:
-        decode_png_to_folder(img_path, output_folder, progress_callback=progress_cb, password=password)
+        with cancel_on_interrupt() as token:
+            decode_png_to_folder(img_path, output_folder, progress_callback=progress_cb, password=password, cancel_token=token)
         pbar.close()
         print(Fore.GREEN + "\nExtraction completed successfully!" + Style.RESET_ALL)
         check_and_run_autorun(output_folder)
+    except OperationCancelled as e:
+        pbar.close()
+        print(Fore.YELLOW + f"\nExtraction cancelled: {e}" + Style.RESET_ALL)
     except Exception as e:
         pbar.close()
         print(Fore.RED + f"\nExtraction failed: {e}" + Style.RESET_ALL)
 
+# Set in each batch worker process by _batch_init
+_batch_progress = None
+_batch_stop = None
+
+class _BatchCancelToken(CancelToken):
+    """Per-item token that also fires when the whole batch is cancelled."""
+
+    def __init__(self, stop_event, timeout=None):
+        super().__init__(timeout)
+        self.stop_event = stop_event
+
+    @property
+    def cancelled(self):
+        if self.stop_event.is_set():
+            self.cancel('batch cancelled')
+        return super().cancelled
+
+def _batch_init(progress_queue, stop_event, encode_workers):
+    import encoder
+    global _batch_progress, _batch_stop
+    # Ctrl+C is handled by the parent, which tells workers to stop via stop_event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _batch_progress = progress_queue
+    _batch_stop = stop_event
+    # Jobs already run in parallel; share the cores between their encoder threads
+    encoder.encode_workers = encode_workers
+
+def _batch_item(kind, index, source, target, options):
+    """Runs in a worker process: one compress or extract, with output silenced."""
+    from encoder import encode_folder_to_png
+    from decoder import decode_png_to_folder
+    token = _BatchCancelToken(_batch_stop, options['timeout'])
+    last = [-1]
+    def progress_cb(p, msg, *args):
+        if int(p) != last[0]:
+            last[0] = int(p)
+            _batch_progress.put((index, p))
+    quiet = lambda *args: None
+
+    status, error = 'ok', None
+    start = time.time()
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull), redirect_stderr(devnull):
+        try:
+            if kind == 'compress':
+                encode_folder_to_png(source, target, options['method'], progress_callback=progress_cb, enable_max_limit=options['limit'],
+                                     password=options['password'], log_callback=quiet, cancel_token=token, auto_target=options['auto_target'],
+                                     memory_limit=options['memory_limit'])
+            else:
+                decode_png_to_folder(source, target, progress_callback=progress_cb, password=options['password'],
+                                     log_callback=quiet, cancel_token=token, memory_limit=options['memory_limit'])
+        except OperationCancelled as e:
+            status, error = 'cancelled', str(e)
+        except Exception as e:
+            status, error = 'failed', f"{type(e).__name__}: {e}"
+    return {'status': status, 'error': error, 'seconds': time.time() - start}
+
+def _path_size(path):
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def collect_batch_items(kind, inputs, manifest, output_dir):
+    """Expand globs and the manifest into (source, target) pairs with unique targets."""
+    import glob
+    pairs = []
+    if manifest:
+        with open(manifest, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\r\n')
+                if not line.strip() or line.lstrip().startswith('#'):
+                    continue
+                source, _, target = line.partition('\t')
+                pairs.append((source.strip(), target.strip() or None))
+    for pattern in inputs:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+            wanted = os.path.isdir if kind == 'compress' else os.path.isfile
+            pairs.extend((m, None) for m in matches if wanted(m))
+        else:
+            pairs.append((pattern, None))
+
+    items = []
+    used = set()
+    for source, target in pairs:
+        if target is None:
+            stem = os.path.basename(os.path.normpath(source))
+            if kind == 'extract':
+                stem = os.path.splitext(stem)[0]
+            suffix = '.png' if kind == 'compress' else ''
+            target = os.path.join(output_dir, stem + suffix)
+            n = 1
+            while target in used:
+                n += 1
+                target = os.path.join(output_dir, f'{stem}_{n}{suffix}')
+        used.add(target)
+        items.append((source, target))
+    return items
+
+def write_batch_report(path, results):
+    import csv
+    import json
+    if path.lower().endswith('.csv'):
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=['input', 'output', 'status', 'seconds', 'input_bytes', 'output_bytes', 'error'])
+            writer.writeheader()
+            writer.writerows(results)
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+def run_batch(kind, args):
+    """Run compress-batch / extract-batch. Returns the process exit code."""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    from concurrent.futures.process import BrokenProcessPool
+    from tqdm import tqdm
+    items = collect_batch_items(kind, args.inputs, args.manifest, args.output_dir)
+    if not items:
+        print(Fore.RED + "No inputs to process." + Style.RESET_ALL)
+        return 2
+    os.makedirs(args.output_dir, exist_ok=True)
+    options = {
+        'method': getattr(args, 'method', None),
+        'limit': getattr(args, 'limit', True),
+        'auto_target': getattr(args, 'auto_target', None),
+        'password': args.password,
+        'timeout': args.timeout,
+        'memory_limit': memory_limit(args),
+    }
+
+    results = [{'input': s, 'output': t, 'status': 'pending', 'seconds': 0.0, 'input_bytes': None, 'output_bytes': None, 'error': None}
+               for s, t in items]
+    progress = [0.0] * len(items)
+    counts = {'ok': 0, 'failed': 0, 'cancelled': 0, 'skipped': 0}
+    jobs = max(1, min(args.jobs, len(items)))
+    print(Fore.CYAN + f"{kind.capitalize()}ing {len(items)} items with {jobs} workers..." + Style.RESET_ALL)
+
+    ctx = multiprocessing.get_context()
+    progress_queue = ctx.Queue()
+    stop_event = ctx.Event()
+    started = time.time()
+    batch_error = 'batch stopped before this item ran'
+    pbar = tqdm(total=len(items), unit='item', desc=f"{kind.capitalize()} batch", colour='green')
+    try:
+        with cancel_on_interrupt() as token, ProcessPoolExecutor(jobs, mp_context=ctx, initializer=_batch_init,
+                                                                 initargs=(progress_queue, stop_event,
+                                                                           max(1, (os.cpu_count() or 1) // jobs))) as pool:
+            futures = {}
+            for i, (source, target) in enumerate(items):
+                if args.skip_existing and os.path.exists(target):
+                    results[i]['status'] = 'skipped'
+                    counts['skipped'] += 1
+                    progress[i] = 100
+                    continue
+                futures[pool.submit(_batch_item, kind, i, source, target, options)] = i
+
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+                while not progress_queue.empty():
+                    i, p = progress_queue.get_nowait()
+                    progress[i] = max(progress[i], p)
+                for future in done:
+                    i = futures[future]
+                    if future.cancelled():
+                        results[i].update(status='cancelled', error='batch cancelled')
+                    else:
+                        try:
+                            results[i].update(future.result())
+                        except Exception as e:
+                            # e.g. BrokenProcessPool when a worker is killed; every item still queued then fails the same way
+                            results[i].update(status='failed', error=f"{type(e).__name__}: {e}")
+                    counts[results[i]['status']] += 1
+                    progress[i] = 100
+                    if results[i]['status'] == 'failed':
+                        pbar.write(Fore.RED + f"Failed: {results[i]['input']}: {results[i]['error']}" + Style.RESET_ALL)
+                if token.cancelled and not stop_event.is_set():
+                    stop_event.set()
+                    for future in pending:
+                        future.cancel()
+                pbar.n = round(sum(progress) / 100, 2)
+                pbar.set_postfix(ok=counts['ok'], failed=counts['failed'], refresh=False)
+                pbar.refresh()
+    except BrokenProcessPool as e:
+        # submit() on a pool whose worker has already died; the items not yet submitted fail below
+        batch_error = f"{type(e).__name__}: {e}"
+    finally:
+        pbar.close()
+    for r in results:
+        if r['status'] == 'pending':
+            r.update(status='failed', error=batch_error)
+            counts['failed'] += 1
+
+    for r in results:
+        if r['status'] != 'skipped' and os.path.exists(r['input']):
+            r['input_bytes'] = _path_size(r['input'])
+        if r['status'] == 'ok':
+            r['output_bytes'] = _path_size(r['output'])
+    elapsed = time.time() - started
+    busy = sum(r['seconds'] for r in results)
+
+    print(Fore.CYAN + "\nBatch summary" + Style.RESET_ALL)
+    print(f"Items: {len(items)}  ok: {counts['ok']}  failed: {counts['failed']}  cancelled: {counts['cancelled']}  skipped: {counts['skipped']}")
+    print(f"Wall time: {elapsed:.1f}s  (sum of item times {busy:.1f}s, {busy / elapsed if elapsed else 0:.1f}x parallel speedup)")
+    slowest = sorted((r for r in results if r['status'] == 'ok'), key=lambda r: r['seconds'], reverse=True)[:5]
+    if slowest:
+        print("Slowest items:")
+        for r in slowest:
+            print(f"  {r['seconds']:7.2f}s  {r['input']}")
+    for r in results:
+        if r['status'] == 'failed':
+            print(Fore.RED + f"  FAILED {r['input']}: {r['error']}" + Style.RESET_ALL)
+    if args.report:
+        write_batch_report(args.report, results)
+        print(f"Report written to {args.report}")
+    if counts['failed']:
+        return 1
+    return 130 if counts['cancelled'] else 0
+
 if __name__ == '__main__':
     main()
@@ -1,185 +1,697 @@
-from PIL import Image
-Image.MAX_IMAGE_PIXELS = None
-
-import zipfile, io, os, sys, traceback
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-import base64
+import zipfile, io, os, sys, time, zlib, tarfile, tempfile, traceback, collections
+import base64, binascii
 from colorama import Fore, Style
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from cancellation import OperationCancelled, check_cancelled
+from pngio import PNGReader, UnsupportedPNG
+from pipeline import INDEX_MAGIC, StreamSpool
+from profiling import PhaseTimer
 
-def decode_png_to_folder(img_path, output_folder, progress_callback=None, password=None, log_callback=None):
-    try:
-        if not os.path.exists(img_path):
-            raise FileNotFoundError(f"Image not found: {img_path}")
+header_scan_pixels = 10000
+payload_cache_size = 16 * 1024 * 1024
+sync_read_size = 1024 * 1024
 
-        print(Fore.CYAN + f"Loading image: {img_path}" + Style.RESET_ALL)
-        img = Image.open(img_path)
+_pil_image = None
 
-        width, height = img.size
-        mode = img.mode
-        channels_per_pixel = 4 if mode == 'RGBA' else 3
-        print(Fore.BLUE + f"Image size: {width}x{height} pixels, mode: {mode}, channels: {channels_per_pixel}" + Style.RESET_ALL)
-
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder, exist_ok=True)
+def pil_image():
+    """
+    PIL.Image, imported on first use with the decompression-bomb limit lifted.
+    Callers that want a limit set MAX_IMAGE_PIXELS on the returned module.
+    """
+    global _pil_image
+    if _pil_image is None:
+        from PIL import Image
+        Image.MAX_IMAGE_PIXELS = None
+        _pil_image = Image
+    return _pil_image
+
+def _derive_key(password, salt):
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+    kdf = PBKDF2HMAC(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        iterations=100000,
+    )
+    return base64.urlsafe_b64encode(kdf.derive(password.encode()))
+
+def decrypt_payload(zip_data, password):
+    """Undo the encoder's salt + Fernet(PBKDF2(password)) wrapping"""
+    if not password:
+        raise ValueError("Password required for encrypted archive")
+    from cryptography.fernet import Fernet
+    key = _derive_key(password, zip_data[:16])
+    return Fernet(key).decrypt(bytes(zip_data[16:]))
+
+def decrypt_stream(src, password, out, cancel_token=None):
+    """
+    decrypt_payload for a payload read from src in chunks, writing the
+    plaintext to out, so neither side has to fit in memory. The token's HMAC
+    is checked at the end: out is only trustworthy once this returns, and a
+    wrong password or damaged data raises InvalidToken as Fernet would.
+    """
+    if not password:
+        raise ValueError("Password required for encrypted archive")
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.fernet import InvalidToken
+    from cryptography.hazmat.primitives import hashes, padding
+    from cryptography.hazmat.primitives.hmac import HMAC
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    key = base64.urlsafe_b64decode(_derive_key(password, src.read(16)))
+    mac = HMAC(key[:16], hashes.SHA256())
+    unpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+    decryptor = None
+    carry = b''
+    buffered = bytearray()
+    try:
+        while True:
+            check_cancelled(cancel_token)
+            text = carry + src.read(sync_read_size)
+            if not text:
+                break
+            # Decode whole 4-character groups, carry the rest into the next read
+            cut = len(text) - len(text) % 4
+            if cut == 0:
+                raise InvalidToken
+            buffered += base64.urlsafe_b64decode(text[:cut])
+            carry = text[cut:]
+            if decryptor is None:
+                if len(buffered) < 25:
+                    continue
+                if buffered[0] != 0x80:
+                    raise InvalidToken
+                mac.update(bytes(buffered[:25]))
+                decryptor = Cipher(algorithms.AES(key[16:]), modes.CBC(bytes(buffered[9:25]))).decryptor()
+                del buffered[:25]
+            # The last 32 bytes are the HMAC, so hold them back
+            body = len(buffered) - 32
+            if body > 0:
+                ciphertext = bytes(buffered[:body])
+                del buffered[:body]
+                mac.update(ciphertext)
+                out.write(unpadder.update(decryptor.update(ciphertext)))
+        if decryptor is None or carry or len(buffered) != 32:
+            raise InvalidToken
+        mac.verify(bytes(buffered))
+        out.write(unpadder.update(decryptor.finalize()) + unpadder.finalize())
+    except (InvalidSignature, ValueError, binascii.Error):
+        raise InvalidToken from None
+
+def parse_header(head):
+    """
+    Parse the alpha-channel metadata at the start of the pixel stream.
+    Returns ({folder_name, data_size, compression_method, password_info}, metadata_pixels),
+    or None if the image doesn't carry a complete 4-field header.
+    """
+    chars = []
+    nulls = 0
+    for i in range(min(len(head) // 4, header_scan_pixels)):
+        a = head[4 * i + 3]
+        if a == 255:
+            break
+        chars.append(chr(a - 1))
+        if a == 1:
+            nulls += 1
+            if nulls == 4:
+                folder_name, data_size, compression_method, password_info = ''.join(chars).split('\x00')[:4]
+                header = {
+                    'folder_name': folder_name,
+                    'data_size': int(data_size),
+                    'compression_method': compression_method,
+                    'password_info': password_info,
+                }
+                return header, i + 1
+    return None
+
+class PayloadFile(io.RawIOBase):
+    """
+    Seekable read-only view of the payload bytes inside an image written by the
+    encoder. Pixels are decoded on demand from a streaming PNGReader and only a
+    small LRU of decoded blocks is kept, so ZipFile can read the central
+    directory and single members without materialising the whole image.
+    Seeking backwards past the cache restarts the decode from the top.
+    """
 
-        all_bytes = img.tobytes()
+    def __init__(self, reader, start, length, cache_size=payload_cache_size, cancel_token=None):
+        self._reader = reader
+        self._start = start
+        self._length = length
+        self._pos = 0
+        self._cache = collections.OrderedDict()  # stream offset -> bytes
+        self._cache_bytes = 0
+        self._cache_size = cache_size
+        self._cancel_token = cancel_token
+        self._restart()
+
+    def _restart(self):
+        self._blocks = self._reader.iter_bytes()
+        self._stream_pos = 0
+
+    def _remember(self, offset, block):
+        self._cache[offset] = block
+        self._cache_bytes += len(block)
+        while self._cache_bytes > self._cache_size and len(self._cache) > 1:
+            _, old = self._cache.popitem(last=False)
+            self._cache_bytes -= len(old)
+
+    def _block_at(self, offset):
+        for start, block in self._cache.items():
+            if start <= offset < start + len(block):
+                self._cache.move_to_end(start)
+                return start, block
+        if offset < self._stream_pos:
+            self._restart()
+        for block in self._blocks:
+            check_cancelled(self._cancel_token)
+            start = self._stream_pos
+            self._stream_pos += len(block)
+            if self._stream_pos > self._start:
+                self._remember(start, block)
+            if start <= offset < self._stream_pos:
+                return start, block
+        raise EOFError("Payload extends past the end of the image")
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += self._length
+        self._pos = max(0, pos)
+        return self._pos
+
+    def readinto(self, b):
+        view = memoryview(b).cast('B')
+        wanted = min(len(view), max(0, self._length - self._pos))
+        filled = 0
+        while filled < wanted:
+            offset = self._start + self._pos
+            start, block = self._block_at(offset)
+            chunk = block[offset - start:offset - start + wanted - filled]
+            view[filled:filled + len(chunk)] = chunk
+            filled += len(chunk)
+            self._pos += len(chunk)
+        return filled
+
+class IndexedPayload(io.RawIOBase):
+    """
+    The ZIP of an indexed-layout payload (see encoder.archive_layout): the
+    archive after the index block, except that its central directory is
+    served from the copy in the index. ZipFile then never seeks to the end
+    of the payload, and only rows up to the members it reads are decoded.
+    """
 
-        if mode != 'RGBA':
-            new_bytes = bytearray()
-            for i in range(0, len(all_bytes), channels_per_pixel):
-                new_bytes.extend(all_bytes[i:i+channels_per_pixel])
-                new_bytes.append(255)
-            all_bytes = bytes(new_bytes)
-            channels_per_pixel = 4
+    def __init__(self, payload, start, directory, length):
+        self._payload = payload
+        self.start = start
+        self._directory = directory
+        self._length = length
+        self._tail = length - len(directory)
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            pos += self._length
+        self._pos = max(0, pos)
+        return self._pos
+
+    def readinto(self, b):
+        view = memoryview(b).cast('B')
+        wanted = min(len(view), max(0, self._length - self._pos))
+        filled = 0
+        if self._pos < self._tail and wanted:
+            self._payload.seek(self.start + self._pos)
+            filled = self._payload.readinto(view[:min(wanted, self._tail - self._pos)])
+        if filled < wanted and self._pos + filled >= self._tail:
+            offset = self._pos + filled - self._tail
+            chunk = self._directory[offset:offset + wanted - filled]
+            view[filled:filled + len(chunk)] = chunk
+            filled += len(chunk)
+        self._pos += filled
+        return filled
+
+    def close(self):
+        self._payload.close()
+        super().close()
+
+def _zip_source(payload, header):
+    """
+    What to open the payload's ZIP from: an IndexedPayload when the payload
+    starts with an index block, else the payload itself (ZipFile skips the
+    index block too, by reading the directory from the end).
+    """
+    head = payload.read(len(INDEX_MAGIC) + 8)
+    payload.seek(0)
+    if len(head) < len(INDEX_MAGIC) + 8 or not head.startswith(INDEX_MAGIC):
+        return payload
+    size = int.from_bytes(head[len(INDEX_MAGIC):], 'big')
+    start = len(head) + size
+    if start > header['data_size']:
+        return payload
+    payload.seek(len(head))
+    directory = payload.read(size)
+    payload.seek(0)
+    return IndexedPayload(payload, start, directory, header['data_size'] - start)
+
+def _read_header(reader):
+    """Parse the header from the first rows a PNGReader yields."""
+    head = bytearray()
+    for block in reader.iter_bytes():
+        head += block
+        if len(head) >= header_scan_pixels * 4:
+            break
+    parsed = parse_header(head)
+    if parsed is None:
+        raise ValueError("No valid metadata found in image")
+    return parsed
+
+def read_header(img_path):
+    """
+    Header of an encoded image plus its dimensions, for a quick look.
+    Only the rows holding the metadata are inflated, and neither PIL nor the
+    crypto libraries are loaded unless the PNG can't be streamed.
+    """
+    if not hasattr(img_path, 'read') and not os.path.exists(img_path):
+        raise FileNotFoundError(f"Image not found: {img_path}")
+    try:
+        # Only the first rows are read, so undoing filters on other PNGs costs little
+        reader = PNGReader(img_path, filtered=True)
+        width, height = reader.width, reader.height
+        header, meta_pixels = _read_header(reader)
+    except UnsupportedPNG:
+        header, meta_pixels, payload = open_payload(img_path)
+        payload.close()
+        if hasattr(img_path, 'read'):
+            img_path.seek(0)
+        with pil_image().open(img_path) as img:
+            width, height = img.size
+    return dict(header, width=width, height=height, metadata_pixels=meta_pixels)
+
+def open_payload(img_path, max_pixels=None, cancel_token=None, memory_limit=None):
+    """
+    Locate the payload of an encoded image. Returns (header, metadata_pixels, fileobj).
+    Images written by pngio.write_png are read lazily through PayloadFile;
+    anything else (e.g. older PIL-written images) falls back to a full PIL decode.
+    If that would take more than memory_limit bytes, the rows are unfiltered
+    as they stream instead and the payload is spooled (to disk past the limit).
+    Only PNGs that aren't 8-bit RGBA are refused then.
+    img_path may also be a seekable binary file object.
+    """
+    if not hasattr(img_path, 'read') and not os.path.exists(img_path):
+        raise FileNotFoundError(f"Image not found: {img_path}")
+    try:
+        reader = PNGReader(img_path, filtered=memory_limit is not None)
+        if max_pixels and reader.width * reader.height > max_pixels:
+            raise ValueError(f"Image too large ({reader.width}x{reader.height} pixels)")
+        if reader.unfiltered or reader.size > memory_limit:
+            header, meta_pixels = _read_header(reader)
+            cache_size = payload_cache_size if memory_limit is None else min(payload_cache_size, memory_limit)
+            payload = PayloadFile(reader, meta_pixels * 4, header['data_size'], cache_size, cancel_token)
+            if not reader.unfiltered:
+                # Unfiltering is slow, so rows are decoded once rather than again on every seek back
+                with payload:
+                    payload = _spool(payload, memory_limit, cancel_token)
+            return header, meta_pixels, payload
+    except UnsupportedPNG:
+        pass
+
+    if hasattr(img_path, 'read'):
+        img_path.seek(0)
+    img = pil_image().open(img_path)
+    if max_pixels and img.width * img.height > max_pixels:
+        raise ValueError(f"Image too large ({img.width}x{img.height} pixels)")
+    if memory_limit is not None and img.width * img.height * 4 > memory_limit:
+        raise ValueError(f"Image ({img.width}x{img.height}) can't be streamed and decoding it needs more than "
+                         f"the memory limit of {memory_limit} bytes")
+    if img.mode != 'RGBA':
+        img = img.convert('RGBA')
+    all_bytes = img.tobytes()
+    img.close()
+    parsed = parse_header(all_bytes[:header_scan_pixels * 4])
+    if parsed is None:
+        raise ValueError("No valid metadata found in image")
+    header, meta_pixels = parsed
+    start = meta_pixels * 4
+    return header, meta_pixels, io.BytesIO(all_bytes[start:start + header['data_size']])
+
+def _refuse_atlas(compression_method):
+    if compression_method == 'atlas':
+        raise ValueError("This image is an atlas of several archives; read it with atlas.AtlasReader or 'cli.py atlas'")
+
+def open_archive(img_path, password=None, max_pixels=None, cancel_token=None, memory_limit=None):
+    """
+    Open the ZIP inside an encoded image without extracting it.
+    Returns (ZipFile, header, metadata_pixels); the caller closes the ZipFile.
+    Encrypted archives have to be decrypted whole, so they are read into memory,
+    or with memory_limit into a buffer that moves to a temp file past that size.
+    """
+    header, meta_pixels, payload = open_payload(img_path, max_pixels, cancel_token, memory_limit)
+    if header['compression_method'] == 'atlas':
+        payload.close()
+        _refuse_atlas(header['compression_method'])
+    if header['password_info'] == 'encrypted':
+        with payload:
+            payload = _spool_payload(payload, header, password, memory_limit, cancel_token)
+    else:
+        payload = _zip_source(payload, header)
+    return zipfile.ZipFile(payload, 'r'), header, meta_pixels
+
+def _spool_payload(payload, header, password, memory_limit=None, cancel_token=None):
+    """
+    The (decrypted) ZIP from a payload stream as a seekable file. Without a
+    memory_limit it is a BytesIO; with one, a SpooledTemporaryFile that moves
+    to disk once it outgrows the limit.
+    """
+    if memory_limit is None:
+        data = payload.read()
+        if header['password_info'] == 'encrypted':
+            data = decrypt_payload(data, password)
+        return io.BytesIO(data)
+    if header['password_info'] != 'encrypted':
+        return _spool(payload, memory_limit, cancel_token)
+    spool = tempfile.SpooledTemporaryFile(max_size=memory_limit)
+    try:
+        decrypt_stream(payload, password, spool, cancel_token)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
 
-        metadata = ""
-        metadata_channels_found = 0
-        i = 0
-        while i < len(all_bytes) // 4:
-            alpha_index = 4 * i + 3
-            a = all_bytes[alpha_index]
-            if a != 255:
-                original_byte = a - 1
-                if 0 <= original_byte <= 255:
-                    metadata += chr(original_byte)
-                    metadata_channels_found += 1
-                    if chr(original_byte) == '\x00' and metadata.count('\x00') >= 4:
-                        break
-            i += 1
-            if i > 10000:
+def _spool(src, memory_limit, cancel_token=None):
+    """A copy of src in a SpooledTemporaryFile that moves to disk past memory_limit, rewound."""
+    spool = tempfile.SpooledTemporaryFile(max_size=memory_limit)
+    try:
+        while True:
+            check_cancelled(cancel_token)
+            block = src.read(sync_read_size)
+            if not block:
                 break
+            spool.write(block)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+def list_members(img_path, password=None, max_pixels=None, memory_limit=None):
+    """Header plus the member table (name, sizes, CRC, offsets) of an encoded image"""
+    zipf, header, meta_pixels = open_archive(img_path, password, max_pixels, memory_limit=memory_limit)
+    with zipf:
+        # Offsets of an indexed-layout archive count from the end of the index block
+        zip_offset = meta_pixels * 4 + (zipf.fp.start if isinstance(zipf.fp, IndexedPayload) else 0)
+        members = []
+        for info in zipf.infolist():
+            members.append({
+                'name': info.filename,
+                'is_dir': info.is_dir(),
+                'size': info.file_size,
+                'compressed_size': info.compress_size,
+                'crc32': f'{info.CRC:08x}',
+                'compress_type': info.compress_type,
+                'modified': '%04d-%02d-%02dT%02d:%02d:%02d' % info.date_time,
+                'header_offset': info.header_offset,
+                'image_offset': zip_offset + info.header_offset,
+            })
+    return {
+        'folder_name': header['folder_name'],
+        'compression_method': header['compression_method'],
+        'password_protected': header['password_info'] == 'encrypted',
+        'payload_size': header['data_size'],
+        'metadata_channels': meta_pixels,
+        'members': members,
+    }
+
+def _member_path(output_folder, name):
+    """Where ZipFile.extract puts member name (same sanitizing of absolute and .. parts)."""
+    arcname = os.path.splitdrive(name.replace('/', os.path.sep))[1]
+    parts = [p for p in arcname.split(os.path.sep) if p not in ('', os.path.curdir, os.path.pardir)]
+    return os.path.join(output_folder, *parts)
+
+def _unchanged(info, path, cancel_token=None):
+    """True if path already holds member info: same size first, then same CRC32."""
+    if info.is_dir():
+        return os.path.isdir(path)
+    try:
+        if not os.path.isfile(path) or os.path.getsize(path) != info.file_size:
+            return False
+        crc = 0
+        with open(path, 'rb') as f:
+            while True:
+                check_cancelled(cancel_token)
+                block = f.read(sync_read_size)
+                if not block:
+                    break
+                crc = zlib.crc32(block, crc)
+    except OSError:
+        return False
+    return crc == info.CRC
+
+def _delete_extra(output_folder, names):
+    """Remove files and emptied directories under output_folder that aren't archive members."""
+    top = os.path.normpath(output_folder)
+    keep = {os.path.normpath(_member_path(top, name)) for name in names}
+    keep_dirs = {top}
+    for path in keep:
+        parent = os.path.dirname(path)
+        while parent not in keep_dirs and len(parent) > len(top):
+            keep_dirs.add(parent)
+            parent = os.path.dirname(parent)
+    deleted = []
+    for root, dirs, files in os.walk(top, topdown=False):
+        for name in files + [d for d in dirs if os.path.islink(os.path.join(root, d))]:
+            path = os.path.normpath(os.path.join(root, name))
+            if path not in keep:
+                os.remove(path)
+                deleted.append(path)
+        for name in dirs:
+            path = os.path.normpath(os.path.join(root, name))
+            if path not in keep and path not in keep_dirs and not os.path.islink(path) and not os.listdir(path):
+                os.rmdir(path)
+                deleted.append(path)
+    return deleted
+
+def decode_png_to_folder(img_path, output_folder, progress_callback=None, password=None, log_callback=None, cancel_token=None, phase_callback=None, tracer=None, sync=False, delete_extra=False, memory_limit=None):
+    """
+    Extract an encoded image into output_folder. With sync, members whose
+    file on disk already has the same size and CRC32 are left alone, so
+    re-extracting a new version over an old one only writes what changed;
+    delete_extra also removes files that aren't in the archive. Returns
+    counts of written, unchanged and deleted entries.
+
+    With memory_limit (bytes) the image is streamed instead of decoded
+    whole, and the ZIP is decrypted into a buffer that moves to a temp file
+    once it outgrows the limit.
+    """
+    phases = PhaseTimer(phase_callback, tracer)
+    root_span = tracer.start_span('decode') if tracer else None
+    try:
+        if not os.path.exists(img_path):
+            raise FileNotFoundError(f"Image not found: {img_path}")
 
+        print(Fore.CYAN + f"Loading image: {img_path}" + Style.RESET_ALL)
+        phases.start('png_load')
+        if not os.path.exists(output_folder):
+            os.makedirs(output_folder, exist_ok=True)
 
-        try:
-            if '\x00' in metadata and metadata.count('\x00') >= 4:
-
-                parts = metadata.split('\x00', 4)
-                if len(parts) >= 5:
-                    folder_name = parts[0]
-                    data_size_str = parts[1]
-                    compression_method = parts[2]
-                    password_info = parts[3]
-                    expected_size = int(data_size_str)
-                    print(f"Original folder: {folder_name}")
-                    print(f"Expected data size: {expected_size} bytes")
-                    print(f"Compression method: {compression_method}")
-                    print(f"Total bytes in image: {len(all_bytes)} bytes")
-                elif len(parts) >= 4:
-                    folder_name = parts[0]
-                    data_size_str = parts[1]
-                    compression_method = parts[2]
-                    password_info = "none"
-                    expected_size = int(data_size_str)
-                    print(f"Original folder: {folder_name}")
-                    print(f"Expected data size: {expected_size} bytes")
-                    print(f"Compression method: {compression_method}")
-                    print(f"Total bytes in image: {len(all_bytes)} bytes")
-                else:
-                    print("Incomplete enhanced metadata found, trying legacy format...")
-                    if metadata.count('\x00') >= 2:
-                        parts = metadata.split('\x00', 2)
+        if memory_limit is not None:
+            header, _, payload = open_payload(img_path, cancel_token=cancel_token, memory_limit=memory_limit)
+            compression_method = header['compression_method']
+            _refuse_atlas(compression_method)
+            print(f"Original folder: {header['folder_name']}")
+            print(f"Expected data size: {header['data_size']} bytes")
+            print(f"Compression method: {header['compression_method']}")
+            if header['password_info'] == 'encrypted':
+                phases.start('decrypt', header['data_size'])
+            with payload:
+                zip_bytes = _spool_payload(payload, header, password, memory_limit, cancel_token)
+            if header['password_info'] == 'encrypted':
+                print(Fore.GREEN + "Password protection decrypted" + Style.RESET_ALL)
+            else:
+                phases.add_bytes(header['data_size'])
+        else:
+            img = pil_image().open(img_path)
+
+            width, height = img.size
+            mode = img.mode
+            channels_per_pixel = 4 if mode == 'RGBA' else 3
+            print(Fore.BLUE + f"Image size: {width}x{height} pixels, mode: {mode}, channels: {channels_per_pixel}" + Style.RESET_ALL)
+
+            check_cancelled(cancel_token)
+            all_bytes = img.tobytes()
+            img.close()
+            phases.add_bytes(len(all_bytes))
+
+            if mode != 'RGBA':
+                new_bytes = bytearray()
+                row_bytes = width * channels_per_pixel
+                for i in range(0, len(all_bytes), channels_per_pixel):
+                    if i % row_bytes == 0:
+                        check_cancelled(cancel_token)
+                    new_bytes.extend(all_bytes[i:i+channels_per_pixel])
+                    new_bytes.append(255)
+                all_bytes = bytes(new_bytes)
+                channels_per_pixel = 4
+
+            metadata = ""
+            metadata_channels_found = 0
+            i = 0
+            while i < len(all_bytes) // 4:
+                alpha_index = 4 * i + 3
+                a = all_bytes[alpha_index]
+                if a != 255:
+                    original_byte = a - 1
+                    if 0 <= original_byte <= 255:
+                        metadata += chr(original_byte)
+                        metadata_channels_found += 1
+                        if chr(original_byte) == '\x00' and metadata.count('\x00') >= 4:
+                            break
+                i += 1
+                if i > 10000:
+                    break
+
+            check_cancelled(cancel_token)
+
+            try:
+                if '\x00' in metadata and metadata.count('\x00') >= 4:
+
+                    parts = metadata.split('\x00', 4)
+                    if len(parts) >= 5:
                         folder_name = parts[0]
                         data_size_str = parts[1]
-                        compression_method = "unknown (legacy)"
+                        compression_method = parts[2]
+                        password_info = parts[3]
+                        expected_size = int(data_size_str)
+                        print(f"Original folder: {folder_name}")
+                        print(f"Expected data size: {expected_size} bytes")
+                        print(f"Compression method: {compression_method}")
+                        print(f"Total bytes in image: {len(all_bytes)} bytes")
+                    elif len(parts) >= 4:
+                        folder_name = parts[0]
+                        data_size_str = parts[1]
+                        compression_method = parts[2]
                         password_info = "none"
                         expected_size = int(data_size_str)
-                        print(f"Legacy format detected")
+                        print(f"Original folder: {folder_name}")
+                        print(f"Expected data size: {expected_size} bytes")
+                        print(f"Compression method: {compression_method}")
+                        print(f"Total bytes in image: {len(all_bytes)} bytes")
                     else:
-                        print("No valid metadata found, extracting all data...")
-                        expected_size = None
-                        compression_method = "unknown"
+                        print("Incomplete enhanced metadata found, trying legacy format...")
+                        if metadata.count('\x00') >= 2:
+                            parts = metadata.split('\x00', 2)
+                            folder_name = parts[0]
+                            data_size_str = parts[1]
+                            compression_method = "unknown (legacy)"
+                            password_info = "none"
+                            expected_size = int(data_size_str)
+                            print(f"Legacy format detected")
+                        else:
+                            print("No valid metadata found, extracting all data...")
+                            expected_size = None
+                            compression_method = "unknown"
+                            password_info = "none"
+                elif '\x00' in metadata and metadata.count('\x00') >= 3:
+
+                    parts = metadata.split('\x00', 3)
+                    if len(parts) >= 4:
+                        folder_name = parts[0]
+                        data_size_str = parts[1]
+                        compression_method = parts[2]
+                        password_info = parts[3]
+                        expected_size = int(data_size_str)
+                        print(f"Original folder: {folder_name}")
+                        print(f"Expected data size: {expected_size} bytes")
+                        print(f"Compression method: {compression_method}")
+                        print(f"Total bytes in image: {len(all_bytes)} bytes")
+                    elif len(parts) >= 3:
+                        folder_name = parts[0]
+                        data_size_str = parts[1]
+                        compression_method = parts[2]
                         password_info = "none"
-            elif '\x00' in metadata and metadata.count('\x00') >= 3:
+                        expected_size = int(data_size_str)
+                        print(f"Original folder: {folder_name}")
+                        print(f"Expected data size: {expected_size} bytes")
+                        print(f"Compression method: {compression_method}")
+                        print(f"Total bytes in image: {len(all_bytes)} bytes")
+                    else:
+                        print("Incomplete enhanced metadata found, trying legacy format...")
+                        if metadata.count('\x00') >= 2:
+                            parts = metadata.split('\x00', 2)
+                            folder_name = parts[0]
+                            data_size_str = parts[1]
+                            compression_method = "unknown (legacy)"
+                            password_info = "none"
+                            expected_size = int(data_size_str)
+                            print(f"Legacy format detected")
+                        else:
+                            print("No valid metadata found, extracting all data...")
+                            expected_size = None
+                            compression_method = "unknown"
+                            password_info = "none"
+                elif '\x00' in metadata and metadata.count('\x00') >= 2:
 
-                parts = metadata.split('\x00', 3)
-                if len(parts) >= 4:
+                    parts = metadata.split('\x00', 2)
                     folder_name = parts[0]
                     data_size_str = parts[1]
-                    compression_method = parts[2]
-                    password_info = parts[3]
-                    expected_size = int(data_size_str)
-                    print(f"Original folder: {folder_name}")
-                    print(f"Expected data size: {expected_size} bytes")
-                    print(f"Compression method: {compression_method}")
-                    print(f"Total bytes in image: {len(all_bytes)} bytes")
-                elif len(parts) >= 3:
-                    folder_name = parts[0]
-                    data_size_str = parts[1]
-                    compression_method = parts[2]
+                    compression_method = "unknown (legacy)"
                     password_info = "none"
                     expected_size = int(data_size_str)
-                    print(f"Original folder: {folder_name}")
-                    print(f"Expected data size: {expected_size} bytes")
-                    print(f"Compression method: {compression_method}")
-                    print(f"Total bytes in image: {len(all_bytes)} bytes")
+                    print(f"Legacy metadata format detected")
                 else:
-                    print("Incomplete enhanced metadata found, trying legacy format...")
-                    if metadata.count('\x00') >= 2:
-                        parts = metadata.split('\x00', 2)
-                        folder_name = parts[0]
-                        data_size_str = parts[1]
-                        compression_method = "unknown (legacy)"
-                        password_info = "none"
-                        expected_size = int(data_size_str)
-                        print(f"Legacy format detected")
-                    else:
-                        print("No valid metadata found, extracting all data...")
-                        expected_size = None
-                        compression_method = "unknown"
-                        password_info = "none"
-            elif '\x00' in metadata and metadata.count('\x00') >= 2:
-
-                parts = metadata.split('\x00', 2)
-                folder_name = parts[0]
-                data_size_str = parts[1]
-                compression_method = "unknown (legacy)"
-                password_info = "none"
-                expected_size = int(data_size_str)
-                print(f"Legacy metadata format detected")
-            else:
-                print("No metadata found, extracting all data...")
+                    print("No metadata found, extracting all data...")
+                    expected_size = None
+                    compression_method = "unknown"
+                    password_info = "none"
+            except (ValueError, IndexError) as e:
+                print(f"Error parsing metadata: {e}, extracting all data...")
+                print(f"Metadata parts: {metadata.split(chr(0)) if chr(0) in metadata else 'No null bytes found'}")
                 expected_size = None
                 compression_method = "unknown"
                 password_info = "none"
-        except (ValueError, IndexError) as e:
-            print(f"Error parsing metadata: {e}, extracting all data...")
-            print(f"Metadata parts: {metadata.split(chr(0)) if chr(0) in metadata else 'No null bytes found'}")
-            expected_size = None
-            compression_method = "unknown"
-            password_info = "none"
-            metadata_channels_found = 0
+                metadata_channels_found = 0
 
-        start_byte = metadata_channels_found * 4
-        if expected_size is not None:
-            zip_data_length = int(expected_size)
-        else:
-            zip_data_length = len(all_bytes) - start_byte
-
-        zip_data = all_bytes[start_byte : start_byte + zip_data_length]
-
-        if password_info == "encrypted":
-            if not password:
-                raise ValueError("Password required for encrypted archive")
-            salt = zip_data[:16]
-            encrypted_data = zip_data[16:]
-            kdf = PBKDF2HMAC(
-                algorithm=hashes.SHA256(),
-                length=32,
-                salt=salt,
-                iterations=100000,
-            )
-            key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
-            fernet = Fernet(key)
-            zip_data = fernet.decrypt(encrypted_data)
-            print(Fore.GREEN + "Password protection decrypted" + Style.RESET_ALL)
-        else:
-            print(Fore.GREEN + "No password protection - proceeding with extraction" + Style.RESET_ALL)
+            start_byte = metadata_channels_found * 4
+            if expected_size is not None:
+                zip_data_length = int(expected_size)
+            else:
+                zip_data_length = len(all_bytes) - start_byte
 
-        zip_bytes = io.BytesIO(zip_data)
+            zip_data = all_bytes[start_byte : start_byte + zip_data_length]
+            del all_bytes
+
+            if password_info == "encrypted":
+                phases.start('decrypt', len(zip_data))
+                zip_data = decrypt_payload(zip_data, password)
+                check_cancelled(cancel_token)
+                print(Fore.GREEN + "Password protection decrypted" + Style.RESET_ALL)
+            else:
+                print(Fore.GREEN + "No password protection - proceeding with extraction" + Style.RESET_ALL)
+
+            zip_bytes = io.BytesIO(zip_data)
 
+        _refuse_atlas(compression_method)
+
+        phases.start('extract')
         print(Fore.CYAN + "Extracting files from ZIP data..." + Style.RESET_ALL)
 
         try:
@@ -194,16 +706,34 @@ def decode_png_to_folder(img_path, output_folder, progress_callback=None, passwo
                     file_info.append((f, start_offset, end_offset))
                     cumulative_offset = end_offset
 
+            def extract_member(name):
+                check_cancelled(cancel_token)
+                if sync and _unchanged(zipf.getinfo(name), _member_path(output_folder, name), cancel_token):
+                    return False
+                zipf.extract(name, output_folder)
+                return True
+
+            summary = {'written': 0, 'unchanged': 0, 'deleted': 0}
+
             with zipfile.ZipFile(zip_bytes, 'r') as zipf:
                 file_list = zipf.namelist()
                 print(Fore.BLUE + f"ZIP contains {len(file_list)} files" + Style.RESET_ALL)
-                with ThreadPoolExecutor(max_workers=2) as executor:
-                    futures = {executor.submit(zipf.extract, f, output_folder): (f, start_offset, end_offset) for f, start_offset, end_offset in file_info}
+                # ZipFile.extract creates parent dirs without exist_ok, which races
+                # between workers, so create them all up front
+                for parent in {os.path.dirname(_member_path(output_folder, f)) for f in file_list}:
+                    os.makedirs(parent, exist_ok=True)
+                from concurrent.futures import ThreadPoolExecutor, as_completed
+                executor = ThreadPoolExecutor(max_workers=2)
+                try:
+                    futures = {executor.submit(extract_member, f): (f, start_offset, end_offset) for f, start_offset, end_offset in file_info}
                     extracted = 0
                     for future in as_completed(futures):
                         f, start_offset, end_offset = futures[future]
+                        written = future.result()
+                        summary['written' if written else 'unchanged'] += 1
+                        phases.add_bytes(zipf.getinfo(f).file_size)
                         extracted += 1
-                        msg = f"Extracted: {f}"
+                        msg = f"Extracted: {f}" if written else f"Unchanged: {f}"
                         if log_callback:
                             log_callback(msg)
                         else:
@@ -211,38 +741,171 @@ def decode_png_to_folder(img_path, output_folder, progress_callback=None, passwo
                         if progress_callback:
                             percent = (extracted / len(file_list)) * 100
                             progress_callback(percent, f'Extracting {f}: {extracted}/{len(file_list)}', f, start_offset, end_offset)
+                finally:
+                    executor.shutdown(wait=True, cancel_futures=True)
+
+                if delete_extra:
+                    check_cancelled(cancel_token)
+                    for path in _delete_extra(output_folder, file_list):
+                        summary['deleted'] += 1
+                        msg = f"Deleted: {os.path.relpath(path, output_folder)}"
+                        if log_callback:
+                            log_callback(msg)
+                        else:
+                            print(Fore.YELLOW + msg + Style.RESET_ALL)
 
+            phases.stop()
+            if sync or delete_extra:
+                print(Fore.BLUE + f"Sync: {summary['written']} written, {summary['unchanged']} unchanged, "
+                      f"{summary['deleted']} deleted" + Style.RESET_ALL)
             print(Fore.GREEN + f"Successfully decoded {img_path} -> {output_folder}/" + Style.RESET_ALL)
+            return summary
 
+        except OperationCancelled:
+            raise
         except zipfile.BadZipFile as e:
             print(Fore.RED + f"Error: The image does not contain a valid ZIP archive: {e}" + Style.RESET_ALL)
-            print(Fore.RED + f"ZIP data size: {len(zip_data)} bytes" + Style.RESET_ALL)
+            zip_size = zip_bytes.seek(0, io.SEEK_END)
+            print(Fore.RED + f"ZIP data size: {zip_size} bytes" + Style.RESET_ALL)
 
-            if len(zip_data) > 100:
-                print(Fore.RED + f"First 100 bytes: {zip_data[:100]}" + Style.RESET_ALL)
+            if zip_size > 100:
+                zip_bytes.seek(0)
+                print(Fore.RED + f"First 100 bytes: {zip_bytes.read(100)}" + Style.RESET_ALL)
             raise
         except Exception as e:
             print(Fore.RED + f"Unexpected error during ZIP extraction: {e}" + Style.RESET_ALL)
             traceback.print_exc()
             raise
 
+    except OperationCancelled as e:
+        phases.abort()
+        msg = str(e)
+        if log_callback:
+            log_callback(msg)
+        else:
+            print(Fore.YELLOW + msg + Style.RESET_ALL)
+        raise
     except Exception as e:
+        phases.abort()
         print(Fore.RED + f"Fatal error in decode_png_to_folder: {e}" + Style.RESET_ALL)
         traceback.print_exc()
         raise
+    finally:
+        if root_span is not None:
+            tracer.end_span(root_span)
 
 
-def get_decode_info(img_path):
+def decode_png_to_tar(img_path, output, password=None, progress_callback=None, log_callback=None, cancel_token=None, memory_limit=None):
+    """
+    Stream the archive inside an encoded image to output (a writable binary
+    file object, e.g. sys.stdout.buffer) as an uncompressed tar, one member
+    at a time, without writing anything to disk. img_path may be a path or a
+    seekable file object. Names get the same sanitizing as extraction.
+    A pipeline.StreamSpool source is released once the archive is known to
+    have the indexed layout, since members are then read front to back.
+    """
+    zipf, header, _ = open_archive(img_path, password, cancel_token=cancel_token, memory_limit=memory_limit)
+    if isinstance(zipf.fp, IndexedPayload) and isinstance(img_path, StreamSpool):
+        img_path.release()
+    with zipf, tarfile.open(fileobj=output, mode='w|', format=tarfile.PAX_FORMAT) as tar:
+        infos = zipf.infolist()
+        for done, info in enumerate(infos, 1):
+            check_cancelled(cancel_token)
+            name = _member_path('', info.filename).replace(os.path.sep, '/')
+            if not name:
+                continue
+            entry = tarfile.TarInfo(name)
+            entry.mtime = int(time.mktime(info.date_time + (0, 0, -1)))
+            mode = (info.external_attr >> 16) & 0o7777
+            if info.is_dir():
+                entry.type = tarfile.DIRTYPE
+                entry.mode = mode or 0o755
+                tar.addfile(entry)
+            else:
+                entry.size = info.file_size
+                entry.mode = mode or 0o644
+                with zipf.open(info) as src:
+                    tar.addfile(entry, src)
+            msg = f"Streamed: {name}"
+            if log_callback:
+                log_callback(msg)
+            else:
+                print(Fore.GREEN + msg + Style.RESET_ALL)
+            if progress_callback:
+                progress_callback(done / len(infos) * 100, f'Streaming {name}: {done}/{len(infos)}')
+    return header
+
+def iter_members(img, password=None, cancel_token=None, memory_limit=None):
+    """
+    Yield (name, stream) for every file in an encoded image, in archive
+    order, without writing anything to disk. img is a path, a seekable
+    binary file object or the PNG's bytes. Each stream is a readable binary
+    file object that stays valid until the next pair is requested. Names
+    use '/' and get the same sanitizing as extraction; directories are
+    implied by the names and not yielded.
+    """
+    if isinstance(img, (bytearray, memoryview)) or (isinstance(img, bytes) and img[:8] == b'\x89PNG\r\n\x1a\n'):
+        img = io.BytesIO(img)
+    zipf, _, _ = open_archive(img, password, cancel_token=cancel_token, memory_limit=memory_limit)
+    with zipf:
+        for info in zipf.infolist():
+            check_cancelled(cancel_token)
+            name = _member_path('', info.filename).replace(os.path.sep, '/')
+            if not name or info.is_dir():
+                continue
+            with zipf.open(info) as src:
+                yield name, src
+
+def decode_png_to_sink(img, sink, password=None, cancel_token=None, memory_limit=None):
+    """
+    Decode every file in an encoded image into sink, with no temporary files.
+    sink is either a mapping, which gets each member's bytes under its name
+    (a plain dict works), or a callable sink(name) returning a writable
+    binary file object the member is copied into; the caller closes those.
+    img is as for iter_members. Returns the number of files written.
+    """
+    count = 0
+    for name, src in iter_members(img, password, cancel_token, memory_limit):
+        if hasattr(sink, '__setitem__'):
+            sink[name] = src.read()
+        else:
+            dst = sink(name)
+            while True:
+                check_cancelled(cancel_token)
+                block = src.read(sync_read_size)
+                if not block:
+                    break
+                dst.write(block)
+        count += 1
+    return count
+
+def get_decode_info(img_path, memory_limit=None):
     """
     Get information about the encoded PNG without extracting.
     Returns: folder_name, file_count, total_size, compression_method
+    With memory_limit the image is streamed, and file counts of encrypted archives are 0.
     """
     try:
         if not os.path.exists(img_path):
             raise FileNotFoundError(f"Image not found: {img_path}")
 
         print(Fore.CYAN + f"Loading image for info: {img_path}" + Style.RESET_ALL)
-        img = Image.open(img_path)
+        if memory_limit is not None:
+            header, meta_pixels, payload = open_payload(img_path, memory_limit=memory_limit)
+            file_count = 0
+            total_size = 0
+            with payload:
+                if header['password_info'] != 'encrypted':
+                    try:
+                        with zipfile.ZipFile(_zip_source(payload, header), 'r') as zipf:
+                            infos = zipf.infolist()
+                            file_count = len(infos)
+                            total_size = sum(info.file_size for info in infos)
+                    except zipfile.BadZipFile:
+                        pass
+            return header['folder_name'], file_count, total_size, header['compression_method'], header['password_info'], meta_pixels
+
+        img = pil_image().open(img_path)
 
         width, height = img.size
         mode = img.mode
@@ -308,4 +971,4 @@ def get_decode_info(img_path):
 
     except Exception as e:
         print(f"Error getting decode info: {e}")
-        return "Unknown", 0, 0, "Unknown", 0
+        return "Unknown", 0, 0, "Unknown", "none", 0
@@ -1,25 +1,159 @@
-from PIL import Image
-import os, zipfile, math, sys, traceback, lzma, bz2, hashlib, secrets, io
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-import base64
+import os, zipfile, math, sys, traceback, fnmatch
 from colorama import Fore, Style
+from cancellation import OperationCancelled, check_cancelled
+from pngio import write_png
+from profiling import PhaseTimer
+from autoselect import choose_method
+from readahead import scan_tree, PrefetchReader, TarStreamReader, MemberSource
+from pipeline import (BlockWriter, EncryptStage, PixelSource, SpillBuffer, write_members, zipinfo, tar_zipinfo, member_zipinfo,
+                      index_block)
 
 max_data_size = 500 * 1024 * 1024
 max_size = 90000
+# 'compact': rows of compact_width pixels (one row when the data is smaller) and only
+# as many rows as needed. 'square': the original layout, a square of at least
+# min_size x min_size pixels. The decoder reads both; the header has the exact length.
+image_geometry = 'compact'
+GEOMETRIES = ('compact', 'square')
+# 4096 RGBA pixels make 16 KiB rows: few filter bytes, and one row still fits in L1 cache
+compact_width = 4096
+min_size = 100
+read_chunk_size = 1024 * 1024
+# Files are read ahead of the compressor on read_workers threads, holding at
+# most read_ahead_bytes of unconsumed data
+read_workers = 4
+read_ahead_bytes = 64 * 1024 * 1024
+# Threads compressing members and deflating image bands
+encode_workers = os.cpu_count() or 1
+# 'stream': members in walk order, ZIP central directory at the end of the payload.
+# 'indexed': members grouped by directory and type, and a copy of the central
+# directory before the ZIP, so listing and reading early members only decode the
+# top rows. Encrypted payloads get the order but no index, which would expose names.
+archive_layout = 'stream'
+LAYOUTS = ('stream', 'indexed')
+# hot_files=True puts files matching these first (in this order), if at most hot_max_size bytes
+hot_patterns = ('manifest*', 'MANIFEST*', 'package.json', '*.toml', '*.json', '*.yaml', '*.yml', '*.ini', '*.cfg', 'README*')
+hot_max_size = 64 * 1024
 
-def encode_folder_to_png(folder_path, output_png, compression_method='lzma', progress_callback=None, enable_max_limit=True, password=None, log_callback=None):
-    if not os.path.exists('tmp'):
-        os.makedirs('tmp')
+def encode_folder_to_png(folder_path, output_png, compression_method='lzma', progress_callback=None, enable_max_limit=True, password=None, log_callback=None, cancel_token=None, phase_callback=None, tracer=None, compression_level=None, auto_target=None, member_cache=None, memory_limit=None, geometry=None, layout=None, hot_files=None):
+    # member_cache (a pipeline.MemberCache) carries compressed members over to the next encode of the same folder.
+    # With memory_limit (bytes), read-ahead is capped to it and a payload larger than it is kept in a temp file.
+    # geometry is 'compact' or 'square' (default: image_geometry), layout 'stream' or 'indexed' (default: archive_layout).
+    # hot_files (True for hot_patterns, or a list of glob patterns) stores matching small files first.
+    return _encode(folder_path, None, output_png, compression_method, progress_callback, enable_max_limit, password,
+                   log_callback, cancel_token, phase_callback, tracer, compression_level, auto_target, member_cache,
+                   memory_limit, geometry, layout, hot_files)
+
+def encode_tar_to_png(tar_file, output_png, folder_name='archive', compression_method='lzma', progress_callback=None, enable_max_limit=True, password=None, log_callback=None, cancel_token=None, phase_callback=None, tracer=None, compression_level=None, memory_limit=None, geometry=None, layout=None):
+    """
+    Like encode_folder_to_png, but the files come from a tar stream read front
+    to back (e.g. sys.stdin.buffer) and nothing touches the disk. output_png
+    may be a writable binary file object such as sys.stdout.buffer.
+    folder_name goes in the header. Only regular files are stored, as for
+    folders, and 'auto' isn't available since a stream can't be sampled.
+    Members keep stream order; the indexed layout still adds the index.
+    """
+    return _encode(tar_file, folder_name, output_png, compression_method, progress_callback, enable_max_limit, password,
+                   log_callback, cancel_token, phase_callback, tracer, compression_level, None, memory_limit=memory_limit, geometry=geometry,
+                   layout=layout)
+
+def encode_members_to_png(members, output_png, folder_name='archive', compression_method='lzma', progress_callback=None, enable_max_limit=True, password=None, log_callback=None, cancel_token=None, phase_callback=None, tracer=None, compression_level=None, memory_limit=None, geometry=None, layout=None):
+    """
+    Encode files that only exist in memory. members is an iterable of
+    (name, data) pairs, data being bytes or a readable binary file object
+    (read in chunks, left open); names are paths inside the archive, using
+    '/'. output_png is a path or any writable binary file object, e.g. a
+    BytesIO. Nothing is written to disk unless memory_limit makes the
+    payload spill. Otherwise like encode_tar_to_png.
+    """
+    return _encode(MemberSource(members, read_chunk_size), folder_name, output_png, compression_method, progress_callback,
+                   enable_max_limit, password, log_callback, cancel_token, phase_callback, tracer, compression_level, None,
+                   memory_limit=memory_limit, geometry=geometry, layout=layout)
+
+def order_entries(entries, group=True, hot_files=None):
+    """
+    scan_tree entries in storage order. With group, each directory's files
+    are stored together, sorted by extension then name, so related members
+    sit next to each other in the image. With hot_files, files of at most
+    hot_max_size bytes matching one of its patterns (hot_patterns for True)
+    come first, in pattern order.
+    """
+    patterns = hot_patterns if hot_files is True else tuple(hot_files or ())
+
+    def rank(entry):
+        _, arcname, st = entry
+        if st.st_size <= hot_max_size:
+            name = os.path.basename(arcname)
+            for i, pattern in enumerate(patterns):
+                if fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(arcname, pattern):
+                    return i
+        return len(patterns)
+
+    if not group:
+        return sorted(entries, key=rank)
+    return sorted(entries, key=lambda entry: (rank(entry), os.path.dirname(entry[1]),
+                                              os.path.splitext(entry[1])[1].lower(), entry[1]))
+
+def image_dimensions(metadata, data_length, geometry=None):
+    """(width, height) of the image holding the metadata pixels plus data_length payload bytes."""
+    geometry = geometry or image_geometry
+    if geometry not in GEOMETRIES:
+        raise ValueError(f"Unknown image geometry: {geometry}")
+    pixels = len(metadata) + math.ceil(data_length / 4)
+    if geometry == 'square':
+        side = max(math.ceil(math.sqrt(pixels)), min_size)
+        return side, side
+    width = min(compact_width, pixels)
+    if math.ceil(pixels / width) > max_size:
+        # Widen the rows (by whole compact_width steps) rather than pass the size limit
+        width = compact_width * math.ceil(pixels / (compact_width * max_size))
+    return width, math.ceil(pixels / width)
+
+def _encode(source, tar_name, output_png, compression_method, progress_callback, enable_max_limit, password, log_callback, cancel_token, phase_callback, tracer, compression_level, auto_target, member_cache=None, memory_limit=None, geometry=None, layout=None, hot_files=None):
+    # source is a folder path, or a tar stream or MemberSource when tar_name is given
+    phases = PhaseTimer(phase_callback, tracer)
+    payload = SpillBuffer(memory_limit)
+    read_ahead = read_ahead_bytes if memory_limit is None else max(read_chunk_size, min(read_ahead_bytes, memory_limit))
+    root_span = tracer.start_span('encode', method=compression_method) if tracer else None
 
     try:
-        if not os.path.exists(folder_path):
-            raise FileNotFoundError(f"Folder not found: {folder_path}")
+        if (geometry or image_geometry) not in GEOMETRIES:
+            raise ValueError(f"Unknown image geometry: {geometry}")
+        layout = layout or archive_layout
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown archive layout: {layout}")
+        header_method = compression_method
+        if tar_name is None:
+            folder_path = source
+            if not os.path.exists(folder_path):
+                raise FileNotFoundError(f"Folder not found: {folder_path}")
 
-        if not os.path.isdir(folder_path):
-            raise NotADirectoryError(f"Path is not a directory: {folder_path}")
+            if not os.path.isdir(folder_path):
+                raise NotADirectoryError(f"Path is not a directory: {folder_path}")
 
+            phases.start('walk')
+            entries = scan_tree(folder_path)
+            if layout == 'indexed' or hot_files:
+                entries = order_entries(entries, layout == 'indexed', hot_files)
+            folder_name = os.path.basename(folder_path)
+
+            if compression_method == 'auto':
+                phases.start('auto_select')
+                files = [(path, arcname, st.st_size) for path, arcname, st in entries]
+                choice, _ = choose_method(folder_path, auto_target, cancel_token=cancel_token, files=files, workers=encode_workers)
+                compression_method, compression_level = choice['method'], choice['level']
+                header_method = 'auto:' + choice['label']
+                msg = (f"Auto-selected {choice['label']}: ~{choice['size']} bytes, "
+                       f"~{choice['seconds']:.1f}s to compress (target {auto_target or 'default'})")
+                if log_callback:
+                    log_callback(msg)
+                else:
+                    print(Fore.CYAN + msg + Style.RESET_ALL)
+        else:
+            if compression_method == 'auto':
+                raise ValueError("The 'auto' method needs a folder to sample; choose a method for streams")
+            folder_path = 'member list' if isinstance(source, MemberSource) else 'tar stream'
+            folder_name = tar_name
 
         msg = f"Creating compressed archive from '{folder_path}' using {compression_method}..."
         if log_callback:
@@ -27,8 +161,6 @@ def encode_folder_to_png(folder_path, output_png, compression_method='lzma', pro
         else:
             print(Fore.CYAN + msg + Style.RESET_ALL)
 
-        zip_bytes = io.BytesIO()
-
         if compression_method == 'lzma':
             compression_type = zipfile.ZIP_LZMA
             compresslevel = 1
@@ -47,50 +179,99 @@ def encode_folder_to_png(folder_path, output_png, compression_method='lzma', pro
         else:
             compression_type = zipfile.ZIP_LZMA
             compresslevel = 1
+        if compression_level is not None:
+            compresslevel = compression_level
+
+        # Stages run concurrently: reading (PrefetchReader), compressing members
+        # (write_members), encrypting the ZIP stream as it is written
+        # (EncryptStage), then filling and deflating image bands (write_png).
+        encrypt_stage = EncryptStage(password, payload) if password else None
+        sink = BlockWriter(encrypt_stage.write if encrypt_stage else payload.append)
+        total_files = len(entries) if tar_name is None else None
+        processed = 0
+
+        def member_added(zinfo):
+            nonlocal processed
+            phases.add_bytes(zinfo.file_size)
+            msg = f"Added: {zinfo.filename}"
+            if log_callback:
+                log_callback(msg)
+            else:
+                print(Fore.CYAN + msg + Style.RESET_ALL)
+            processed += 1
+            if progress_callback and total_files and processed % max(1, total_files // 100) == 0:
+                progress_callback((processed / total_files) * 100, f'Adding files: {processed}/{total_files}')
+
+        keep = None
+        try:
+            phases.start('zip')
+            if tar_name is None:
+                zinfos = [zipinfo(arcname, st) for _, arcname, st in entries]
+                cached = [None] * len(entries)
+                if member_cache is not None:
+                    member_cache.begin((compression_type, compresslevel))
+                    signatures = {zinfo.filename: (st.st_size, st.st_mtime_ns, st.st_mode)
+                                  for zinfo, (_, _, st) in zip(zinfos, entries)}
+                    cached = [member_cache.get(zinfo.filename, signatures[zinfo.filename]) for zinfo in zinfos]
+                    keep = lambda zinfo, compressed: member_cache.put(zinfo.filename, signatures[zinfo.filename], compressed)
+                # Only files without a cached copy are read
+                reader = PrefetchReader([path for (path, _, _), hit in zip(entries, cached) if hit is None],
+                                        read_workers, read_ahead, read_chunk_size)
+
+                def folder_members():
+                    index = 0
+                    for zinfo, hit in zip(zinfos, cached):
+                        if hit is None:
+                            yield zinfo, reader.chunks(index)
+                            index += 1
+                        else:
+                            yield zinfo, hit
 
-        with zipfile.ZipFile(zip_bytes, 'w', compression_type, compresslevel=compresslevel) as zipf:
-            total_files = sum(len(files) for _, _, files in os.walk(folder_path))
-            processed = 0
-
-            for root, _, files in os.walk(folder_path):
-                for f in files:
-                    file_path = os.path.join(root, f)
-                    arcname = os.path.relpath(file_path, folder_path)
-                    zipf.write(file_path, arcname)
-                    msg = f"Added: {arcname}"
-                    if log_callback:
-                        log_callback(msg)
-                    else:
-                        print(Fore.CYAN + msg + Style.RESET_ALL)
-                    processed += 1
-                    if progress_callback and processed % max(1, total_files // 100) == 0:
-                        progress_callback((processed / total_files) * 100, f'Adding files: {processed}/{total_files}')
+                members = folder_members()
+            elif isinstance(source, MemberSource):
+                reader = source
+                members = ((member_zipinfo(name, size), chunks) for name, size, chunks in reader.members())
+            else:
+                reader = TarStreamReader(source, read_ahead, read_chunk_size)
+                members = ((tar_zipinfo(member), chunks) for member, chunks in reader.members())
+            with reader, zipfile.ZipFile(sink, 'w', compression_type, compresslevel=compresslevel) as zipf:
+                write_members(zipf, members, encode_workers, cancel_token, member_added, reader.close, keep)
+                if layout == 'indexed' and not password:
+                    # What close() writes now is the central directory
+                    sink.capture()
+            sink.flush()
+            if tar_name is not None and reader.skipped:
+                msg = f"Skipped {len(reader.skipped)} tar entries that are not regular files or whose paths leave the archive: " \
+                      f"{', '.join(reader.skipped[:5])}{' ...' if len(reader.skipped) > 5 else ''}"
+                if log_callback:
+                    log_callback(msg)
+                else:
+                    print(Fore.YELLOW + msg + Style.RESET_ALL)
+            if encrypt_stage:
+                phases.start('encrypt', sink.size)
+                encrypt_stage.close()
+        except BaseException:
+            if encrypt_stage:
+                try:
+                    encrypt_stage.close()
+                except Exception:
+                    pass
+            raise
 
         msg = "ZIP file created successfully."
         if log_callback:
             log_callback(msg)
         else:
             print(Fore.GREEN + msg + Style.RESET_ALL)
+        check_cancelled(cancel_token)
 
-        data = zip_bytes.getvalue()
-
-        msg = f"ZIP size: {len(data)} bytes"
+        msg = f"ZIP size: {sink.size} bytes"
         if log_callback:
             log_callback(msg)
         else:
             print(Fore.BLUE + msg + Style.RESET_ALL)
 
         if password:
-            salt = os.urandom(16)
-            kdf = PBKDF2HMAC(
-                algorithm=hashes.SHA256(),
-                length=32,
-                salt=salt,
-                iterations=100000,
-            )
-            key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
-            fernet = Fernet(key)
-            data = salt + fernet.encrypt(data)
             password_info = "encrypted"
             msg = "Password protection applied"
             if log_callback:
@@ -105,35 +286,34 @@ def encode_folder_to_png(folder_path, output_png, compression_method='lzma', pro
             else:
                 print(Fore.GREEN + msg + Style.RESET_ALL)
 
+        index = index_block(sink.captured) if sink.captured is not None else b''
+        data_length = len(index) + payload.size
+        if payload.spilled:
+            msg = f"Payload is over the memory limit of {memory_limit} bytes; buffered in a temporary file"
+            if log_callback:
+                log_callback(msg)
+            else:
+                print(Fore.BLUE + msg + Style.RESET_ALL)
         pixels_per_byte = 4
-        folder_name = os.path.basename(folder_path)
-        data_size = str(len(data))
-        compression_info = compression_method
+        data_size = str(data_length)
+        compression_info = header_method
         metadata = f"{folder_name}\x00{data_size}\x00{compression_info}\x00{password_info}\x00".encode()
 
-        meta_pixels = len(metadata)
-        data_pixels = math.ceil(len(data) / pixels_per_byte)
-        total_pixels_needed = meta_pixels + data_pixels
-        size = math.ceil(math.sqrt(total_pixels_needed))
+        width, height = image_dimensions(metadata, data_length, geometry)
 
         if enable_max_limit:
-            if len(data) > max_data_size:
-                raise ValueError(f"Data size ({len(data)} bytes) exceeds maximum allowed size ({max_data_size} bytes). "
+            if data_length > max_data_size:
+                raise ValueError(f"Data size ({data_length} bytes) exceeds maximum allowed size ({max_data_size} bytes). "
                                 f"Consider using smaller files or splitting into multiple archives.")
 
-            if size > max_size:
-                raise ValueError(f"Image would be too large ({size}x{size} pixels). "
+            if max(width, height) > max_size:
+                raise ValueError(f"Image would be too large ({width}x{height} pixels). "
                                 f"Maximum allowed size is {max_size}x{max_size} pixels. "
-                                f"Data size: {len(data)} bytes")
+                                f"Data size: {data_length} bytes")
 
-        min_size = 100
-        if size < min_size:
-            size = min_size
+        rgba_length = width * height * 4
 
-        rgba_length = size * size * 4
-        rgba_bytes = bytearray(b'\xFF' * rgba_length)
-
-        msg = f"Creating RGBA image of size {size}x{size} ({pixels_per_byte} bytes per pixel)..."
+        msg = f"Creating RGBA image of size {width}x{height} ({pixels_per_byte} bytes per pixel)..."
         if log_callback:
             log_callback(msg)
         else:
@@ -145,48 +325,48 @@ def encode_folder_to_png(folder_path, output_png, compression_method='lzma', pro
         else:
             print(Fore.CYAN + msg + Style.RESET_ALL)
 
-        for idx, b in enumerate(metadata):
-            offset = idx * 4 + 3
-            if offset < len(rgba_bytes):
-                rgba_bytes[offset] = b + 1
+        # Pixels are produced band by band as the PNG is written, never as one buffer
+        pixels = PixelSource(metadata, payload, rgba_length, index)
 
-        msg = f"Metadata stored in {len(metadata)} alpha channels"
-        if log_callback:
-            log_callback(msg)
-        else:
-            print(Fore.GREEN + msg + Style.RESET_ALL)
-
-        data_start_idx = len(metadata) * pixels_per_byte
-        data_end_idx = data_start_idx + len(data)
-        if data_end_idx <= len(rgba_bytes):
-            # Store data in chunks to show progress and potentially speed up
-            chunk_size = 1024 * 1024  # 1MB chunks
-            total_data = len(data)
-            for i in range(0, total_data, chunk_size):
-                end_i = min(i + chunk_size, total_data)
-                rgba_bytes[data_start_idx + i : data_start_idx + end_i] = data[i:end_i]
-                if progress_callback:
-                    progress_val = 50 + (i / total_data) * 50  # From 50 to 100 during data storage
-                    progress_callback(progress_val, f'Storing data: {i // chunk_size + 1}/{ (total_data + chunk_size - 1) // chunk_size } chunks')
+        def rows_written(rows):
+            check_cancelled(cancel_token)
             if progress_callback:
-                progress_callback(100, 'Complete')
-        else:
-            raise ValueError(f"Data ({len(data)} bytes) too large for image ({len(rgba_bytes)} bytes)")
+                progress_callback(50 + (rows / height) * 50, f'Storing data: {rows}/{height} rows')
+
+        phases.start('png_save', rgba_length)
+        write_png(output_png, width, height, pixels, workers=encode_workers, on_rows=rows_written)
+        del pixels
+        if progress_callback:
+            progress_callback(100, 'Complete')
 
-        msg = f"Data stored in {len(data)} RGBA channels."
+        msg = f"Data stored in {data_length} RGBA channels."
         if log_callback:
             log_callback(msg)
         else:
             print(Fore.GREEN + msg + Style.RESET_ALL)
-        img = Image.frombytes("RGBA", (size, size), rgba_bytes)
-        img.save(output_png, optimize=True)
-        msg = f"Saved compressed image as '{output_png}'"
+        phases.stop()
+        if member_cache is not None:
+            member_cache.commit()
+        msg = f"Saved compressed image as '{getattr(output_png, 'name', output_png)}'"
         if log_callback:
             log_callback(msg)
         else:
             print(Fore.GREEN + msg + Style.RESET_ALL)
 
+    except OperationCancelled as e:
+        phases.abort()
+        msg = str(e)
+        if log_callback:
+            log_callback(msg)
+        else:
+            print(Fore.YELLOW + msg + Style.RESET_ALL)
+        raise
     except Exception as e:
+        phases.abort()
         print(Fore.RED + f"Fatal error in encode_folder_to_png: {e}" + Style.RESET_ALL)
         traceback.print_exc()
         raise
+    finally:
+        payload.close()
+        if root_span is not None:
+            tracer.end_span(root_span)
@@ -0,0 +1,197 @@
+import os
+import math
+import time
+import zlib
+from cancellation import check_cancelled
+from autoselect import (METHOD_CODECS, scan_folder, read_sample, zip_sample, zip_overhead, sample_ratio,
+                        estimate_candidates, pick, per_file_seconds, label, parallel_seconds)
+from pngio import IDAT_SIZE
+import encoder
+
+# Two standard errors: roughly a 95% interval
+CONFIDENCE = 0.95
+Z_SCORE = 2.0
+# Extra relative slack for what sampling can't see (pieces vs whole files, codec warm-up)
+size_model_error = 0.02
+# Extra relative slack on time: machine load and cache effects dominate
+time_model_error = 0.25
+png_probe_size = 1024 * 1024
+
+_kdf_seconds = None
+
+
+def kdf_seconds():
+    """Time of one password key derivation, measured once per process."""
+    global _kdf_seconds
+    if _kdf_seconds is None:
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+        start = time.perf_counter()
+        PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=os.urandom(16), iterations=100000).derive(b'estimate')
+        _kdf_seconds = time.perf_counter() - start
+    return _kdf_seconds
+
+
+def encrypted_size(n):
+    """Exact size of salt + Fernet token for an n-byte payload, as the encoder writes it."""
+    token = 1 + 8 + 16 + (n // 16 + 1) * 16 + 32
+    return 16 + 4 * math.ceil(token / 3)
+
+
+def image_dimensions(payload_size, header_method, folder_name, password_info, geometry=None):
+    """(width, height) the encoder would pick for this payload."""
+    metadata = f"{folder_name}\x00{payload_size}\x00{header_method}\x00{password_info}\x00".encode()
+    return encoder.image_dimensions(metadata, payload_size, geometry)
+
+
+def index_overhead(files):
+    """Bytes the indexed layout adds: the index block header plus a copy of the central directory."""
+    names = sum(len(arcname.encode()) for _, arcname, _ in files)
+    return 16 + len(files) * 46 + names + 22
+
+
+def ratio_bound(sizes, sampled, total):
+    """Half-width of the ~95% interval on sample_ratio (spread of piece ratios, with fpc)."""
+    if sampled >= total or not sampled:
+        return 0.0
+    ratios = [c / r for r, c in sizes if r]
+    n = len(ratios)
+    if n < 2:
+        return 0.5
+    mean = sum(ratios) / n
+    variance = sum((x - mean) ** 2 for x in ratios) / (n - 1)
+    return Z_SCORE * math.sqrt((1 - sampled / total) * variance / n)
+
+
+def _rate(fn, data):
+    """Bytes per second of fn(data)."""
+    if not data:
+        return float('inf')
+    start = time.perf_counter()
+    fn(data)
+    return len(data) / max(time.perf_counter() - start, 1e-6)
+
+
+def estimate_encode(folder_path, compression_method='lzma', password=None, enable_max_limit=True,
+                    compression_level=None, auto_target=None, cancel_token=None, geometry=None, layout=None):
+    """
+    Predict what encode_folder_to_png would produce without running it: ZIP
+    payload size, image dimensions, encode time and whether the size limits
+    would be hit. Sizes and times come with a ~95% range from the sample's
+    spread. Only a small sample of the data is read and compressed.
+    """
+    if not os.path.isdir(folder_path):
+        raise NotADirectoryError(f"Path is not a directory: {folder_path}")
+    started = time.perf_counter()
+
+    files = scan_folder(folder_path)
+    walk_seconds = time.perf_counter() - started
+    total = sum(size for _, _, size in files)
+    check_cancelled(cancel_token)
+
+    header_method = compression_method
+    auto_seconds = 0.0
+    if compression_method == 'auto':
+        start = time.perf_counter()
+        choice = pick(estimate_candidates(folder_path, files=files, cancel_token=cancel_token,
+                                          workers=encoder.encode_workers), auto_target)
+        auto_seconds = time.perf_counter() - start
+        codec, level = choice['method'], choice['level']
+        header_method = 'auto:' + choice['label']
+    else:
+        if compression_method not in METHOD_CODECS:
+            raise ValueError(f"Unknown compression method: {compression_method}")
+        codec = METHOD_CODECS[compression_method]
+        level = compression_level if compression_level is not None else 1
+        if codec == 'lzma':
+            level = None
+
+    pieces, sampled, _ = read_sample(files)
+    check_cancelled(cancel_token)
+    sample_zip, sizes, zip_seconds = zip_sample(pieces, codec, level)
+    ratio = sample_ratio(sizes, sampled, total)
+    overhead = zip_overhead(files)
+    if (layout or encoder.archive_layout) == 'indexed' and not password:
+        overhead += index_overhead(files)
+    zip_size = int(ratio * total) + overhead
+    zip_bound = int((ratio_bound(sizes, sampled, total) + (size_model_error * ratio if sampled < total else 0)) * total)
+
+    password_info = 'encrypted' if password else 'none'
+    sized = encrypted_size if password else (lambda n: n)
+    payload = sized(zip_size)
+    payload_low = sized(max(overhead, zip_size - zip_bound))
+    payload_high = sized(zip_size + zip_bound)
+
+    folder_name = os.path.basename(folder_path)
+    width, height = image_dimensions(payload, header_method, folder_name, password_info, geometry)
+    low = image_dimensions(payload_low, header_method, folder_name, password_info, geometry)
+    high = image_dimensions(payload_high, header_method, folder_name, password_info, geometry)
+
+    # Time: measured walk, extrapolated zip, then encryption and PNG costs measured on the sample.
+    # The encoder compresses members and deflates image bands on encode_workers threads, and
+    # encrypts while zipping, so only encryption that outlasts the zip counts.
+    check_cancelled(cancel_token)
+    workers = encoder.encode_workers
+    scale = total / sampled if sampled else 0
+    phases = {
+        'walk': walk_seconds,
+        'zip': parallel_seconds(zip_seconds * scale, files, workers) + len(files) * per_file_seconds,
+    }
+    if auto_seconds:
+        # The encoder runs the same selection before zipping
+        phases['auto_select'] = auto_seconds
+    probe = sample_zip[:png_probe_size]
+    if password:
+        from cryptography.fernet import Fernet
+        fernet = Fernet(Fernet.generate_key())
+        encrypt_seconds = kdf_seconds() + payload / _rate(fernet.encrypt, probe)
+        phases['encrypt'] = max(0.0, encrypt_seconds - phases['zip'])
+    rgba = width * height * 4
+    padding = max(0, rgba - payload)
+    deflate_seconds = (payload / _rate(lambda d: zlib.compress(d, 9), probe)
+                       + padding / _rate(lambda d: zlib.compress(d, 9), b'\xff' * min(padding, png_probe_size)))
+    phases['png_save'] = deflate_seconds / max(1, min(workers, math.ceil(rgba / IDAT_SIZE)))
+    seconds = sum(phases.values())
+    time_bound = seconds * (time_model_error + (zip_bound / zip_size if zip_size else 0))
+
+    limit_errors = []
+    if enable_max_limit:
+        if payload_high > encoder.max_data_size:
+            limit_errors.append(f"Data size (~{payload} bytes) {'exceeds' if payload > encoder.max_data_size else 'may exceed'} "
+                                f"the maximum of {encoder.max_data_size} bytes")
+        if max(high) > encoder.max_size:
+            limit_errors.append(f"Image (~{width}x{height}) "
+                                f"{'exceeds' if max(width, height) > encoder.max_size else 'may exceed'} "
+                                f"the maximum of {encoder.max_size}x{encoder.max_size} pixels")
+    if not limit_errors:
+        within_limits = 'yes'
+    elif payload > encoder.max_data_size or max(width, height) > encoder.max_size:
+        within_limits = 'no'
+    else:
+        within_limits = 'uncertain'
+
+    return {
+        'folder_name': folder_name,
+        'file_count': len(files),
+        'total_size': total,
+        'compression_method': compression_method,
+        'header_method': header_method,
+        'codec': label(codec, level),
+        'password_protected': bool(password),
+        'payload_size': payload,
+        'payload_size_range': [payload_low, payload_high],
+        'compression_ratio': payload / total if total else None,
+        'image_width': width,
+        'image_height': height,
+        'image_width_range': [low[0], high[0]],
+        'image_height_range': [low[1], high[1]],
+        'encode_seconds': seconds,
+        'encode_seconds_range': [max(0.0, seconds - time_bound), seconds + time_bound],
+        'phase_seconds': phases,
+        'confidence': CONFIDENCE,
+        'within_limits': within_limits,
+        'limit_errors': limit_errors,
+        'sampled_bytes': sampled,
+        'sampled_fraction': sampled / total if total else 1.0,
+        'estimate_seconds': time.perf_counter() - started,
+    }
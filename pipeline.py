@@ -0,0 +1,558 @@
+import io
+import os
+import stat
+import sys
+import posixpath
+import time
+import zlib
+import queue
+import base64
+import zipfile
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from cancellation import check_cancelled
+
+# Compressed chunks a member may queue before its turn to be written
+member_queue_depth = 8
+# Blocks handed from the ZIP writer to the encryption thread
+encrypt_queue_depth = 8
+block_size = 1024 * 1024
+# Starts the payload of an indexed-layout image: magic, 8-byte length, then a
+# copy of the ZIP's central directory (see index_block)
+INDEX_MAGIC = b'IMGFIDX\x01'
+
+
+class _Stopped(Exception):
+    """The pipeline is shutting down; the stage should exit quietly."""
+
+
+def _put(q, item, stop):
+    while True:
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            if stop.is_set():
+                raise _Stopped()
+
+
+def zipinfo(arcname, st):
+    """ZipInfo.from_file(), but from a stat the caller already has."""
+    arcname = os.path.normpath(os.path.splitdrive(arcname)[1])
+    while arcname[0] in (os.sep, os.altsep):
+        arcname = arcname[1:]
+    zinfo = zipfile.ZipInfo(arcname, time.localtime(st.st_mtime)[0:6])
+    zinfo.external_attr = (st.st_mode & 0xFFFF) << 16
+    zinfo.file_size = st.st_size
+    return zinfo
+
+
+class BlockWriter:
+    """
+    Write-only sink that hands data on in block_size pieces. It has no
+    tell/seek, so zipfile writes members with data descriptors instead of
+    seeking back, and every byte is final as soon as it is written.
+    """
+
+    def __init__(self, emit):
+        self._emit = emit
+        self._buffer = bytearray()
+        self.size = 0
+        self.captured = None
+
+    def capture(self):
+        """Also keep a copy of everything written from now on in captured."""
+        self.captured = bytearray()
+
+    def write(self, data):
+        self._buffer += data
+        self.size += len(data)
+        if self.captured is not None:
+            self.captured += data
+        if len(self._buffer) >= block_size:
+            self._emit(bytes(self._buffer))
+            self._buffer.clear()
+        return len(data)
+
+    def flush(self):
+        if self._buffer:
+            self._emit(bytes(self._buffer))
+            self._buffer.clear()
+
+
+class SpillBuffer:
+    """
+    Append-only byte store, read back once in order. Pieces stay in memory
+    until they add up to more than limit bytes; then everything moves to an
+    anonymous temporary file and later pieces are written straight to it.
+    limit=None never spills. In memory, pieces are released as they are read.
+    """
+
+    def __init__(self, limit=None):
+        self._limit = limit
+        self._pieces = deque()
+        self._file = None
+        self._reading = False
+        self.size = 0
+
+    @property
+    def spilled(self):
+        return self._file is not None
+
+    def append(self, data):
+        self.size += len(data)
+        if self._file is not None:
+            self._file.write(data)
+            return
+        self._pieces.append(data)
+        if self._limit is not None and self.size > self._limit:
+            self._file = tempfile.TemporaryFile()
+            while self._pieces:
+                self._file.write(self._pieces.popleft())
+
+    def read(self, n):
+        if self._file is not None:
+            if not self._reading:
+                self._file.seek(0)
+                self._reading = True
+            return self._file.read(n)
+        out = bytearray()
+        while len(out) < n and self._pieces:
+            piece = memoryview(self._pieces[0])
+            take = n - len(out)
+            if len(piece) <= take:
+                out += piece
+                self._pieces.popleft()
+            else:
+                out += piece[:take]
+                self._pieces[0] = piece[take:]
+        return out
+
+    def close(self):
+        self._pieces.clear()
+        if self._file is not None:
+            self._file.close()
+
+
+class StreamSpool(io.RawIOBase):
+    """
+    Seekable read-only view of a forward-only stream such as stdin. Bytes
+    are pulled from the stream only when a read reaches them, and kept so
+    earlier offsets can be read again: in memory up to limit bytes, then in
+    a temporary file (limit=None keeps them in memory). After release()
+    nothing more is kept, so reads must carry on forward from there.
+    """
+
+    def __init__(self, stream, limit=None):
+        self._stream = stream
+        self._spool = tempfile.SpooledTemporaryFile(max_size=limit or 0)
+        self._kept = 0  # bytes in the spool
+        self._pulled = 0  # bytes read from the stream
+        self._pos = 0
+        self._keep = True
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            pos += self._pos
+        elif whence == io.SEEK_END:
+            while self._pull(block_size):
+                pass
+            pos += self._pulled
+        pos = max(0, pos)
+        if pos < self._pulled and (self._spool is None or pos >= self._kept):
+            raise io.UnsupportedOperation("Can't seek back to data the stream spool has released")
+        self._pos = pos
+        return pos
+
+    def release(self):
+        """Stop keeping what is read; the spool is dropped once reads pass its end."""
+        self._keep = False
+        self._drop()
+
+    def _drop(self):
+        if not self._keep and self._spool is not None and self._pos >= self._kept:
+            self._spool.close()
+            self._spool = None
+
+    def _pull(self, n):
+        data = self._stream.read(n)
+        self._pulled += len(data)
+        if self._keep:
+            self._spool.seek(0, io.SEEK_END)
+            self._spool.write(data)
+            self._kept = self._pulled
+        return data
+
+    def readinto(self, b):
+        view = memoryview(b).cast('B')
+        filled = 0
+        while filled < len(view):
+            if self._spool is not None and self._pos < self._kept:
+                self._spool.seek(self._pos)
+                data = self._spool.read(min(len(view) - filled, self._kept - self._pos))
+            else:
+                while self._pulled < self._pos:
+                    if not self._pull(min(block_size, self._pos - self._pulled)):
+                        return filled
+                data = self._pull(len(view) - filled)
+                if not data:
+                    break
+            view[filled:filled + len(data)] = data
+            filled += len(data)
+            self._pos += len(data)
+            self._drop()
+        return filled
+
+    def close(self):
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+        super().close()
+
+
+class Compressed:
+    """A member's compressed data with its CRC and uncompressed size, ready to be written as is."""
+
+    __slots__ = ('chunks', 'crc', 'size')
+
+    def __init__(self, chunks, crc, size):
+        self.chunks = chunks
+        self.crc = crc
+        self.size = size
+
+
+class MemberCache:
+    """
+    Compressed members from the last encode of a folder, keyed by member
+    name. An entry is reused while the file's signature (size, mtime, mode)
+    and the compression settings match, so re-encoding a folder only
+    compresses what changed. Entries only replace the old ones when an
+    encode completes (commit()), which also drops deleted files.
+    """
+
+    def __init__(self):
+        self.settings = None
+        self._entries = {}
+        self._next = {}
+
+    def begin(self, settings):
+        if settings != self.settings:
+            self._entries.clear()
+            self.settings = settings
+        self._next = {}
+
+    def get(self, name, signature):
+        entry = self._entries.get(name)
+        return entry[1] if entry and entry[0] == signature else None
+
+    def put(self, name, signature, compressed):
+        self._next[name] = (signature, compressed)
+
+    def commit(self):
+        self._entries = self._next
+        self._next = {}
+
+
+# zipfile has no public way to add a member whose data is already
+# compressed, so write_members relies on its internals. They are all used
+# here and nowhere else; checked against CPython 3.8 to 3.13.
+_LEVEL_ATTR = 'compress_level' if sys.version_info >= (3, 13) else '_compresslevel'
+_ZIPFILE_INTERNALS = hasattr(zipfile, '_get_compressor') and hasattr(zipfile, '_ZipWriteFile')
+
+
+def _set_compress_level(zinfo, level):
+    setattr(zinfo, _LEVEL_ATTR, level)
+
+
+def _member_compressor(zinfo):
+    return zipfile._get_compressor(zinfo.compress_type, getattr(zinfo, _LEVEL_ATTR))
+
+
+class _Precompressed:
+    """Stands in for a member's compressor when its data arrives already compressed."""
+
+    def flush(self):
+        return b''
+
+
+class _RawMember:
+    """
+    zipf.open(zinfo, 'w') that takes compressed data as is: write() appends
+    it to the archive and finish() records the CRC and uncompressed size
+    for the header zipfile writes on close.
+    """
+
+    def __init__(self, zipf, zinfo, force_zip64=False):
+        if not _ZIPFILE_INTERNALS:
+            raise RuntimeError(f"zipfile in Python {sys.version.split()[0]} lacks the internals "
+                               f"used to write precompressed members")
+        self._dst = zipf.open(zinfo, 'w', force_zip64=force_zip64)
+        self._dst._compressor = _Precompressed()
+
+    def write(self, data):
+        self._dst._fileobj.write(data)
+        self._dst._compress_size += len(data)
+
+    def finish(self, crc, size):
+        self._dst._crc, self._dst._file_size = crc, size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return self._dst.__exit__(*exc)
+
+
+def _compress_member(zinfo, chunks, out, stop, cancel_token):
+    compressor = _member_compressor(zinfo)
+    crc = 0
+    size = 0
+    try:
+        for chunk in chunks:
+            check_cancelled(cancel_token)
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            data = compressor.compress(chunk)
+            if data:
+                _put(out, data, stop)
+        _put(out, compressor.flush(), stop)
+        _put(out, (crc, size), stop)
+    except _Stopped:
+        pass
+    except BaseException as e:
+        try:
+            _put(out, e, stop)
+        except _Stopped:
+            pass
+
+
+def write_members(zipf, members, workers, cancel_token=None, on_member=None, on_stop=None, keep=None):
+    """
+    Add members [(zinfo, chunks)] to zipf in order. A feeder thread pulls
+    members from the iterable and hands them to up to workers compressing
+    threads (zlib, bz2 and lzma release the GIL) while this thread writes
+    finished data in order, so a slow source never stalls the writer. Each
+    member may run at most member_queue_depth chunks ahead of the writer.
+    chunks may instead be a Compressed, which is written without
+    compressing again. A zinfo whose file_size is None (not known up front)
+    is written with ZIP64 sizes, so it may grow past 4 GB; keep(zinfo, compressed) is called for every member
+    when given. on_stop is called on the way out to unblock whatever
+    produces chunks.
+    """
+    stop = threading.Event()
+    ready = queue.Queue(workers)
+    with ThreadPoolExecutor(workers, thread_name_prefix='compress') as pool:
+        def feed():
+            try:
+                for zinfo, chunks in members:
+                    zinfo.compress_type = zipf.compression
+                    _set_compress_level(zinfo, zipf.compresslevel)
+                    if isinstance(chunks, Compressed):
+                        _put(ready, (zinfo, chunks), stop)
+                        continue
+                    out = queue.Queue(member_queue_depth)
+                    pool.submit(_compress_member, zinfo, chunks, out, stop, cancel_token)
+                    _put(ready, (zinfo, out), stop)
+                _put(ready, None, stop)
+            except _Stopped:
+                pass
+            except BaseException as e:
+                try:
+                    _put(ready, e, stop)
+                except _Stopped:
+                    pass
+
+        feeder = threading.Thread(target=feed, daemon=True, name='feed')
+        feeder.start()
+        try:
+            while True:
+                item = ready.get()
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                zinfo, out = item
+                force_zip64 = zinfo.file_size is None
+                if force_zip64:
+                    zinfo.file_size = 0
+                with _RawMember(zipf, zinfo, force_zip64) as dst:
+                    if isinstance(out, Compressed):
+                        compressed = out
+                        for data in compressed.chunks:
+                            dst.write(data)
+                    else:
+                        chunks = []
+                        while True:
+                            item = out.get()
+                            if isinstance(item, BaseException):
+                                raise item
+                            if isinstance(item, tuple):
+                                compressed = Compressed(chunks, *item)
+                                break
+                            dst.write(item)
+                            if keep:
+                                chunks.append(item)
+                    dst.finish(compressed.crc, compressed.size)
+                if keep:
+                    keep(zinfo, compressed)
+                if on_member:
+                    on_member(zinfo)
+        finally:
+            # Unblock workers waiting on a full queue or on the source
+            stop.set()
+            if on_stop:
+                on_stop()
+            feeder.join()
+
+
+def tar_zipinfo(member):
+    """ZipInfo for a regular-file TarInfo. ZIP can't store times before 1980, so those are clamped."""
+    date_time = time.localtime(member.mtime)[0:6]
+    if date_time[0] < 1980:
+        date_time = (1980, 1, 1, 0, 0, 0)
+    zinfo = zipfile.ZipInfo(archive_name(member.name), date_time)
+    zinfo.external_attr = (stat.S_IFREG | member.mode & 0o7777) << 16
+    zinfo.file_size = member.size
+    return zinfo
+
+
+def archive_name(name):
+    """name as stored in the ZIP: normalised and relative. ValueError if it leaves the archive root."""
+    arcname = posixpath.normpath(name).lstrip('/')
+    if arcname in ('', '.', '..') or arcname.startswith('../'):
+        raise ValueError(f"Invalid member name: {name!r}")
+    return arcname
+
+
+def member_zipinfo(name, size=None):
+    """
+    ZipInfo for a member given only by name: a regular file (0644) modified
+    now. size None leaves file_size None, which write_members takes as unknown.
+    """
+    zinfo = zipfile.ZipInfo(archive_name(name), time.localtime()[0:6])
+    zinfo.external_attr = (stat.S_IFREG | 0o644) << 16
+    zinfo.file_size = size
+    return zinfo
+
+
+def index_block(directory):
+    """
+    Payload prefix for the indexed layout: INDEX_MAGIC, the length, then
+    directory (the ZIP's central directory and end records, byte for byte).
+    ZIP readers treat it as data before the archive and skip it.
+    """
+    return INDEX_MAGIC + len(directory).to_bytes(8, 'big') + bytes(directory)
+
+
+def derive_key(password, salt):
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+    kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=100000)
+    return base64.urlsafe_b64encode(kdf.derive(password.encode()))
+
+
+class EncryptStage:
+    """
+    Encrypts a byte stream on its own thread while it is being written.
+    Output (appended to out) is salt + Fernet(key).encrypt(data), byte for
+    byte what the decoder expects; the key is derived on the thread too, so
+    the KDF overlaps with the first members being compressed.
+    """
+
+    def __init__(self, password, out):
+        self._password = password
+        self._out = out
+        self._queue = queue.Queue(encrypt_queue_depth)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True, name='encrypt')
+        self._thread.start()
+
+    def write(self, data):
+        if self._error:
+            raise self._error
+        self._queue.put(data)
+
+    def close(self):
+        """Finish the token; raises if encryption failed."""
+        self._queue.put(None)
+        self._thread.join()
+        if self._error:
+            raise self._error
+
+    def _run(self):
+        finished = False
+        try:
+            # Only encrypted encodes pay for importing the crypto library
+            from cryptography.hazmat.primitives import hashes, padding
+            from cryptography.hazmat.primitives.hmac import HMAC
+            from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+            salt = os.urandom(16)
+            key = base64.urlsafe_b64decode(derive_key(self._password, salt))
+            self._out.append(salt)
+            iv = os.urandom(16)
+            header = b'\x80' + int(time.time()).to_bytes(8, 'big') + iv
+            padder = padding.PKCS7(algorithms.AES.block_size).padder()
+            encryptor = Cipher(algorithms.AES(key[16:]), modes.CBC(iv)).encryptor()
+            mac = HMAC(key[:16], hashes.SHA256())
+            mac.update(header)
+            carry = header
+            while True:
+                data = self._queue.get()
+                if data is None:
+                    finished = True
+                    break
+                ciphertext = encryptor.update(padder.update(data))
+                mac.update(ciphertext)
+                carry = self._encode(carry + ciphertext)
+            ciphertext = encryptor.update(padder.finalize()) + encryptor.finalize()
+            mac.update(ciphertext)
+            self._out.append(base64.urlsafe_b64encode(carry + ciphertext + mac.finalize()))
+        except BaseException as e:
+            self._error = e
+            # Keep draining so the writer never blocks on a dead stage
+            while not finished and self._queue.get() is not None:
+                pass
+
+    def _encode(self, data):
+        # Base64 whole 3-byte groups now, carry the rest into the next block
+        cut = len(data) - len(data) % 3
+        if cut:
+            self._out.append(base64.urlsafe_b64encode(data[:cut]))
+        return data[cut:]
+
+
+class PixelSource:
+    """
+    The image's RGBA bytes as a read()-able stream: metadata in the alpha
+    channel of the first pixels, then prefix (e.g. an index_block), the
+    payload (a SpillBuffer), then 0xFF padding up to total bytes.
+    """
+
+    def __init__(self, metadata, payload, total, prefix=b''):
+        header = bytearray(b'\xff' * (len(metadata) * 4))
+        for index, b in enumerate(metadata):
+            header[index * 4 + 3] = b + 1
+        self._header = memoryview(header + prefix)
+        self._payload = payload
+        self._left = total
+
+    def read(self, n):
+        n = min(n, self._left)
+        out = bytearray(self._header[:n])
+        self._header = self._header[len(out):]
+        if len(out) < n:
+            out += self._payload.read(n - len(out))
+        out += b'\xff' * (n - len(out))
+        self._left -= n
+        return out
@@ -0,0 +1,259 @@
+import struct
+import zlib
+import contextlib
+from collections import deque
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+IDAT_SIZE = 1024 * 1024
+COLOR_TYPE_RGBA = 6
+# Private, unsafe-to-copy chunk marking images whose rows are all unfiltered.
+# Editors that rewrite pixel data must drop it, so its presence can be trusted.
+UNFILTERED_CHUNK = b'imGF'
+
+
+class UnsupportedPNG(Exception):
+    """The PNG uses a feature the streaming reader doesn't handle; fall back to PIL."""
+
+
+def _chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def _zlib_header(level):
+    # CMF for deflate with a 32K window; FLEVEL is informational, set like zlib does
+    flevel = 0 if 0 <= level < 2 else 1 if level < 6 else 2 if level == 6 else 3
+    flg = flevel << 6
+    return bytes([0x78, flg + 31 - (0x7800 + flg) % 31])
+
+
+def _bands(rgba, stride, height, rows_per_band):
+    """Rows of rgba (a buffer or a file-like object) grouped into bands, each row prefixed with filter 0."""
+    view = None if hasattr(rgba, 'read') else memoryview(rgba)
+    for y in range(0, height, rows_per_band):
+        rows = min(rows_per_band, height - y)
+        if view is None:
+            block = rgba.read(rows * stride)
+            if len(block) != rows * stride:
+                raise ValueError(f"Pixel source ended after {y * stride + len(block)} bytes")
+        else:
+            block = view[y * stride:(y + rows) * stride]
+        band = bytearray(rows * (stride + 1))
+        for row in range(rows):
+            band[row * (stride + 1) + 1:(row + 1) * (stride + 1)] = block[row * stride:(row + 1) * stride]
+        yield y + rows, band
+
+
+def _deflate_band(band, level, zdict, last):
+    # A raw deflate run primed with the previous band's tail, ended on a byte
+    # boundary so runs can be concatenated into one stream (as pigz does)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict) if zdict else zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(band) + compressor.flush(zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH)
+
+
+def _deflate_serial(bands, level):
+    compressor = zlib.compressobj(level)
+    for rows, band in bands:
+        yield rows, compressor.compress(band)
+    yield None, compressor.flush()
+
+
+def _deflate_parallel(bands, level, workers):
+    from concurrent.futures import ThreadPoolExecutor
+    yield None, _zlib_header(level)
+    adler = 1
+    zdict = None
+    inflight = deque()
+    with ThreadPoolExecutor(workers, thread_name_prefix='deflate') as pool:
+        band = next(bands, None)
+        while band is not None:
+            rows, data = band
+            band = next(bands, None)
+            adler = zlib.adler32(data, adler)
+            inflight.append((rows, pool.submit(_deflate_band, data, level, zdict, band is None)))
+            zdict = bytes(data[-32768:])
+            while inflight and (len(inflight) > 2 * workers or band is None):
+                rows, future = inflight.popleft()
+                yield rows, future.result()
+    yield None, struct.pack('>I', adler)
+
+
+def write_png(output, width, height, rgba, level=9, workers=1, on_rows=None):
+    """
+    Write 8-bit RGBA pixels as a PNG with filter type 0 (None) on every row.
+    The payload is compressed or encrypted data, so PNG filters buy nothing,
+    and unfiltered rows can be read back as a plain byte stream (see PNGReader).
+    output is a path or a writable binary file object. rgba is a bytes-like
+    object or a file-like object that is read() in order, so the pixels
+    never have to exist in memory all at once.
+
+    With workers > 1, bands of rows (about IDAT_SIZE each) are deflated in
+    parallel while earlier bands are written, at a cost of a few bytes per
+    band. on_rows(rows_written) is called after each band.
+    """
+    if isinstance(output, (str, bytes)) or hasattr(output, '__fspath__'):
+        with open(output, 'wb') as f:
+            return write_png(f, width, height, rgba, level, workers, on_rows)
+
+    stride = width * 4
+    if not hasattr(rgba, 'read') and len(rgba) != stride * height:
+        raise ValueError(f"Expected {stride * height} bytes of RGBA data, got {len(rgba)}")
+
+    output.write(PNG_SIGNATURE)
+    output.write(_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, COLOR_TYPE_RGBA, 0, 0, 0)))
+    output.write(_chunk(UNFILTERED_CHUNK, b'filter=none'))
+
+    rows_per_band = max(1, IDAT_SIZE // (stride + 1))
+    bands = _bands(rgba, stride, height, rows_per_band)
+    if workers > 1 and height > rows_per_band:
+        deflated = _deflate_parallel(bands, level, workers)
+    else:
+        deflated = _deflate_serial(bands, level)
+    pending = []
+    pending_size = 0
+    for rows, out in deflated:
+        if out:
+            pending.append(out)
+            pending_size += len(out)
+        if pending_size >= IDAT_SIZE:
+            output.write(_chunk(b'IDAT', b''.join(pending)))
+            pending = []
+            pending_size = 0
+        if rows and on_rows:
+            on_rows(rows)
+    output.write(_chunk(b'IDAT', b''.join(pending)))
+    output.write(_chunk(b'IEND', b''))
+
+
+def _unfilter_row(kind, row, prev):
+    """Undo PNG filter kind (1-4) on one row of 4-byte pixels in place; prev is the previous row, unfiltered."""
+    n = len(row)
+    if kind == 1:  # Sub
+        for i in range(4, n):
+            row[i] = (row[i] + row[i - 4]) & 0xFF
+    elif kind == 2:  # Up
+        row[:] = bytes([(x + b) & 0xFF for x, b in zip(row, prev)])
+    elif kind == 3:  # Average
+        for i in range(4):
+            row[i] = (row[i] + (prev[i] >> 1)) & 0xFF
+        for i in range(4, n):
+            row[i] = (row[i] + ((row[i - 4] + prev[i]) >> 1)) & 0xFF
+    elif kind == 4:  # Paeth; with no pixel to the left it picks the one above
+        for i in range(4):
+            row[i] = (row[i] + prev[i]) & 0xFF
+        for i in range(4, n):
+            a, b, c = row[i - 4], prev[i], prev[i - 4]
+            pa, pb, pc = abs(b - c), abs(a - c), abs(a + b - 2 * c)
+            row[i] = (row[i] + (a if pa <= pb and pa <= pc else b if pb <= pc else c)) & 0xFF
+    else:
+        raise UnsupportedPNG(f"Unknown PNG filter type {kind}")
+
+
+class PNGReader:
+    """
+    Streaming reader for unfiltered 8-bit RGBA PNGs as written by write_png.
+    Yields the raw pixel bytes in order without ever holding the whole image.
+    With filtered=True it also reads other 8-bit RGBA PNGs (e.g. written by
+    PIL), undoing the row filters with one previous row kept; that runs in
+    Python, so it is much slower. unfiltered tells which kind was opened.
+    Raises UnsupportedPNG for anything else, so callers can fall back to PIL.
+    path is a filename or a seekable binary file object.
+    """
+
+    def __init__(self, path, filtered=False):
+        self.path = path
+        self.filtered = filtered
+        with self._open() as f:
+            if f.read(8) != PNG_SIGNATURE:
+                raise UnsupportedPNG("Not a PNG file")
+            length, kind = struct.unpack('>I4s', f.read(8))
+            if kind != b'IHDR':
+                raise UnsupportedPNG("Missing IHDR")
+            (self.width, self.height, bit_depth, color_type,
+             _compression, _filter, interlace) = struct.unpack('>IIBBBBB', f.read(length))
+            f.seek(4, 1)
+            unfiltered = False
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    break
+                length, kind = struct.unpack('>I4s', header)
+                if kind in (b'IDAT', b'IEND'):
+                    break
+                if kind == UNFILTERED_CHUNK:
+                    unfiltered = True
+                f.seek(length + 4, 1)
+        if bit_depth != 8 or color_type != COLOR_TYPE_RGBA or interlace:
+            raise UnsupportedPNG(f"Unsupported PNG format (depth {bit_depth}, color type {color_type}, interlace {interlace})")
+        if not unfiltered and not filtered:
+            raise UnsupportedPNG("PNG was not written with unfiltered rows")
+        self.unfiltered = unfiltered
+        self.stride = self.width * 4
+
+    @property
+    def size(self):
+        return self.stride * self.height
+
+    def _open(self):
+        if hasattr(self.path, 'read'):
+            self.path.seek(0)
+            return contextlib.nullcontext(self.path)
+        return open(self.path, 'rb')
+
+    def _idat_chunks(self, f):
+        f.seek(8)
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return
+            length, kind = struct.unpack('>I4s', header)
+            if kind == b'IDAT':
+                yield f.read(length)
+                f.seek(4, 1)
+            elif kind == b'IEND':
+                return
+            else:
+                f.seek(length + 4, 1)
+
+    def iter_bytes(self):
+        """Yield the pixel bytes in order, roughly IDAT_SIZE at a time."""
+        row_len = self.stride + 1
+        rows_left = self.height
+        decompressor = zlib.decompressobj()
+        buf = bytearray()
+        prev = bytes(self.stride)
+        with self._open() as f:
+            for data in self._idat_chunks(f):
+                while rows_left:
+                    # Bounded decompress so long runs of padding can't balloon memory
+                    out = decompressor.decompress(data, IDAT_SIZE)
+                    data = decompressor.unconsumed_tail
+                    if not out:
+                        break
+                    buf += out
+                    whole = min(len(buf) // row_len, rows_left)
+                    if not whole:
+                        continue
+                    filtered = any(buf[r * row_len] for r in range(whole))
+                    if filtered and not self.filtered:
+                        raise UnsupportedPNG("Filtered rows are not supported by the streaming reader")
+                    out = bytearray()
+                    view = memoryview(buf)
+                    for r in range(whole):
+                        row = view[r * row_len + 1:(r + 1) * row_len]
+                        if filtered and buf[r * row_len]:
+                            row = bytearray(row)
+                            _unfilter_row(buf[r * row_len], row, prev)
+                        out += row
+                        if filtered:
+                            prev = out[-self.stride:]
+                    row = None
+                    view.release()
+                    if self.filtered:
+                        prev = out[-self.stride:]
+                    del buf[:whole * row_len]
+                    rows_left -= whole
+                    yield bytes(out)
+                if not rows_left:
+                    return
+        if rows_left:
+            raise UnsupportedPNG("Truncated PNG data")
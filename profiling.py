@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def current_rss():
+    """Resident set size of this process in bytes, or None if unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes, or None if unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Span:
+    def __init__(self, name, parent=None, attrs=None):
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs or {}
+        self.nbytes = 0
+        self.start = time.perf_counter()
+        self.wall_start = time.time()
+        self.duration = None
+        self.peak_traced = None
+        self.child_peak_traced = 0
+        self.rss = None
+        self.peak_rss = None
+        self.thread = threading.get_ident()
+
+    @property
+    def throughput(self):
+        """Bytes per second, or None when no bytes were recorded."""
+        if not self.nbytes or not self.duration:
+            return None
+        return self.nbytes / self.duration
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'parent': self.parent.name if self.parent else None,
+            'start': self.wall_start,
+            'duration': self.duration,
+            'bytes': self.nbytes,
+            'peak_traced_memory': self.peak_traced,
+            'rss': self.rss,
+            'peak_rss': self.peak_rss,
+            'attrs': self.attrs,
+        }
+
+
+class Tracer:
+    """
+    Collects timed spans from the encoder and decoder. Each finished span
+    carries its duration, the bytes it processed and memory samples: current
+    and peak RSS, plus the tracemalloc peak when trace_memory is enabled.
+    Listeners are called with every finished span, e.g. to feed metrics.
+    """
+
+    def __init__(self, trace_memory=False, listeners=None):
+        self.spans = []
+        self.listeners = list(listeners or [])
+        self.trace_memory = trace_memory
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def start_span(self, name, **attrs):
+        stack = self._stack()
+        span = Span(name, stack[-1] if stack else None, attrs)
+        stack.append(span)
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        return span
+
+    def end_span(self, span):
+        span.duration = time.perf_counter() - span.start
+        if self.trace_memory and tracemalloc.is_tracing():
+            # Child spans reset the tracemalloc peak, so fold theirs back in
+            span.peak_traced = max(tracemalloc.get_traced_memory()[1], span.child_peak_traced)
+            if span.parent is not None:
+                span.parent.child_peak_traced = max(span.parent.child_peak_traced, span.peak_traced)
+        span.rss = current_rss()
+        span.peak_rss = peak_rss()
+        stack = self._stack()
+        if span in stack:
+            stack.remove(span)
+        with self._lock:
+            self.spans.append(span)
+        for listener in self.listeners:
+            listener(span)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        span = self.start_span(name, **attrs)
+        try:
+            yield span
+        finally:
+            self.end_span(span)
+
+    def report(self):
+        """Phase breakdown table of all recorded spans, in the order they finished."""
+        total = sum(s.duration for s in self.spans if s.parent is None) or 1e-9
+        lines = [f"{'phase':<24}{'seconds':>10}{'share':>8}{'MB':>10}{'MB/s':>10}{'peak RSS MB':>13}"]
+        for s in self.spans:
+            name = ('  ' if s.parent else '') + s.name
+            mb = s.nbytes / (1024 * 1024)
+            rate = f"{s.throughput / (1024 * 1024):.1f}" if s.throughput else '-'
+            rss = f"{s.peak_rss / (1024 * 1024):.1f}" if s.peak_rss else '-'
+            lines.append(f"{name:<24}{s.duration:>10.3f}{s.duration / total:>8.1%}{mb:>10.2f}{rate:>10}{rss:>13}")
+        return '\n'.join(lines)
+
+    def to_chrome_trace(self):
+        """Spans as Chrome trace events, viewable in chrome://tracing or Perfetto."""
+        if not self.spans:
+            return {'traceEvents': []}
+        origin = min(s.wall_start for s in self.spans)
+        events = []
+        for s in self.spans:
+            args = dict(s.attrs, bytes=s.nbytes)
+            if s.peak_traced is not None:
+                args['peak_traced_memory'] = s.peak_traced
+            if s.rss is not None:
+                args['rss'] = s.rss
+            events.append({
+                'name': s.name,
+                'ph': 'X',
+                'ts': (s.wall_start - origin) * 1e6,
+                'dur': s.duration * 1e6,
+                'pid': os.getpid(),
+                'tid': s.thread,
+                'args': args,
+            })
+        return {'traceEvents': events}
+
+    def write(self, path):
+        """Write the spans as a Chrome trace JSON file."""
+        with open(path, 'w') as f:
+            json.dump(self.to_chrome_trace(), f)
+
+
+class PhaseTimer:
+    """
+    Times consecutive phases of an encode/decode. Starting a phase ends the
+    previous one; each finished phase is reported as phase_callback(name, seconds)
+    and, when a tracer is given, as a span carrying the bytes it processed.
+    """
+
+    def __init__(self, phase_callback=None, tracer=None):
+        self.phase_callback = phase_callback
+        self.tracer = tracer
+        self._name = None
+        self._start = None
+        self._span = None
+
+    def start(self, name, nbytes=0):
+        self.stop()
+        self._name = name
+        self._start = time.perf_counter()
+        if self.tracer:
+            self._span = self.tracer.start_span(name)
+            self._span.nbytes = nbytes
+
+    def add_bytes(self, nbytes):
+        if self._span is not None:
+            self._span.nbytes += nbytes
+
+    def abort(self):
+        """End the current phase after a failure: its span is closed but no timing is reported."""
+        if self._span is not None:
+            self._span.attrs['failed'] = True
+            self.tracer.end_span(self._span)
+            self._span = None
+        self._name = None
+
+    def stop(self):
+        if self._name is not None:
+            elapsed = time.perf_counter() - self._start
+            if self.phase_callback:
+                self.phase_callback(self._name, elapsed)
+            if self._span is not None:
+                self.tracer.end_span(self._span)
+                self._span = None
+            self._name = None
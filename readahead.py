@@ -0,0 +1,332 @@
+import os
+import queue
+import tarfile
+import threading
+from collections import deque
+from pipeline import archive_name
+
+# Files may be read this far past the one being consumed, whatever their size
+max_files_ahead = 1024
+
+
+class ReaderClosed(Exception):
+    """Raised inside reader threads when the pool shuts down."""
+
+
+def scan_tree(folder_path):
+    """
+    One os.scandir pass over folder_path. Returns (path, arcname, stat) for
+    every file, in os.walk order (each directory's files, then its
+    subdirectories). Stats come from the scan, so nothing is stat'ed twice.
+    """
+    files = []
+    pending = [folder_path]
+    while pending:
+        top = pending.pop()
+        subdirs = []
+        with os.scandir(top) as it:
+            for entry in it:
+                if entry.is_dir():
+                    # Like os.walk, symlinked directories are listed but not followed
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                    continue
+                files.append((entry.path, os.path.relpath(entry.path, folder_path), entry.stat()))
+        pending.extend(reversed(subdirs))
+    return files
+
+
+class PrefetchReader:
+    """
+    Reads files ahead of the consumer on a small thread pool, so opening and
+    reading the next files overlaps with compressing the current one.
+
+    Chunks waiting to be consumed never exceed budget bytes, except that the
+    lowest file being consumed may always have one chunk in flight (so a
+    single large file can't stall the pipeline). Files are consumed with
+    chunks(index), in order or by several threads at once.
+    """
+
+    def __init__(self, paths, workers=4, budget=64 * 1024 * 1024, chunk_size=1024 * 1024):
+        self._paths = paths
+        self._chunk_size = chunk_size
+        self._budget = max(budget, chunk_size)
+        self._cond = threading.Condition()
+        self._used = 0
+        self._next = 0
+        self._head = 0
+        self._active = set()
+        self._closed = False
+        self._chunks = {}
+        self._pending = {}
+        self._finished = set()
+        self._errors = {}
+        self._threads = [threading.Thread(target=self._worker, daemon=True, name=f'readahead-{i}')
+                         for i in range(max(1, min(workers, len(paths))))]
+        for thread in self._threads:
+            thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._chunks.clear()
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+
+    def _acquire(self, index):
+        n = self._chunk_size
+        with self._cond:
+            while not self._closed and not (self._used + n <= self._budget
+                                            or (index == self._head and not self._pending[index])):
+                self._cond.wait()
+            if self._closed:
+                raise ReaderClosed()
+            self._used += n
+            self._pending[index] += n
+
+    def _read(self, index):
+        with open(self._paths[index], 'rb') as f:
+            while True:
+                self._acquire(index)
+                try:
+                    data = f.read(self._chunk_size)
+                except BaseException:
+                    self._settle(index, b'')
+                    raise
+                self._settle(index, data)
+                if not data:
+                    return
+
+    def _settle(self, index, data):
+        with self._cond:
+            if self._closed:
+                return
+            # Give back what the short read didn't use
+            unused = self._chunk_size - len(data)
+            self._used -= unused
+            self._pending[index] -= unused
+            if data:
+                self._chunks[index].append(data)
+            self._cond.notify_all()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._closed and self._next < len(self._paths) and self._next - self._head > max_files_ahead:
+                    self._cond.wait()
+                if self._closed or self._next >= len(self._paths):
+                    return
+                index = self._next
+                self._next += 1
+                self._chunks[index] = deque()
+                self._pending[index] = 0
+            try:
+                self._read(index)
+            except ReaderClosed:
+                return
+            except Exception as e:
+                with self._cond:
+                    self._errors[index] = e
+                    self._cond.notify_all()
+                continue
+            with self._cond:
+                self._finished.add(index)
+                self._cond.notify_all()
+
+    def chunks(self, index):
+        """Yield the contents of file index in chunks. Read errors are raised here."""
+        with self._cond:
+            self._active.add(index)
+            self._head = min(self._active)
+            self._cond.notify_all()
+        try:
+            while True:
+                with self._cond:
+                    while True:
+                        queued = self._chunks.get(index)
+                        if queued or index in self._errors or index in self._finished or self._closed:
+                            break
+                        self._cond.wait()
+                    if queued:
+                        data = queued.popleft()
+                    elif index in self._errors:
+                        raise self._errors.pop(index)
+                    else:
+                        self._finished.discard(index)
+                        self._chunks.pop(index, None)
+                        self._pending.pop(index, None)
+                        return
+                yield data
+                with self._cond:
+                    self._used -= len(data)
+                    self._pending[index] -= len(data)
+                    self._cond.notify_all()
+        finally:
+            with self._cond:
+                self._active.discard(index)
+                self._head = min(self._active, default=index + 1)
+                self._cond.notify_all()
+
+
+class TarStreamReader:
+    """
+    Regular-file members of a tar stream, read front to back on one thread
+    (tarfile 'r|*', so plain, gzip, bz2 and xz tars all work). members()
+    yields (TarInfo, chunks) in stream order. At most budget bytes of member
+    data wait unconsumed; since the stream can't seek, a member's chunks
+    must be consumed before later members' data arrives. Directories are
+    implied by file paths; other entries (links, devices) and files whose
+    path leaves the archive root (e.g. '../x') are listed in skipped.
+    """
+
+    def __init__(self, fileobj, budget=64 * 1024 * 1024, chunk_size=1024 * 1024, members_ahead=64):
+        self._fileobj = fileobj
+        self._chunk_size = chunk_size
+        self._tokens = threading.Semaphore(max(1, budget // chunk_size))
+        self._members = queue.Queue(members_ahead)
+        self._closed = threading.Event()
+        self.skipped = []
+        self._thread = threading.Thread(target=self._run, daemon=True, name='tar-reader')
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # The thread may be blocked reading the stream itself, so it isn't joined
+        self._closed.set()
+
+    def _wait(self, wait):
+        while not wait():
+            if self._closed.is_set():
+                raise ReaderClosed()
+
+    def _run(self):
+        chunks = None
+        try:
+            with tarfile.open(fileobj=self._fileobj, mode='r|*') as tar:
+                for member in tar:
+                    if not member.isfile():
+                        if not member.isdir():
+                            self.skipped.append(member.name)
+                        continue
+                    try:
+                        archive_name(member.name)
+                    except ValueError:
+                        self.skipped.append(member.name)
+                        continue
+                    chunks = queue.Queue()
+                    self._wait(lambda: _offer(self._members, (member, chunks)))
+                    src = tar.extractfile(member)
+                    while True:
+                        self._wait(lambda: self._tokens.acquire(timeout=0.1))
+                        data = src.read(self._chunk_size)
+                        if not data:
+                            self._tokens.release()
+                            break
+                        chunks.put(data)
+                    chunks.put(None)
+                    chunks = None
+            self._wait(lambda: _offer(self._members, None))
+        except ReaderClosed:
+            pass
+        except Exception as e:
+            # `e` is unbound when the except block ends; the lambda needs its own name
+            error = e
+            if chunks is not None:
+                chunks.put(error)
+            try:
+                self._wait(lambda: _offer(self._members, error))
+            except ReaderClosed:
+                pass
+
+    def _take(self, q):
+        while True:
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                if self._closed.is_set():
+                    return None
+
+    def _chunks(self, chunks):
+        while True:
+            data = self._take(chunks)
+            if data is None:
+                return
+            if isinstance(data, Exception):
+                raise data
+            self._tokens.release()
+            yield data
+
+    def members(self):
+        while True:
+            item = self._take(self._members)
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            member, chunks = item
+            yield member, self._chunks(chunks)
+
+
+class MemberSource:
+    """
+    Members handed over by the caller as (name, data) pairs, data being a
+    bytes-like object or a readable binary file object. members() yields
+    (name, size, chunks) in order, like TarStreamReader; bytes are sliced
+    into chunk_size pieces without copying and file objects are read where
+    they are (and left open, they belong to the caller). size is None when
+    it isn't known up front.
+    """
+
+    skipped = ()
+
+    def __init__(self, members, chunk_size=1024 * 1024):
+        self._members = members
+        self._chunk_size = chunk_size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        pass
+
+    def members(self):
+        for name, data in self._members:
+            if hasattr(data, 'read'):
+                yield name, None, self._read(data)
+            else:
+                view = memoryview(data).cast('B')
+                yield name, len(view), self._slice(view)
+
+    def _slice(self, view):
+        for start in range(0, len(view), self._chunk_size):
+            yield view[start:start + self._chunk_size]
+
+    def _read(self, f):
+        while True:
+            data = f.read(self._chunk_size)
+            if not data:
+                return
+            yield data
+
+
+def _offer(q, item):
+    try:
+        q.put(item, timeout=0.1)
+        return True
+    except queue.Full:
+        return False
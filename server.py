@@ -2,32 +2,54 @@ import os
 import io
 import time
 import shutil
+import atexit
+import signal
+import sys
 import logging
+import logging.handlers
+import queue
 import tempfile
 import zipfile
 import threading
 import hmac
+import select
+import socket
+import json
+import tarfile
+import mimetypes
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
 from functools import wraps
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, request, jsonify, send_file, Response, g
 from flask_compress import Compress
 from flask_cors import CORS
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from werkzeug.utils import secure_filename
-from encoder import encode_folder_to_png
-from decoder import decode_png_to_folder, get_decode_info
+from cancellation import CancelToken, OperationCancelled, check_cancelled
+from uploads import UploadStore, UploadError
+from autoselect import DEFAULT_TARGET, parse_target
+from metrics import Registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
 
-# Configure logging
+# Configure logging: request threads only enqueue records, a listener thread does the I/O
+log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+log_handlers = [logging.StreamHandler(), logging.FileHandler('server.log')]
+for handler in log_handlers:
+    handler.setFormatter(log_formatter)
+log_queue = queue.SimpleQueue()
+log_listener = logging.handlers.QueueListener(log_queue, *log_handlers)
+log_listener.start()
+atexit.register(log_listener.stop)
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('server.log')
-    ]
+    format='%(message)s',
+    handlers=[logging.handlers.QueueHandler(log_queue)]
 )
 logger = logging.getLogger(__name__)
 
+# Log one progress line per this many percent per job instead of every callback
+PROGRESS_LOG_STEP = float(os.environ.get('PROGRESS_LOG_STEP', '10'))
+
 app = Flask(__name__)
 CORS(app)
 Compress(app)  # Enable gzip compression for responses
@@ -38,6 +60,24 @@ limiter = Limiter(app, key_func=get_remote_address)
 # Load API key from environment variable
 API_KEY = os.environ.get('API_KEY', None)
 RATE_LIMIT = os.environ.get('RATE_LIMIT', '1 per 5 seconds')
+REQUEST_TIMEOUT = float(os.environ.get('REQUEST_TIMEOUT', '3600'))  # seconds, 0 disables
+# End of input after the body means the client quit (Ctrl-C, closed tab and killed processes all send a FIN).
+# Set false for clients that half-close after sending the body and still wait for the response
+CANCEL_ON_CLIENT_EOF = os.environ.get('CANCEL_ON_CLIENT_EOF', 'true').lower() == 'true'
+WORKERS = int(os.environ.get('WORKERS') or os.cpu_count() or 4)
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '500'))
+PORT = int(os.environ.get('PORT') or 4362)
+ALLOWED_METHODS = {'zlib', 'lzma', 'bz2', 'zip_lzma', 'zip_bz2', 'auto'}
+# Per-job budget for payload buffers; larger ones move to temp files (unset or 0 = no limit)
+MEMORY_LIMIT = int(float(os.environ.get('MEMORY_LIMIT_MB') or 0) * 1024 * 1024) or None
+# Default goal for compression_method=auto, overridable per request with auto_target
+AUTO_TARGET = os.environ.get('AUTO_TARGET') or DEFAULT_TARGET
+# 'indexed' puts a copy of the file list at the top so /api/list and /api/member decode only the rows they
+# need; with 'stream' they decode the whole image
+ARCHIVE_LAYOUT = os.environ.get('ARCHIVE_LAYOUT') or 'indexed'
+
+# Shared pool for batch items so one request can keep every core busy
+worker_pool = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix='worker')
 
 # Set limits only if no API key (unauthenticated access)
 if not API_KEY:
@@ -48,6 +88,19 @@ if API_KEY:
 else:
     logger.warning("No API_KEY set - server is running without authentication!")
 
+# Resumable uploads are spooled here; unauthenticated uploads keep the same total cap
+UPLOAD_DIR = os.environ.get('UPLOAD_DIR') or os.path.join(tempfile.gettempdir(), 'imgfile_uploads')
+UPLOAD_TTL = float(os.environ.get('UPLOAD_TTL', '86400'))
+# A zip/tar upload is refused (413) if it would unpack to more than this (0 = no limit)
+UNPACK_MAX_BYTES = int(float(os.environ.get('UNPACK_MAX_MB') or 2048) * 1024 * 1024) or None
+UNPACK_MAX_FILES = int(os.environ.get('UNPACK_MAX_FILES') or 100000) or None
+# Open uploads one client address may hold (0 = no limit)
+UPLOAD_MAX_PER_CLIENT = int(os.environ.get('UPLOAD_MAX_PER_CLIENT') or 20) or None
+upload_store = UploadStore(UPLOAD_DIR, max_size=app.config.get('MAX_CONTENT_LENGTH'), ttl=UPLOAD_TTL,
+                           max_per_owner=UPLOAD_MAX_PER_CLIENT)
+# Clears spool files left by a previous run, then expires idle uploads even when none are being created
+upload_store.start_expiry()
+
 def require_api_key(f):
     """Decorator to require API key authentication"""
     @wraps(f)
@@ -71,6 +124,79 @@ def require_api_key(f):
     
     return decorated_function
 
+# Prometheus metrics
+metrics = Registry()
+http_requests = metrics.counter('imgfile_http_requests_total', 'HTTP requests handled', ('endpoint', 'method', 'status'))
+http_latency = metrics.histogram('imgfile_http_request_duration_seconds', 'Time to produce a response', ('endpoint',))
+http_bytes_in = metrics.counter('imgfile_http_request_bytes_total', 'Request body bytes received', ('endpoint',))
+http_bytes_out = metrics.counter('imgfile_http_response_bytes_total', 'Response body bytes sent', ('endpoint',))
+http_in_flight = metrics.gauge('imgfile_http_requests_in_flight', 'Requests currently being handled')
+job_phase_seconds = metrics.histogram('imgfile_job_phase_duration_seconds', 'Encode/decode time per phase', ('operation', 'phase'))
+job_results = metrics.counter('imgfile_jobs_total', 'Encode/decode jobs by outcome', ('operation', 'outcome'))
+
+# Job temp dirs live under one dir per process, so the gauge counts only this server's
+TEMP_ROOT = tempfile.mkdtemp(prefix='imgfile_')
+atexit.register(shutil.rmtree, TEMP_ROOT, True)
+# The disk gauge walks the tree, so scrapes within this many seconds reuse the last total
+DISK_USAGE_TTL = 10
+_disk_usage = (0.0, 0)
+
+def temp_disk_usage():
+    """Bytes currently held in this server's temp dirs and upload spool"""
+    global _disk_usage
+    checked, total = _disk_usage
+    if time.monotonic() - checked < DISK_USAGE_TTL:
+        return total
+    total = 0
+    for root_dir in (TEMP_ROOT, UPLOAD_DIR):
+        for root, dirs, files in os.walk(root_dir):
+            for f in files:
+                try:
+                    total += os.lstat(os.path.join(root, f)).st_size
+                except OSError:
+                    pass
+    _disk_usage = (time.monotonic(), total)
+    return total
+
+metrics.gauge('imgfile_temp_disk_bytes', 'Bytes used by temp dirs and the upload spool', callback=temp_disk_usage)
+
+def endpoint_label():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.perf_counter()
+    http_in_flight.inc()
+    http_bytes_in.inc(request.content_length or 0, endpoint=endpoint_label())
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = endpoint_label()
+    if 'request_start' in g:  # absent when an earlier before_request (e.g. the rate limiter) aborted
+        http_latency.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+    http_requests.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    if response.content_length is not None:
+        http_bytes_out.inc(response.content_length, endpoint=endpoint)
+    elif response.is_streamed:
+        body = response.response
+
+        def counted():
+            for chunk in body:
+                http_bytes_out.inc(len(chunk), endpoint=endpoint)
+                yield chunk
+        response.response = counted()
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc):
+    if 'request_start' in g:
+        http_in_flight.dec()
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), mimetype=METRICS_CONTENT_TYPE)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -90,6 +216,189 @@ def cleanup_temp_dir_async(temp_dir):
     thread = threading.Thread(target=cleanup, daemon=True)
     thread.start()
 
+def client_disconnected(sock):
+    """
+    True once the client has gone: end of input after the body (unless
+    CANCEL_ON_CLIENT_EOF is off, for clients that half-close and wait), or a
+    reset or broken connection.
+    """
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+        if not readable:
+            return False
+        return sock.recv(1, socket.MSG_PEEK) == b'' and CANCEL_ON_CLIENT_EOF
+    except (OSError, ValueError):
+        return True
+
+@contextmanager
+def request_cancel_token():
+    """
+    Cancel token for the current request. Fires when the client hangs up
+    or REQUEST_TIMEOUT passes, so abandoned jobs stop burning CPU.
+    """
+    token = CancelToken(REQUEST_TIMEOUT or None)
+    sock = request.environ.get('werkzeug.socket')
+    done = threading.Event()
+
+    def watch():
+        while not done.wait(0.5):
+            if token.cancelled:
+                return
+            if sock is not None and client_disconnected(sock):
+                token.cancel('client disconnected')
+                return
+
+    watcher = threading.Thread(target=watch, daemon=True)
+    watcher.start()
+    try:
+        yield token
+    finally:
+        done.set()
+
+def cancelled_response(e, token):
+    logger.warning(f"[{request.remote_addr}] Request cancelled: {token.reason}")
+    if token.reason == 'deadline exceeded':
+        return jsonify({'error': 'Request timed out'}), 504
+    return jsonify({'error': str(e)}), 499
+
+def save_uploads(files, input_dir):
+    """Save uploaded files flat into input_dir"""
+    os.makedirs(input_dir, exist_ok=True)
+    for file in files:
+        if file.filename:
+            filepath = secure_filename(file.filename)
+            filepath = filepath.replace('/', os.sep)
+            filepath = os.path.basename(filepath) # they aint getting past this shi
+            full_path = os.path.join(input_dir, filepath)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            file.save(full_path)
+            logger.debug(f"Saved file: {filepath}")
+
+def job_callbacks(tag, operation):
+    """
+    Log/progress/phase callbacks for one encode or decode. Per-file lines go to
+    DEBUG and progress is sampled every PROGRESS_LOG_STEP percent.
+    """
+    def log_callback(msg):
+        if msg.startswith(('Added:', 'Extracted:')):
+            logger.debug(f"[{tag}] {msg}")
+        else:
+            logger.info(f"[{tag}] {msg}")
+
+    last_logged = [-PROGRESS_LOG_STEP]
+
+    def progress_callback(percent, message='', *args):
+        if percent >= 100 or percent - last_logged[0] >= PROGRESS_LOG_STEP:
+            last_logged[0] = percent
+            logger.info(f"[{tag} Progress] {percent:.1f}% - {message}")
+
+    def phase_callback(phase, seconds):
+        job_phase_seconds.observe(seconds, operation=operation, phase=phase)
+
+    return log_callback, progress_callback, phase_callback
+
+@contextmanager
+def job_outcome(operation):
+    try:
+        yield
+    except OperationCancelled:
+        job_results.inc(operation=operation, outcome='cancelled')
+        raise
+    except Exception:
+        job_results.inc(operation=operation, outcome='error')
+        raise
+    job_results.inc(operation=operation, outcome='ok')
+
+def read_auto_target():
+    """auto_target form field (or the AUTO_TARGET default); raises ValueError if malformed."""
+    target = request.form.get('auto_target') or AUTO_TARGET
+    parse_target(target)
+    return target
+
+def run_encode(input_dir, output_path, compression_method, enable_limit, password, token, tag='Encoder', auto_target=None):
+    from encoder import encode_folder_to_png
+    log_callback, progress_callback, phase_callback = job_callbacks(tag, 'encode')
+    with job_outcome('encode'):
+        encode_folder_to_png(
+            input_dir,
+            output_path,
+            compression_method,
+            progress_callback,
+            enable_limit,
+            password,
+            log_callback,
+            cancel_token=token,
+            phase_callback=phase_callback,
+            auto_target=auto_target,
+            memory_limit=MEMORY_LIMIT,
+            layout=ARCHIVE_LAYOUT
+        )
+
+def run_decode(input_png, output_dir, password, token, tag='Decoder'):
+    from decoder import decode_png_to_folder
+    log_callback, progress_callback, phase_callback = job_callbacks(tag, 'decode')
+    os.makedirs(output_dir, exist_ok=True)
+    with job_outcome('decode'):
+        decode_png_to_folder(
+            input_png,
+            output_dir,
+            progress_callback,
+            password,
+            log_callback,
+            cancel_token=token,
+            phase_callback=phase_callback,
+            memory_limit=MEMORY_LIMIT
+        )
+
+def zip_folder(zipf, folder, token, prefix=''):
+    """Add every file under folder to an open ZipFile, optionally under a prefix"""
+    for root, dirs, files in os.walk(folder):
+        for f in files:
+            check_cancelled(token)
+            file_path = os.path.join(root, f)
+            arcname = os.path.join(prefix, os.path.relpath(file_path, folder))
+            zipf.write(file_path, arcname)
+
+def png_info(png_path):
+    """Info dict for an encoded PNG, as returned by /api/info"""
+    from decoder import get_decode_info, pil_image
+    Image = pil_image()
+    if not API_KEY:
+        Image.MAX_IMAGE_PIXELS = 50_000_000  # Prevent image bomb attacks on unauthenticated access
+    folder_name, file_count, total_size, compression_method, password_info, metadata_channels = get_decode_info(png_path, MEMORY_LIMIT)
+
+    img = Image.open(png_path)
+    img.verify()
+    with Image.open(png_path) as img: # lets us not decode the whole fuckass image
+        width, height = img.size
+
+    return {
+        'folder_name': folder_name,
+        'file_count': file_count,
+        'total_size': total_size,
+        'total_size_mb': round(total_size / (1024 * 1024), 2),
+        'compression_method': compression_method,
+        'password_protected': password_info == 'encrypted',
+        'image_width': width,
+        'image_height': height,
+        'metadata_channels': metadata_channels
+    }
+
+def unique_item_names(names):
+    """Sanitised, de-duplicated names for batch items"""
+    seen = set()
+    result = []
+    for i, name in enumerate(names):
+        base = secure_filename(name or '') or f'item_{i}'
+        candidate = base
+        n = 1
+        while candidate in seen:
+            candidate = f'{base}_{n}'
+            n += 1
+        seen.add(candidate)
+        result.append(candidate)
+    return result
+
 @app.route('/api/compress', methods=['POST'])
 @limiter.limit(RATE_LIMIT)
 @require_api_key
@@ -98,7 +407,7 @@ def compress_folder():
     Compress a folder to PNG synchronously
     """
     start_time = time.time()
-    temp_dir = tempfile.mkdtemp(prefix='compress_')
+    temp_dir = tempfile.mkdtemp(prefix='compress_', dir=TEMP_ROOT)
     logger.info(f"[{request.remote_addr}] Starting compression request. Temp dir: {temp_dir}")
     
     try:
@@ -108,10 +417,14 @@ def compress_folder():
             return jsonify({'error': 'No files provided'}), 400
         
         files = request.files.getlist('files')
-        ALLOWED = {'zlib','lzma','bz2','zip_lzma','zip_bz2'}
         compression_method = request.form.get('compression_method', 'zlib')  # Changed default to zlib for speed
-        if compression_method not in ALLOWED:
+        if compression_method not in ALLOWED_METHODS:
             return jsonify({'error':'invalid compression method'}), 400 # we ant blindly accepting the method gng
+        try:
+            auto_target = read_auto_target()
+        except ValueError as e:
+            cleanup_temp_dir_async(temp_dir)
+            return jsonify({'error': str(e)}), 400
 
         enable_limit = request.form.get('enable_limit', 'true').lower() == 'true'
         password = request.form.get('password', None)
@@ -121,43 +434,22 @@ def compress_folder():
             
         logger.info(f"Processing {len(files)} files. Method: {compression_method}, Password: {'Yes' if password else 'No'}")
         
-        # Create input directory for files
-        input_dir = os.path.join(temp_dir, 'input')
-        os.makedirs(input_dir, exist_ok=True)
-        
         # Save uploaded files with streaming
-        for file in files:
-            if file.filename:
-                filepath = secure_filename(file.filename)
-                filepath = filepath.replace('/', os.sep)
-                filepath = os.path.basename(filepath) # they aint getting past this shi
-                full_path = os.path.join(input_dir, filepath)
-                os.makedirs(os.path.dirname(full_path), exist_ok=True)
-                file.save(full_path)
-                logger.debug(f"Saved file: {filepath}")
+        input_dir = os.path.join(temp_dir, 'input')
+        save_uploads(files, input_dir)
         
         # Output file path
         output_filename = f'compressed_{int(time.time())}.png'
         output_path = os.path.join(temp_dir, output_filename)
-        
-        # Define callbacks for logging
-        def log_callback(msg):
-            logger.info(f"[Encoder] {msg}")
-            
-        def progress_callback(percent, message=''):
-            logger.info(f"[Encoder Progress] {percent:.1f}% - {message}")
 
         # Run compression
         logger.info("Starting encoding process...")
-        encode_folder_to_png(
-            input_dir,
-            output_path,
-            compression_method,
-            progress_callback,
-            enable_limit,
-            password,
-            log_callback
-        )
+        with request_cancel_token() as token:
+            try:
+                run_encode(input_dir, output_path, compression_method, enable_limit, password, token, auto_target=auto_target)
+            except OperationCancelled as e:
+                cleanup_temp_dir_async(temp_dir)
+                return cancelled_response(e, token)
         logger.info("Encoding complete.")
         
         # Stream the file back
@@ -192,7 +484,7 @@ def extract_png():
     Extract PNG to folder synchronously
     """
     start_time = time.time()
-    temp_dir = tempfile.mkdtemp(prefix='extract_')
+    temp_dir = tempfile.mkdtemp(prefix='extract_', dir=TEMP_ROOT)
     logger.info(f"[{request.remote_addr}] Starting extraction request. Temp dir: {temp_dir}")
     
     try:
@@ -214,37 +506,24 @@ def extract_png():
         
         # Output directory
         output_dir = os.path.join(temp_dir, 'output')
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # Callbacks
-        def log_callback(msg):
-            logger.info(f"[Decoder] {msg}")
-            
-        def progress_callback(percent, message='', file='', start_offset=0, end_offset=0):
-            logger.info(f"[Decoder Progress] {percent:.1f}% - {message}")
 
-        # Run decoding
-        logger.info("Starting decoding process...")
-        decode_png_to_folder(
-            input_png,
-            output_dir,
-            progress_callback,
-            password,
-            log_callback
-        )
-        logger.info("Decoding complete.")
-        
-        # Zip the output with optimized settings
         zip_filename = f'extracted_{int(time.time())}.zip'
         zip_path = os.path.join(temp_dir, zip_filename)
-        
-        logger.info("Creating ZIP file...")
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as zipf:
-            for root, dirs, files in os.walk(output_dir):
-                for f in files:
-                    file_path = os.path.join(root, f)
-                    arcname = os.path.relpath(file_path, output_dir)
-                    zipf.write(file_path, arcname)
+
+        with request_cancel_token() as token:
+            try:
+                # Run decoding
+                logger.info("Starting decoding process...")
+                run_decode(input_png, output_dir, password, token)
+                logger.info("Decoding complete.")
+
+                # Zip the output with optimized settings
+                logger.info("Creating ZIP file...")
+                with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as zipf:
+                    zip_folder(zipf, output_dir, token)
+            except OperationCancelled as e:
+                cleanup_temp_dir_async(temp_dir)
+                return cancelled_response(e, token)
         
         duration = time.time() - start_time
         logger.info(f"Request completed in {duration:.2f}s")
@@ -274,7 +553,7 @@ def get_info():
     """
     Get information about a PNG file
     """
-    temp_dir = tempfile.mkdtemp(prefix='info_')
+    temp_dir = tempfile.mkdtemp(prefix='info_', dir=TEMP_ROOT)
     logger.info(f"[{request.remote_addr}] Info request. Temp dir: {temp_dir}")
     
     try:
@@ -286,47 +565,583 @@ def get_info():
         temp_png = os.path.join(temp_dir, 'temp.png')
         file.save(temp_png)
         
-        from PIL import Image
-        if not API_KEY:
-            Image.MAX_IMAGE_PIXELS = 50_000_000  # Prevent image bomb attacks on unauthenticated access
-        folder_name, file_count, total_size, compression_method, password_info, metadata_channels = get_decode_info(temp_png)
-        
-        img = Image.open(temp_png)
-        img.verify()
-        with Image.open(temp_png) as img: # lets us not decode the whole fuckass image
-            width, height = img.size
+        info = png_info(temp_png)
         
         cleanup_temp_dir_async(temp_dir)
         
-        return jsonify({
-            'folder_name': folder_name,
-            'file_count': file_count,
-            'total_size': total_size,
-            'total_size_mb': round(total_size / (1024 * 1024), 2),
-            'compression_method': compression_method,
-            'password_protected': password_info == 'encrypted',
-            'image_width': width,
-            'image_height': height,
-            'metadata_channels': metadata_channels
-        })
+        return jsonify(info)
         
     except Exception as e:
         logger.error(f"Error getting info: {e}", exc_info=True)
         cleanup_temp_dir_async(temp_dir)
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/estimate', methods=['POST'])
+@limiter.limit(RATE_LIMIT)
+@require_api_key
+def estimate_compression():
+    """
+    Predict payload size, image dimensions and encode time for the uploaded
+    files without encoding them
+    """
+    temp_dir = tempfile.mkdtemp(prefix='estimate_', dir=TEMP_ROOT)
+    logger.info(f"[{request.remote_addr}] Estimate request. Temp dir: {temp_dir}")
+
+    try:
+        if 'files' not in request.files:
+            cleanup_temp_dir_async(temp_dir)
+            return jsonify({'error': 'No files provided'}), 400
+
+        compression_method = request.form.get('compression_method', 'zlib')
+        if compression_method not in ALLOWED_METHODS:
+            cleanup_temp_dir_async(temp_dir)
+            return jsonify({'error': 'invalid compression method'}), 400
+        try:
+            auto_target = read_auto_target()
+        except ValueError as e:
+            cleanup_temp_dir_async(temp_dir)
+            return jsonify({'error': str(e)}), 400
+        enable_limit = request.form.get('enable_limit', 'true').lower() == 'true'
+        password = request.form.get('password') or None
+
+        input_dir = os.path.join(temp_dir, 'input')
+        save_uploads(request.files.getlist('files'), input_dir)
+        from estimate import estimate_encode
+        est = estimate_encode(input_dir, compression_method, password, enable_max_limit=enable_limit, auto_target=auto_target,
+                              layout=ARCHIVE_LAYOUT)
+        logger.info(f"Estimate: {est['payload_size']} bytes, {est['image_width']}x{est['image_height']}, "
+                    f"{est['encode_seconds']:.1f}s, computed in {est['estimate_seconds']:.2f}s")
+
+        cleanup_temp_dir_async(temp_dir)
+        return jsonify(est)
+
+    except Exception as e:
+        logger.error(f"Error estimating: {e}", exc_info=True)
+        cleanup_temp_dir_async(temp_dir)
+        return jsonify({'error': str(e)}), 500
+
+# Same image-bomb guard as /api/info for unauthenticated access
+MAX_PIXELS = None if API_KEY else 50_000_000
+
+@app.route('/api/list', methods=['POST'])
+@limiter.limit(RATE_LIMIT)
+@require_api_key
+def list_png():
+    """
+    List the members of a PNG archive (names, sizes, CRCs, offsets) without extracting it
+    """
+    temp_dir = tempfile.mkdtemp(prefix='list_', dir=TEMP_ROOT)
+    logger.info(f"[{request.remote_addr}] List request. Temp dir: {temp_dir}")
+
+    try:
+        if 'file' not in request.files:
+            cleanup_temp_dir_async(temp_dir)
+            return jsonify({'error': 'No file provided'}), 400
+
+        temp_png = os.path.join(temp_dir, 'temp.png')
+        request.files['file'].save(temp_png)
+        password = request.form.get('password') or None
+
+        from decoder import list_members
+        listing = list_members(temp_png, password, max_pixels=MAX_PIXELS, memory_limit=MEMORY_LIMIT)
+        cleanup_temp_dir_async(temp_dir)
+        return jsonify(listing)
+
+    except Exception as e:
+        logger.error(f"Error listing members: {e}", exc_info=True)
+        cleanup_temp_dir_async(temp_dir)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/member', methods=['POST'])
+@limiter.limit(RATE_LIMIT)
+@require_api_key
+def get_member():
+    """
+    Stream back one member of a PNG archive, decompressed. Member name via ?name= or form field.
+    Only the header, the central directory and that member's bytes are decoded.
+    """
+    temp_dir = tempfile.mkdtemp(prefix='member_', dir=TEMP_ROOT)
+    name = request.args.get('name') or request.form.get('name')
+    logger.info(f"[{request.remote_addr}] Member request for '{name}'. Temp dir: {temp_dir}")
+
+    try:
+        if 'file' not in request.files:
+            cleanup_temp_dir_async(temp_dir)
+            return jsonify({'error': 'No file provided'}), 400
+        if not name:
+            cleanup_temp_dir_async(temp_dir)
+            return jsonify({'error': 'Member name required'}), 400
+
+        temp_png = os.path.join(temp_dir, 'temp.png')
+        request.files['file'].save(temp_png)
+        password = request.form.get('password') or None
+
+        from decoder import open_archive
+        zipf, _, _ = open_archive(temp_png, password, max_pixels=MAX_PIXELS, memory_limit=MEMORY_LIMIT)
+        try:
+            info = zipf.getinfo(name)
+        except KeyError:
+            zipf.close()
+            cleanup_temp_dir_async(temp_dir)
+            return jsonify({'error': f'No such member: {name}'}), 404
+        if info.is_dir():
+            zipf.close()
+            cleanup_temp_dir_async(temp_dir)
+            return jsonify({'error': f'Member is a directory: {name}'}), 400
+
+        def generate():
+            try:
+                with zipf.open(info) as member:
+                    while True:
+                        chunk = member.read(256 * 1024)
+                        if not chunk:
+                            break
+                        yield chunk
+            finally:
+                zipf.close()
+                cleanup_temp_dir_async(temp_dir)
+
+        mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        download_name = os.path.basename(name)
+        headers = {
+            'Content-Length': str(info.file_size),
+            'Content-Disposition': f'attachment; filename="{secure_filename(download_name) or "member"}"',
+            'X-Member-CRC32': f'{info.CRC:08x}',
+        }
+        return Response(generate(), mimetype=mimetype, headers=headers)
+
+    except Exception as e:
+        logger.error(f"Error reading member: {e}", exc_info=True)
+        cleanup_temp_dir_async(temp_dir)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/batch/info', methods=['POST'])
+@limiter.limit(RATE_LIMIT)
+@require_api_key
+def batch_info():
+    """
+    Get information about many PNG files in one request.
+    Streams one JSON object per line as each item finishes.
+    """
+    temp_dir = tempfile.mkdtemp(prefix='batch_info_', dir=TEMP_ROOT)
+    files = [f for f in request.files.getlist('files') if f.filename]
+    logger.info(f"[{request.remote_addr}] Batch info request for {len(files)} items. Temp dir: {temp_dir}")
+
+    if not files:
+        cleanup_temp_dir_async(temp_dir)
+        return jsonify({'error': 'No files provided'}), 400
+    if len(files) > BATCH_MAX_ITEMS:
+        cleanup_temp_dir_async(temp_dir)
+        return jsonify({'error': f'Too many items (max {BATCH_MAX_ITEMS})'}), 400
+
+    def info_item(name, png_path):
+        try:
+            return dict(png_info(png_path), name=name, status='ok')
+        except Exception as e:
+            logger.error(f"Batch info failed for {name}: {e}")
+            return {'name': name, 'status': 'error', 'error': str(e)}
+
+    futures = []
+    for i, (file, name) in enumerate(zip(files, unique_item_names(f.filename for f in files))):
+        png_path = os.path.join(temp_dir, f'{i}.png')
+        file.save(png_path)
+        futures.append(worker_pool.submit(info_item, name, png_path))
+
+    def generate():
+        try:
+            for future in as_completed(futures):
+                yield json.dumps(future.result()) + '\n'
+        finally:
+            # The client may hang up mid-stream; items that haven't started are dropped
+            for future in futures:
+                future.cancel()
+            cleanup_temp_dir_async(temp_dir)
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
+def batch_zip_response(zip_path, results, download_name, start_time):
+    """Append results.json to a batch ZIP and send it"""
+    with zipfile.ZipFile(zip_path, 'a') as zipf:
+        zipf.writestr('results.json', json.dumps({'results': results}, indent=2))
+    ok = sum(1 for r in results if r['status'] == 'ok')
+    logger.info(f"Batch completed: {ok}/{len(results)} items ok in {time.time() - start_time:.2f}s")
+    return send_file(
+        zip_path,
+        mimetype='application/zip',
+        as_attachment=True,
+        download_name=download_name
+    )
+
+@app.route('/api/batch/extract', methods=['POST'])
+@limiter.limit(RATE_LIMIT)
+@require_api_key
+def batch_extract():
+    """
+    Extract many PNGs concurrently. Returns one ZIP with each item's files
+    under <item>/ plus results.json with per-item status and timing.
+    Form data: files (PNGs), password (shared), password:<filename> (per item).
+    """
+    start_time = time.time()
+    temp_dir = tempfile.mkdtemp(prefix='batch_extract_', dir=TEMP_ROOT)
+    files = [f for f in request.files.getlist('files') if f.filename]
+    logger.info(f"[{request.remote_addr}] Batch extract request for {len(files)} items. Temp dir: {temp_dir}")
+
+    try:
+        if not files:
+            cleanup_temp_dir_async(temp_dir)
+            return jsonify({'error': 'No files provided'}), 400
+        if len(files) > BATCH_MAX_ITEMS:
+            cleanup_temp_dir_async(temp_dir)
+            return jsonify({'error': f'Too many items (max {BATCH_MAX_ITEMS})'}), 400
+
+        shared_password = request.form.get('password') or None
+        zip_filename = f'batch_extracted_{int(time.time())}.zip'
+        zip_path = os.path.join(temp_dir, zip_filename)
+
+        with request_cancel_token() as token:
+            def extract_item(index, name, password):
+                item_start = time.time()
+                input_png = os.path.join(temp_dir, f'{index}.png')
+                output_dir = os.path.join(temp_dir, f'{index}_out')
+                run_decode(input_png, output_dir, password, token, tag=f'Decoder {name}')
+                return output_dir, time.time() - item_start
+
+            futures = {}
+            names = unique_item_names(os.path.splitext(f.filename)[0] for f in files)
+            for i, (file, name) in enumerate(zip(files, names)):
+                file.save(os.path.join(temp_dir, f'{i}.png'))
+                password = request.form.get(f'password:{file.filename}') or shared_password
+                futures[worker_pool.submit(extract_item, i, name, password)] = name
+
+            results = []
+            try:
+                with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as zipf:
+                    for future in as_completed(futures):
+                        name = futures[future]
+                        try:
+                            output_dir, seconds = future.result()
+                        except OperationCancelled:
+                            raise
+                        except Exception as e:
+                            logger.error(f"Batch extract failed for {name}: {e}")
+                            results.append({'name': name, 'status': 'error', 'error': str(e)})
+                            continue
+                        zip_folder(zipf, output_dir, token, prefix=name)
+                        shutil.rmtree(output_dir, ignore_errors=True)
+                        results.append({'name': name, 'status': 'ok', 'seconds': round(seconds, 3)})
+            except OperationCancelled as e:
+                for future in futures:
+                    future.cancel()
+                cleanup_temp_dir_async(temp_dir)
+                return cancelled_response(e, token)
+
+        response = batch_zip_response(zip_path, results, zip_filename, start_time)
+        cleanup_temp_dir_async(temp_dir)
+        return response
+
+    except Exception as e:
+        logger.error(f"Error during batch extraction: {e}", exc_info=True)
+        cleanup_temp_dir_async(temp_dir)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/batch/compress', methods=['POST'])
+@limiter.limit(RATE_LIMIT)
+@require_api_key
+def batch_compress():
+    """
+    Compress many folders concurrently. Every multipart field name is one
+    item and the files sent under it become that item's folder. Returns one
+    ZIP of <item>.png images plus results.json.
+    """
+    start_time = time.time()
+    temp_dir = tempfile.mkdtemp(prefix='batch_compress_', dir=TEMP_ROOT)
+    field_names = [name for name in request.files.keys() if any(f.filename for f in request.files.getlist(name))]
+    logger.info(f"[{request.remote_addr}] Batch compress request for {len(field_names)} items. Temp dir: {temp_dir}")
+
+    try:
+        if not field_names:
+            cleanup_temp_dir_async(temp_dir)
+            return jsonify({'error': 'No files provided'}), 400
+        if len(field_names) > BATCH_MAX_ITEMS:
+            cleanup_temp_dir_async(temp_dir)
+            return jsonify({'error': f'Too many items (max {BATCH_MAX_ITEMS})'}), 400
+
+        compression_method = request.form.get('compression_method', 'zlib')
+        if compression_method not in ALLOWED_METHODS:
+            cleanup_temp_dir_async(temp_dir)
+            return jsonify({'error': 'invalid compression method'}), 400
+        try:
+            auto_target = read_auto_target()
+        except ValueError as e:
+            cleanup_temp_dir_async(temp_dir)
+            return jsonify({'error': str(e)}), 400
+        enable_limit = request.form.get('enable_limit', 'true').lower() == 'true'
+        password = request.form.get('password') or None
+
+        zip_filename = f'batch_compressed_{int(time.time())}.zip'
+        zip_path = os.path.join(temp_dir, zip_filename)
+
+        with request_cancel_token() as token:
+            def compress_item(input_dir, output_path, name):
+                item_start = time.time()
+                run_encode(input_dir, output_path, compression_method, enable_limit, password, token, tag=f'Encoder {name}', auto_target=auto_target)
+                return time.time() - item_start
+
+            futures = {}
+            for i, (field, name) in enumerate(zip(field_names, unique_item_names(field_names))):
+                input_dir = os.path.join(temp_dir, str(i), name)
+                save_uploads(request.files.getlist(field), input_dir)
+                output_path = os.path.join(temp_dir, f'{i}.png')
+                futures[worker_pool.submit(compress_item, input_dir, output_path, name)] = (name, output_path)
+
+            results = []
+            try:
+                # PNGs are already compressed, store them as-is
+                with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_STORED) as zipf:
+                    for future in as_completed(futures):
+                        name, output_path = futures[future]
+                        try:
+                            seconds = future.result()
+                        except OperationCancelled:
+                            raise
+                        except Exception as e:
+                            logger.error(f"Batch compress failed for {name}: {e}")
+                            results.append({'name': name, 'status': 'error', 'error': 'compression failed'})
+                            continue
+                        zipf.write(output_path, f'{name}.png')
+                        results.append({
+                            'name': name,
+                            'status': 'ok',
+                            'seconds': round(seconds, 3),
+                            'size': os.path.getsize(output_path)
+                        })
+                        os.remove(output_path)
+            except OperationCancelled as e:
+                for future in futures:
+                    future.cancel()
+                cleanup_temp_dir_async(temp_dir)
+                return cancelled_response(e, token)
+
+        response = batch_zip_response(zip_path, results, zip_filename, start_time)
+        cleanup_temp_dir_async(temp_dir)
+        return response
+
+    except Exception as e:
+        logger.error(f"Error during batch compression: {e}", exc_info=True)
+        cleanup_temp_dir_async(temp_dir)
+        return jsonify({'error': 'Internal Server Error'}), 500
+
+def upload_error_response(e):
+    body = {'error': str(e)}
+    headers = {}
+    if e.offset is not None:
+        body['offset'] = e.offset
+        headers['Upload-Offset'] = str(e.offset)
+    return jsonify(body), e.status, headers
+
+def check_unpack_limits(count, size):
+    """UploadError 413 if an archive has more than UNPACK_MAX_FILES members or UNPACK_MAX_BYTES of data"""
+    if UNPACK_MAX_FILES and count > UNPACK_MAX_FILES:
+        raise UploadError(f"Archive has more than {UNPACK_MAX_FILES} members", 413)
+    if UNPACK_MAX_BYTES and size > UNPACK_MAX_BYTES:
+        raise UploadError(f"Archive unpacks to more than {UNPACK_MAX_BYTES} bytes", 413)
+
+def unpack_upload(path, filename, input_dir, unpack=True):
+    """
+    Turn a finalized compress upload into a folder: a zip/tar is unpacked, anything else is one file.
+    Archives over the unpack limits are refused from their member list, and extraction stops if the
+    bytes actually written pass them.
+    """
+    os.makedirs(input_dir, exist_ok=True)
+    if unpack and zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zf:
+            infos = zf.infolist()
+            check_unpack_limits(len(infos), sum(info.file_size for info in infos))
+            written = 0
+            for count, info in enumerate(infos, 1):
+                target = zf.extract(info, input_dir)  # extract() strips absolute paths and '..'
+                if not info.is_dir():
+                    written += os.path.getsize(target)
+                check_unpack_limits(count, written)
+    elif unpack and tarfile.is_tarfile(path):
+        with tarfile.open(path) as tf:
+            members = tf.getmembers()
+            if not hasattr(tarfile, 'data_filter'):
+                root = os.path.realpath(input_dir)
+                members = [m for m in members if (m.isfile() or m.isdir())
+                           and os.path.realpath(os.path.join(input_dir, m.name)).startswith(root + os.sep)]
+            check_unpack_limits(len(members), sum(m.size for m in members if m.isfile()))
+            written = 0
+            for count, member in enumerate(members, 1):
+                if hasattr(tarfile, 'data_filter'):
+                    tf.extract(member, input_dir, filter='data')
+                else:
+                    tf.extract(member, input_dir)
+                if member.isfile():
+                    written += member.size
+                check_unpack_limits(count, written)
+    else:
+        name = secure_filename(filename or '') or 'upload.bin'
+        os.replace(path, os.path.join(input_dir, name))
+
+@app.route('/api/uploads', methods=['POST'])
+@limiter.limit(RATE_LIMIT)
+@require_api_key
+def create_upload():
+    """
+    Start a resumable upload. Form/JSON: kind (compress|extract), filename, size (optional total bytes)
+    """
+    params = request.get_json(silent=True) or request.form
+    kind = params.get('kind', 'extract')
+    if kind not in ('compress', 'extract'):
+        return jsonify({'error': 'kind must be compress or extract'}), 400
+    size = params.get('size')
+    try:
+        size = int(size) if size not in (None, '') else None
+        upload = upload_store.create(kind, params.get('filename', ''), size, owner=request.remote_addr)
+    except ValueError:
+        return jsonify({'error': 'invalid size'}), 400
+    except UploadError as e:
+        return upload_error_response(e)
+    logger.info(f"[{request.remote_addr}] Created {kind} upload {upload.id} (size: {size})")
+    return jsonify(upload.status()), 201, {'Location': f'/api/uploads/{upload.id}', 'Upload-Offset': '0'}
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT', 'PATCH'])
+@require_api_key
+def put_upload_chunk(upload_id):
+    """
+    Append a chunk at the committed offset. Offset via Upload-Offset header or ?offset=
+    """
+    offset = request.headers.get('Upload-Offset', request.args.get('offset'))
+    try:
+        offset = int(offset)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Upload-Offset header or offset parameter required'}), 400
+    try:
+        upload = upload_store.write_chunk(upload_id, offset, request.stream)
+    except UploadError as e:
+        return upload_error_response(e)
+    logger.debug(f"Upload {upload_id}: committed {upload.offset} bytes")
+    return jsonify(upload.status()), 200, {'Upload-Offset': str(upload.offset)}
+
+@app.route('/api/uploads/<upload_id>', methods=['GET', 'HEAD'])
+@require_api_key
+def get_upload_status(upload_id):
+    """Committed offset and running SHA-256 of an upload"""
+    try:
+        upload = upload_store.get(upload_id)
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify(upload.status()), 200, {'Upload-Offset': str(upload.offset)}
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+@require_api_key
+def delete_upload(upload_id):
+    """Abort an upload and delete its spool file"""
+    try:
+        upload_store.discard(upload_id)
+    except UploadError as e:
+        return upload_error_response(e)
+    return jsonify({'status': 'deleted'})
+
+@app.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+@limiter.limit(RATE_LIMIT)
+@require_api_key
+def finalize_upload(upload_id):
+    """
+    Seal an upload and run its job. Takes the same form fields as /api/compress
+    or /api/extract, plus an optional sha256 to verify against.
+    """
+    start_time = time.time()
+    try:
+        upload = upload_store.get(upload_id)
+    except UploadError as e:
+        return upload_error_response(e)
+    if not upload.complete:
+        return jsonify({'error': f'Upload incomplete: {upload.offset}/{upload.size} bytes', 'offset': upload.offset}), 409
+    expected_sha256 = request.form.get('sha256')
+    if expected_sha256 and not hmac.compare_digest(expected_sha256.lower(), upload.sha256):
+        return jsonify({'error': 'sha256 mismatch', 'sha256': upload.sha256}), 422
+    compression_method = request.form.get('compression_method', 'zlib')
+    if upload.kind == 'compress' and compression_method not in ALLOWED_METHODS:
+        return jsonify({'error': 'invalid compression method'}), 400
+    try:
+        auto_target = read_auto_target()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        # Refused while a chunk is still being written, or if data arrived since the checks above
+        upload = upload_store.pop(upload_id, upload.offset)
+    except UploadError as e:
+        return upload_error_response(e)
+    temp_dir = tempfile.mkdtemp(prefix=f'{upload.kind}_', dir=TEMP_ROOT)
+    logger.info(f"[{request.remote_addr}] Finalizing {upload.kind} upload {upload.id} ({upload.offset} bytes). Temp dir: {temp_dir}")
+    password = request.form.get('password') or None
+
+    try:
+        with request_cancel_token() as token:
+            try:
+                if upload.kind == 'compress':
+                    input_dir = os.path.join(temp_dir, 'input')
+                    unpack = request.form.get('unpack', 'true').lower() == 'true'
+                    unpack_upload(upload.path, upload.filename, input_dir, unpack)
+                    enable_limit = request.form.get('enable_limit', 'true').lower() == 'true'
+                    output_filename = f'compressed_{int(time.time())}.png'
+                    output_path = os.path.join(temp_dir, output_filename)
+                    run_encode(input_dir, output_path, compression_method, enable_limit, password, token, auto_target=auto_target)
+                    mimetype = 'image/png'
+                else:
+                    input_png = os.path.join(temp_dir, 'input.png')
+                    os.replace(upload.path, input_png)
+                    output_dir = os.path.join(temp_dir, 'output')
+                    run_decode(input_png, output_dir, password, token)
+                    output_filename = f'extracted_{int(time.time())}.zip'
+                    output_path = os.path.join(temp_dir, output_filename)
+                    with zipfile.ZipFile(output_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=6) as zipf:
+                        zip_folder(zipf, output_dir, token)
+                    mimetype = 'application/zip'
+            except OperationCancelled as e:
+                cleanup_temp_dir_async(temp_dir)
+                return cancelled_response(e, token)
+
+        logger.info(f"Upload {upload.id} job completed in {time.time() - start_time:.2f}s")
+        response = send_file(
+            output_path,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=output_filename
+        )
+        cleanup_temp_dir_async(temp_dir)
+        return response
+
+    except UploadError as e:
+        logger.warning(f"Refused upload {upload.id}: {e}")
+        cleanup_temp_dir_async(temp_dir)
+        return upload_error_response(e)
+    except Exception as e:
+        logger.error(f"Error finalizing upload {upload.id}: {e}", exc_info=True)
+        cleanup_temp_dir_async(temp_dir)
+        if upload.kind == 'compress':
+            return jsonify({'error': 'Internal Server Error'}), 500
+        return jsonify({'error': str(e)}), 500
+    finally:
+        upload_store.release(upload)
+
+COMPRESSION_METHODS = [
+    {'value': 'zlib', 'name': 'ZLIB (Fast compression)', 'recommended': True},
+    {'value': 'lzma', 'name': 'LZMA (Best compression)'},
+    {'value': 'bz2', 'name': 'BZIP2 (Good compression)'},
+    {'value': 'zip_lzma', 'name': 'ZIP-LZMA (Compatible)'},
+    {'value': 'zip_bz2', 'name': 'ZIP-BZIP2 (Compatible)'},
+    {'value': 'auto', 'name': 'AUTO (Sampled per upload, see auto_target)'}
+]
+
 @app.route('/api/methods', methods=['GET'])
 @limiter.limit(RATE_LIMIT)
 def get_compression_methods():
     """Get available compression methods"""
-    methods = [
-        {'value': 'zlib', 'name': 'ZLIB (Fast compression)', 'recommended': True},
-        {'value': 'lzma', 'name': 'LZMA (Best compression)'},
-        {'value': 'bz2', 'name': 'BZIP2 (Good compression)'},
-        {'value': 'zip_lzma', 'name': 'ZIP-LZMA (Compatible)'},
-        {'value': 'zip_bz2', 'name': 'ZIP-BZIP2 (Compatible)'}
-    ]
-    return jsonify({'methods': methods})
+    return jsonify({'methods': COMPRESSION_METHODS})
 
 @app.route('/', methods=['GET'])
 def index():
@@ -358,6 +1173,38 @@ def index():
         <p>Get information about a PNG file.</p>
         <p><em>Headers:</em> X-API-Key (if authentication enabled)</p>
         
+        <h3>POST /api/estimate</h3>
+        <p>Predict payload size, image dimensions and encode time for <code>files</code> without encoding them. Same fields as /api/compress.</p>
+        <p><em>Headers:</em> X-API-Key (if authentication enabled)</p>
+
+        <h3>POST /api/list</h3>
+        <p>List the members of a PNG archive (names, sizes, CRCs, offsets) without extracting it.</p>
+        <p><em>Headers:</em> X-API-Key (if authentication enabled)</p>
+
+        <h3>POST /api/member?name=...</h3>
+        <p>Stream back a single member of a PNG archive.</p>
+        <p><em>Headers:</em> X-API-Key (if authentication enabled)</p>
+
+        <h3>POST /api/batch/info</h3>
+        <p>Info for many PNG files (field <code>files</code>). Streams one JSON object per line.</p>
+        <p><em>Headers:</em> X-API-Key (if authentication enabled)</p>
+
+        <h3>POST /api/batch/extract</h3>
+        <p>Extract many PNGs (field <code>files</code>) concurrently. Returns one ZIP with a folder per item and <code>results.json</code>.</p>
+        <p><em>Headers:</em> X-API-Key (if authentication enabled)</p>
+
+        <h3>POST /api/batch/compress</h3>
+        <p>Compress many folders concurrently; each form field name is one folder. Returns one ZIP of PNGs and <code>results.json</code>.</p>
+        <p><em>Headers:</em> X-API-Key (if authentication enabled)</p>
+
+        <h3>POST /api/uploads, PUT /api/uploads/&lt;id&gt;, POST /api/uploads/&lt;id&gt;/finalize</h3>
+        <p>Resumable uploads for large inputs: create an upload, PUT chunks with an <code>Upload-Offset</code> header,
+        GET the upload to see the committed offset, then finalize it into a compress or extract job.</p>
+        <p><em>Headers:</em> X-API-Key (if authentication enabled)</p>
+
+        <h3>GET /metrics</h3>
+        <p>Prometheus metrics: request latency, bytes in/out, in-flight requests, per-phase encode/decode timings, temp disk usage.</p>
+
         <h3>GET /api/methods</h3>
         <p>Get available compression methods.</p>
         
@@ -372,11 +1219,20 @@ def index():
     </html>
     """
 
+def preload_codecs():
+    """Import the codec modules in the background, so startup doesn't wait for them and the first request rarely does."""
+    def load():
+        import encoder, decoder, estimate  # noqa: F401
+    threading.Thread(target=load, daemon=True, name='preload').start()
+
 if __name__ == '__main__':
-    print("Starting File Compressor API on http://0.0.0.0:4362")
+    preload_codecs()
+    print(f"Starting File Compressor API on http://0.0.0.0:{PORT}")
     if API_KEY:
         print("✓ API authentication enabled")
     else:
         print("⚠ WARNING: No API_KEY environment variable set - server is UNPROTECTED!")
         print("  Set API_KEY environment variable to enable authentication")
-    app.run(host='0.0.0.0', port=4362, debug=False, threaded=True)
+    # Exit normally on SIGTERM so atexit removes TEMP_ROOT
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    app.run(host='0.0.0.0', port=PORT, debug=False, threaded=True)
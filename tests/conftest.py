@@ -0,0 +1,13 @@
+import os
+import sys
+import atexit
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing server opens server.log in the cwd and sweeps UPLOAD_DIR; keep both out of the repo
+_scratch = tempfile.mkdtemp(prefix='imgfile_tests_')
+atexit.register(shutil.rmtree, _scratch, True)
+os.environ['UPLOAD_DIR'] = os.path.join(_scratch, 'uploads')
+os.chdir(_scratch)
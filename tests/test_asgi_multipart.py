@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import asyncio
+
+import pytest
+
+import asgi_server
+from asgi_server import HTTPError, MultipartParser, Request
+
+BOUNDARY = b'----imgfileBoundary7MA4YWxk'
+
+
+def multipart(*parts, close=True):
+    """Body for parts [(name, filename or None, data)]."""
+    body = b''
+    for name, filename, data in parts:
+        disposition = f'form-data; name="{name}"' + (f'; filename="{filename}"' if filename else '')
+        body += b'--' + BOUNDARY + b'\r\nContent-Disposition: ' + disposition.encode() + b'\r\n\r\n' + data + b'\r\n'
+    return body + (b'--' + BOUNDARY + b'--\r\n' if close else b'')
+
+
+def parse(body, size):
+    """Feed body in size-byte pieces; events with adjacent data merged."""
+    parser = MultipartParser(BOUNDARY)
+    events = []
+    for start in range(0, len(body), size):
+        for event in parser.feed(body[start:start + size]):
+            if event[0] == 'data' and events and events[-1][0] == 'data':
+                events[-1] = ('data', events[-1][1] + event[1])
+            else:
+                events.append(event)
+    return events, parser.done
+
+
+def expected(*parts):
+    events = []
+    for name, filename, data in parts:
+        events.append(('part', name, filename))
+        if data:
+            events.append(('data', data))
+        events.append(('end',))
+    return events
+
+
+# Bytes that look like the start of a delimiter without being one (a line
+# starting with the whole boundary may not appear in a part, RFC 2046 5.1.1)
+TRICKY = b'a\r\nb\r\n--' + BOUNDARY[:-1] + b'X\r\n--' + BOUNDARY[:5] + b'\r\n\r\n--\r\n-'
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, len(BOUNDARY) - 1, len(BOUNDARY), len(BOUNDARY) + 5, 64, 1 << 20])
+def test_pieces_of_any_size(size):
+    parts = [('method', None, b'zlib'), ('files', 'a.png', TRICKY * 3), ('files', 'empty.png', b'')]
+    assert parse(multipart(*parts), size) == (expected(*parts), True)
+
+
+def test_boundary_split_at_every_offset():
+    parts = [('files', 'a.png', b'0123456789' + TRICKY), ('note', None, b'x')]
+    body = multipart(*parts)
+    for cut in range(1, len(body)):
+        assert parse(body, cut) == (expected(*parts), True), cut
+
+
+def test_data_that_ends_like_a_delimiter():
+    data = b'payload\r\n--' + BOUNDARY[:10]
+    assert parse(multipart(('files', 'a.png', data)), 5) == (expected(('files', 'a.png', data)), True)
+
+
+def test_preamble_and_epilogue_are_ignored():
+    body = b'preamble\r\n' + multipart(('a', None, b'1')) + b'epilogue'
+    assert parse(body, 4) == (expected(('a', None, b'1')), True)
+
+
+def test_missing_closing_delimiter():
+    body = multipart(('files', 'a.png', b'data'), close=False)
+    events, done = parse(body, 3)
+    assert not done
+    # The tail could still turn out to be a delimiter, so the part never ends
+    assert events == [('part', 'files', 'a.png')]
+
+
+def test_oversized_part_headers():
+    parser = MultipartParser(BOUNDARY)
+    parser.feed(b'--' + BOUNDARY + b'\r\n')
+    with pytest.raises(HTTPError) as e:
+        for _ in range(asgi_server.max_header_size // 1024 + 2):
+            parser.feed(b'X-Filler: ' + b'a' * 1014 + b'\r\n')
+    assert e.value.status == 400
+
+
+def receiver(body, size, hang_up=False):
+    """ASGI receive() that delivers body in size-byte pieces, then waits like an idle client (or hangs up)."""
+    pieces = [body[i:i + size] for i in range(0, len(body), size)] or [b'']
+
+    async def receive():
+        if not pieces:
+            if hang_up:
+                return {'type': 'http.disconnect'}
+            await asyncio.Event().wait()
+        data = pieces.pop(0)
+        return {'type': 'http.request', 'body': data, 'more_body': bool(pieces)}
+    return receive
+
+
+def scope(method, path, headers=()):
+    return {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'client': ('127.0.0.1', 1),
+            'headers': list(headers)}
+
+
+def request_for(body, size):
+    return Request(scope('POST', '/api/compress', [(b'content-type', b'multipart/form-data; boundary=' + BOUNDARY),
+                                                   (b'content-length', str(len(body)).encode())]),
+                   receiver(body, size))
+
+
+async def call(method, path, body=b'', size=4096, headers=(), hang_up=False):
+    """Run one request through the ASGI app; returns (status, headers, body)."""
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+    headers = [(b'content-length', str(len(body)).encode())] + list(headers)
+    await asgi_server.app(scope(method, path, headers), receiver(body, size, hang_up), send)
+    return (sent[0]['status'], dict((k.decode(), v.decode()) for k, v in sent[0]['headers']),
+            b''.join(m.get('body', b'') for m in sent[1:]))
+
+
+def test_form_streams_files_to_disk(tmp_path):
+    big = os.urandom(asgi_server.spool_size) + TRICKY + os.urandom(1000)
+    parts = [('compression_method', None, b'zlib'), ('files', 'big.bin', big), ('files', 'small.bin', TRICKY)]
+    request = request_for(multipart(*parts), 8191)
+    form = asyncio.run(request.form(str(tmp_path)))
+    assert form.get('compression_method') == 'zlib'
+    assert [f.filename for f in form.files['files']] == ['big.bin', 'small.bin']
+    for uploaded, data in zip(form.files['files'], (big, TRICKY)):
+        assert os.path.dirname(uploaded.path) == str(tmp_path)
+        with open(uploaded.path, 'rb') as f:
+            assert f.read() == data
+
+
+def test_form_rejects_unterminated_body(tmp_path):
+    request = request_for(multipart(('files', 'a.bin', b'data'), close=False), 10)
+    with pytest.raises(HTTPError) as e:
+        asyncio.run(request.form(str(tmp_path)))
+    assert e.value.status == 400
+
+
+def test_form_rejects_oversized_headers(tmp_path):
+    body = b'--' + BOUNDARY + b'\r\n' + b'X-Filler: ' + b'a' * (asgi_server.max_header_size + 1) + b'\r\n\r\ndata'
+    request = request_for(body, 4096)
+    with pytest.raises(HTTPError) as e:
+        asyncio.run(request.form(str(tmp_path)))
+    assert e.value.status == 400
+
+
+def test_resumable_upload_streams_in_pieces():
+    data = os.urandom(2 * asgi_server.spool_size + 12345)
+
+    async def run():
+        form = multipart(('kind', None, b'compress'), ('filename', None, b'data.bin'), ('size', None, str(len(data)).encode()))
+        status, _, body = await call('POST', '/api/uploads', form, 7,
+                                     [(b'content-type', b'multipart/form-data; boundary=' + BOUNDARY)])
+        assert status == 201, body
+        upload_id = json.loads(body)['upload_id']
+        status, headers, body = await call('PUT', f'/api/uploads/{upload_id}', data, 65536, [(b'upload-offset', b'0')])
+        assert status == 200, body
+        assert headers['upload-offset'] == str(len(data))
+        with open(asgi_server.upload_store.get(upload_id).path, 'rb') as f:
+            assert f.read() == data
+        status, _, _ = await call('DELETE', f'/api/uploads/{upload_id}')
+        assert status == 200
+    asyncio.run(run())
+
+
+def test_batch_info_cancels_queued_items_on_disconnect(monkeypatch):
+    started = []
+
+    def slow_item(name, png_path):
+        started.append(name)
+        time.sleep(0.05)
+        return {'name': name, 'status': 'ok'}
+    monkeypatch.setattr(asgi_server, 'batch_info_item', slow_item)
+    count = 20
+    form = multipart(*[('files', f'{i}.png', b'png') for i in range(count)])
+
+    async def run():
+        status, _, body = await call('POST', '/api/batch/info', form, 4096,
+                                     [(b'content-type', b'multipart/form-data; boundary=' + BOUNDARY)], hang_up=True)
+        assert status == 200
+        assert len(body.splitlines()) < count
+        await asyncio.sleep(count * 0.05)
+    asyncio.run(run())
+    assert len(started) <= 2 * asgi_server.server.WORKERS
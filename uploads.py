@@ -0,0 +1,200 @@
+import os
+import time
+import uuid
+import hashlib
+import threading
+
+
+class UploadError(Exception):
+    """Upload protocol violation (unknown id, wrong offset, size exceeded)."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class Upload:
+    """
+    One resumable upload, spooled to a local file. The SHA-256 is updated as
+    chunks are committed so finalizing never has to re-read the data.
+    """
+
+    def __init__(self, upload_id, path, kind, filename, size=None, owner=None):
+        self.id = upload_id
+        self.path = path
+        self.kind = kind
+        self.filename = filename
+        self.size = size
+        self.owner = owner
+        self.closed = False
+        self.offset = 0
+        self.created = time.time()
+        self.updated = self.created
+        self.lock = threading.Lock()
+        self._sha256 = hashlib.sha256()
+
+    @property
+    def sha256(self):
+        return self._sha256.hexdigest()
+
+    @property
+    def complete(self):
+        return self.size is None or self.offset == self.size
+
+    def status(self):
+        return {
+            'upload_id': self.id,
+            'kind': self.kind,
+            'filename': self.filename,
+            'offset': self.offset,
+            'size': self.size,
+            'sha256': self.sha256,
+        }
+
+
+class UploadStore:
+    """
+    In-memory registry of resumable uploads with their spool files on disk.
+    Spool files it doesn't know about, left by an earlier process, are
+    deleted by expire(). max_per_owner caps the open uploads of one owner
+    (e.g. a client address).
+    """
+
+    def __init__(self, directory, max_size=None, ttl=24 * 3600, chunk_size=1024 * 1024, max_per_owner=None):
+        self.directory = directory
+        self.max_size = max_size
+        self.ttl = ttl
+        self.chunk_size = chunk_size
+        self.max_per_owner = max_per_owner
+        self._uploads = {}
+        # Popped uploads whose spool file a job is still using
+        self._claimed = set()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def create(self, kind, filename, size=None, owner=None):
+        if size is not None and self.max_size and size > self.max_size:
+            raise UploadError(f"Upload size exceeds maximum of {self.max_size} bytes", 413)
+        self.expire()
+        upload_id = uuid.uuid4().hex
+        path = os.path.join(self.directory, upload_id + '.part')
+        upload = Upload(upload_id, path, kind, filename, size, owner)
+        with self._lock:
+            if self.max_per_owner and owner is not None and \
+                    sum(1 for u in self._uploads.values() if u.owner == owner) >= self.max_per_owner:
+                raise UploadError(f"Too many open uploads (max {self.max_per_owner}); finalize or delete one first", 429)
+            # Created under the lock, so expire() never sees the file unregistered
+            open(path, 'wb').close()
+            self._uploads[upload_id] = upload
+        return upload
+
+    def get(self, upload_id):
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+        if upload is None:
+            raise UploadError("Unknown upload id", 404)
+        return upload
+
+    def write_chunk(self, upload_id, offset, stream):
+        """
+        Append a chunk read from stream at offset. Only the committed offset is
+        accepted; anything else is rejected with the offset to resume from.
+        """
+        upload = self.get(upload_id)
+        if not upload.lock.acquire(blocking=False):
+            raise UploadError("Another chunk for this upload is in progress", 409, upload.offset)
+        try:
+            if upload.closed:
+                raise UploadError("Unknown upload id", 404)
+            if offset != upload.offset:
+                raise UploadError(f"Offset mismatch: expected {upload.offset}", 409, upload.offset)
+            limit = upload.size if upload.size is not None else self.max_size
+            written = 0
+            with open(upload.path, 'r+b') as f:
+                f.seek(offset)
+                try:
+                    while True:
+                        chunk = stream.read(self.chunk_size)
+                        if not chunk:
+                            break
+                        if limit and offset + written + len(chunk) > limit:
+                            raise UploadError(f"Chunk runs past the upload size of {limit} bytes", 413, upload.offset)
+                        f.write(chunk)
+                        upload._sha256.update(chunk)
+                        written += len(chunk)
+                finally:
+                    # Commit whatever arrived intact so a dropped connection can resume from it
+                    f.truncate(offset + written)
+                    upload.offset = offset + written
+                    upload.updated = time.time()
+            return upload
+        finally:
+            upload.lock.release()
+
+    def pop(self, upload_id, offset=None):
+        """
+        Remove the upload from the registry and hand its spool file to the
+        caller, who calls release() when done with it. Refused (409) while a
+        chunk is being written, or if offset is given and more data has been
+        committed since. Later chunks get 404.
+        """
+        upload = self.get(upload_id)
+        if not upload.lock.acquire(blocking=False):
+            raise UploadError("A chunk for this upload is still being written", 409, upload.offset)
+        try:
+            if offset is not None and upload.offset != offset:
+                raise UploadError(f"Upload changed while finalizing: now {upload.offset} bytes", 409, upload.offset)
+            with self._lock:
+                if self._uploads.pop(upload_id, None) is None:
+                    raise UploadError("Unknown upload id", 404)
+                self._claimed.add(upload_id)
+            upload.closed = True
+        finally:
+            upload.lock.release()
+        return upload
+
+    def release(self, upload):
+        """Delete a popped upload's spool file (if the job didn't move it away)."""
+        try:
+            os.remove(upload.path)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self._claimed.discard(upload.id)
+
+    def discard(self, upload_id):
+        self.release(self.pop(upload_id))
+
+    def expire(self):
+        """Drop uploads that have not been touched within the TTL, and spool files no upload owns."""
+        cutoff = time.time() - self.ttl
+        names = [name for name in os.listdir(self.directory) if name.endswith('.part')]
+        with self._lock:
+            # An upload with a chunk in progress isn't idle, whatever its timestamp
+            stale = [u for u in self._uploads.values() if u.updated < cutoff and u.lock.acquire(blocking=False)]
+            for u in stale:
+                del self._uploads[u.id]
+                u.closed = True
+                u.lock.release()
+            orphans = [name for name in names
+                       if name[:-len('.part')] not in self._uploads and name[:-len('.part')] not in self._claimed]
+        for path in [u.path for u in stale] + [os.path.join(self.directory, name) for name in orphans]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def start_expiry(self, interval=300):
+        """Run expire() now and then every interval seconds on a daemon thread."""
+        self.expire()
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.expire()
+                except OSError:
+                    pass
+
+        threading.Thread(target=run, daemon=True, name='upload-expiry').start()
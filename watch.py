@@ -0,0 +1,207 @@
+import os
+import sys
+import time
+import errno
+import ctypes
+import ctypes.util
+import select
+import struct
+from cancellation import OperationCancelled, check_cancelled
+from readahead import scan_tree
+from pipeline import MemberCache
+
+# Seconds to wait between checks for a cancel while nothing changes
+idle_wait = 0.5
+# A folder that never stops changing is still encoded this often
+max_delay = 10.0
+
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_MOVE_SELF = 0x800
+IN_Q_OVERFLOW = 0x4000
+IN_ONLYDIR = 0x1000000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def tree_state(folder_path):
+    """{arcname: (size, mtime_ns, mode)} for every file the encoder would store."""
+    return {arcname: (st.st_size, st.st_mtime_ns, st.st_mode) for _, arcname, st in scan_tree(folder_path)}
+
+
+class InotifyWatcher:
+    """
+    Change notification for a whole tree through Linux inotify (via ctypes,
+    so there is nothing to install). Directories created or moved in later
+    are watched as they appear. Blocks in select() while idle.
+    """
+
+    def __init__(self, folder_path):
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self._fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._paths = {}
+        try:
+            self._add_tree(folder_path)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_tree(self, top):
+        for path, _, _ in os.walk(top):
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err in (errno.ENOENT, errno.ENOTDIR):
+                    continue  # gone again before it could be watched
+                raise OSError(err, f"Cannot watch {path}: {os.strerror(err)}")
+            self._paths[wd] = path
+
+    def wait(self, timeout):
+        """True if anything in the tree changed within timeout seconds."""
+        if not select.select([self._fd], [], [], timeout)[0]:
+            return False
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return True
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = EVENT_HEADER.unpack_from(data, offset)
+                name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+                offset += EVENT_HEADER.size + length
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO) and wd in self._paths:
+                    self._add_tree(os.path.join(self._paths[wd], os.fsdecode(name)))
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollWatcher:
+    """Fallback change detection: rescans the tree's sizes and mtimes every interval seconds."""
+
+    def __init__(self, folder_path, interval=1.0):
+        self._folder_path = folder_path
+        self._interval = interval
+        self._state = tree_state(folder_path)
+        self._next_scan = time.monotonic() + interval
+
+    def wait(self, timeout):
+        """True if anything in the tree changed within timeout seconds (as seen by the scans)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            if now >= self._next_scan:
+                self._next_scan = now + self._interval
+                state = tree_state(self._folder_path)
+                if state != self._state:
+                    self._state = state
+                    return True
+            if now >= deadline:
+                return False
+            time.sleep(max(0.0, min(self._next_scan, deadline) - now))
+
+    def close(self):
+        pass
+
+
+def open_watcher(folder_path, poll_interval=None):
+    """InotifyWatcher where available, else (or when poll_interval is given) a PollWatcher. Returns (watcher, kind)."""
+    if poll_interval is None and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(folder_path), 'inotify'
+        except (OSError, AttributeError):
+            pass  # no inotify, or the watch limit was hit
+    return PollWatcher(folder_path, poll_interval or 1.0), 'polling'
+
+
+def replace_output(output_png, write):
+    """Call write(path) on a temporary file next to output_png, then move it over output_png in one step."""
+    directory, name = os.path.split(os.path.abspath(output_png))
+    # Same directory, so the rename can't cross filesystems
+    temp_path = os.path.join(directory, f'.{name}.{os.getpid()}.tmp')
+    try:
+        write(temp_path)
+        os.replace(temp_path, output_png)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def watch_folder(folder_path, output_png, compression_method='lzma', password=None, enable_max_limit=True,
+                 compression_level=None, debounce=0.5, poll_interval=None, cancel_token=None, on_update=None,
+                 on_error=None, on_start=None):
+    """
+    Keep output_png in sync with folder_path until cancel_token fires (then
+    OperationCancelled is raised). Waits for a change, then for debounce
+    seconds without one (at most max_delay), and re-encodes. Compressed
+    members are kept between encodes, so only files whose size, mtime or
+    mode changed are compressed again. Each new image replaces output_png
+    atomically.
+
+    on_start(watcher_kind), on_update(info) and on_error(exception) report
+    progress; info has changed, removed, files and seconds. A failed encode
+    leaves the old image in place and is retried after the next change.
+    """
+    from encoder import encode_folder_to_png
+    if not os.path.isdir(folder_path):
+        raise NotADirectoryError(f"Path is not a directory: {folder_path}")
+    folder = os.path.join(os.path.realpath(folder_path), '')
+    if os.path.realpath(output_png).startswith(folder):
+        raise ValueError("The output image can't be inside the watched folder")
+
+    cache = MemberCache()
+    watcher, kind = open_watcher(folder_path, poll_interval)
+    if on_start:
+        on_start(kind)
+    try:
+        state = None
+        while True:
+            check_cancelled(cancel_token)
+            current = tree_state(folder_path)
+            if current != state:
+                previous = state or {}
+                started = time.perf_counter()
+                try:
+                    replace_output(output_png, lambda path: encode_folder_to_png(
+                        folder_path, path, compression_method, enable_max_limit=enable_max_limit,
+                        password=password, log_callback=lambda msg: None, cancel_token=cancel_token,
+                        compression_level=compression_level, member_cache=cache))
+                except OperationCancelled:
+                    raise
+                except Exception as e:
+                    state = None
+                    if on_error:
+                        on_error(e)
+                else:
+                    state = current
+                    if on_update:
+                        on_update({
+                            'changed': sum(1 for name, sig in current.items() if previous.get(name) != sig),
+                            'removed': sum(1 for name in previous if name not in current),
+                            'files': len(current),
+                            'seconds': time.perf_counter() - started,
+                        })
+            while not watcher.wait(idle_wait):
+                check_cancelled(cancel_token)
+            # Let a burst of changes settle before encoding
+            settle_until = time.monotonic() + max_delay
+            while time.monotonic() < settle_until and watcher.wait(debounce):
+                check_cancelled(cancel_token)
+    finally:
+        watcher.close()